@@ -0,0 +1,386 @@
+"""--------------------------------------------------------
+    Order batching into pick waves.
+    The orders of a wave are grouped into batches of at most K orders, one cart and one tour per batch,
+    so that the total walking of the wave is as short as possible:
+    - fcfs: the orders are batched in the order they arrive, the baseline.
+    - seed: a seed order (the one reaching farthest from the depot) opens a batch, then the order whose picks
+      are nearest to the picks of the batch joins it, until the cart is full. The distances are the BFS
+      distances between the pick cells, computed once with the wavefront.
+    - savings: the Clarke and Wright savings of putting two orders in one tour instead of two,
+      from an S-shape estimate of the tour over the aisles the orders visit. The pairs are merged from the
+      largest saving down while the carts have room.
+    The pairwise work is done on arrays: the distances between the pick cells come from wavefronts run
+    64 stops at a time (see wavefront.pairwise_distances), the aisles of each order form a boolean incidence
+    matrix, the aisles two orders share is a matrix product, and the savings are computed by blocks of rows,
+    keeping the best pairs of each order only, so 10k orders fit in memory.
+    Both heuristics run under a time budget, the orders left when it runs out are batched in arrival order.
+    --------------------------------------------------------"""
+
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+
+from order_routing import AisleLayout
+from stream import resolve_orders, route_orders
+from wavefront import UNREACHABLE, pairwise_distances
+
+# The rows of the savings matrix computed at once
+BLOCK_ROWS = 512
+
+
+class OrderSet:
+    """
+    A class to represent the picks of many orders as arrays: each order is a row of the stop indices
+    of its pick cells (padded), and a row of the aisles it visits.
+    """
+
+    def __init__(self, layout, orders, depot):
+        """
+        :param layout: The AisleLayout of the map
+        :param orders: A list of orders, each a list of (x, y) shelf positions
+        :param depot: The (x, y) position the tours start and end at
+        """
+
+        self.layout = layout
+        self.depot = depot
+        self.stops = [depot]
+        stop_index = {depot: 0}
+        aisle_index = {aisle: index for index, aisle in enumerate(layout.aisles)}
+        rows = []
+        self.aisles = np.zeros((len(orders), len(layout.aisles)), dtype=bool)
+        for row, positions in enumerate(orders):
+            indices = []
+            for pos in positions:
+                (aisle, _), stop = layout.locate(pos)
+                if stop not in stop_index:
+                    stop_index[stop] = len(self.stops)
+                    self.stops.append(stop)
+                if stop_index[stop] not in indices:
+                    indices.append(stop_index[stop])
+                self.aisles[row, aisle_index[aisle]] = True
+            rows.append(indices)
+
+        # The padding points to an extra stop, at distance 0 of everything
+        self.counts = np.array([len(indices) for indices in rows], dtype=np.int32)
+        self.padded = np.full((len(orders), max(self.counts, default=0)), len(self.stops), dtype=np.int32)
+        for row, indices in enumerate(rows):
+            self.padded[row, :len(indices)] = indices
+
+        # The S-shape estimate: every visited aisle is walked through, and the cross aisle from the depot
+        # to the farthest aisles on both sides, there and back
+        lines = np.array(layout.aisles, dtype=np.int32)
+        depot_aisle = layout.coordinates(depot)[0]
+        self.low = np.where(self.aisles, lines, depot_aisle).min(axis=1, initial=depot_aisle)
+        self.high = np.where(self.aisles, lines, depot_aisle).max(axis=1, initial=depot_aisle)
+        self.aisle_length = layout.back - layout.front
+        self.estimate = self.aisles.sum(axis=1) * self.aisle_length + 2 * (self.high - self.low)
+        self._distances = None
+
+    def __len__(self):
+        return len(self.counts)
+
+    def distances(self, deadline=None):
+        """
+        Returns the BFS distances between the stops, computed once with the wavefront.
+        The extra last row and column are the padding stop, at distance 0.
+
+        :param deadline: The perf_counter() time the computation is given up at
+        :return: A (stops + 1, stops + 1) int32 array, or None if the deadline passed
+        """
+
+        if self._distances is None:
+            count = len(self.stops)
+            between = pairwise_distances(self.layout.blocked, self.stops, deadline=deadline)
+            if between is None:
+                return None
+            matrix = np.zeros((count + 1, count + 1), dtype=np.int32)
+            matrix[:count, :count] = between
+            # A stop that can not be reached is as far as the whole grid
+            matrix[matrix == UNREACHABLE] = self.layout.blocked.size
+            self._distances = matrix
+        return self._distances
+
+
+def _in_arrival_order(orders, capacity):
+    """Splits a list of order indices into batches of capacity orders."""
+
+    return [orders[start:start + capacity] for start in range(0, len(orders), capacity)]
+
+
+def fcfs(order_set, capacity, deadline=None):
+    """
+    The fcfs function batches the orders in the order they arrive.
+
+    :param order_set: The OrderSet
+    :param capacity: The largest number of orders of a batch
+    :param deadline: Unused, the batches are formed at once
+    :return: A list of batches, each a list of order indices
+    """
+
+    return _in_arrival_order(list(range(len(order_set))), capacity)
+
+
+def seed_batches(order_set, capacity, deadline=None):
+    """
+    The seed_batches function opens each batch with the order reaching farthest from the depot,
+    then adds the order whose picks are nearest to the picks of the batch (mean distance from each of its
+    picks to the nearest pick of the batch) until the batch is full.
+
+    :param order_set: The OrderSet
+    :param capacity: The largest number of orders of a batch
+    :param deadline: The perf_counter() time the orders left are batched in arrival order at
+    :return: A list of batches, each a list of order indices
+    """
+
+    # The distances are symmetric, a row holds the distances to a stop
+    matrix = order_set.distances(deadline)
+    if matrix is None:
+        # The budget ran out before the distances, so before any batch could be formed
+        return _in_arrival_order(list(range(len(order_set))), capacity)
+    padded, counts = order_set.padded, order_set.counts
+    reach = matrix[0][padded].max(axis=1, initial=0)
+    left = np.arange(len(order_set))
+    batches = []
+    while len(left):
+        if deadline is not None and perf_counter() > deadline:
+            batches.extend(_in_arrival_order(np.sort(left).tolist(), capacity))
+            break
+        # The scores are only computed for the orders left, the candidates of this batch
+        stops, mean = padded[left], 1 / np.maximum(counts[left], 1)
+        taken = np.zeros(len(left), dtype=bool)
+        chosen = int(reach[left].argmax())
+        batch = []
+        nearest = np.full(len(matrix), np.iinfo(np.int32).max, dtype=np.int32)
+        while True:
+            order = int(left[chosen])
+            batch.append(order)
+            taken[chosen] = True
+            if len(batch) == min(capacity, len(left)):
+                break
+            # The distance of every stop to the nearest stop of the batch
+            np.minimum(nearest, matrix[padded[order, :counts[order]]].min(axis=0), out=nearest)
+            nearest[-1] = 0
+            candidates = nearest[stops].sum(axis=1) * mean
+            candidates[taken] = np.inf
+            chosen = int(candidates.argmin())
+        batches.append(batch)
+        left = np.setdiff1d(left, batch, assume_unique=True)
+    return batches
+
+
+def pair_savings(order_set, neighbours=16, deadline=None):
+    """
+    The pair_savings function computes the savings of routing two orders in one tour, for the best pairs
+    of each order. The savings matrix is computed by blocks of rows: two orders share the walk through
+    the aisles both visit (a matrix product of the aisle incidence) and the cross aisle up to the nearer
+    of their farthest aisles.
+
+    :param order_set: The OrderSet
+    :param neighbours: The number of pairs kept per order
+    :param deadline: The perf_counter() time the computation stops at, the pairs found so far are returned
+    :return: The savings, first and second orders of the pairs with a positive saving, largest saving first
+    """
+
+    count = len(order_set)
+    incidence = order_set.aisles.astype(np.float32)
+    low, high = order_set.low.astype(np.float32), order_set.high.astype(np.float32)
+    span = high - low
+    neighbours = min(neighbours, count - 1)
+    savings, firsts, seconds = [], [], []
+    for start in range(0, count if neighbours > 0 else 0, BLOCK_ROWS):
+        if deadline is not None and perf_counter() > deadline:
+            break
+        rows = np.arange(start, min(start + BLOCK_ROWS, count))
+        # saving = estimate(i) + estimate(j) - estimate(i and j)
+        block = incidence[rows] @ incidence.T
+        block *= order_set.aisle_length
+        union = np.maximum(high[rows, None], high[None, :])
+        union -= np.minimum(low[rows, None], low[None, :])
+        union -= span[rows, None]
+        union -= span[None, :]
+        union *= 2
+        block -= union
+        block[rows - start, rows] = -1
+        best = np.argpartition(-block, neighbours - 1, axis=1)[:, :neighbours]
+        value = np.take_along_axis(block, best, axis=1)
+        # Each pair is kept once, from its first order
+        keep = (value > 0) & (best > rows[:, None])
+        savings.append(value[keep])
+        firsts.append(np.broadcast_to(rows[:, None], best.shape)[keep])
+        seconds.append(best[keep])
+
+    if not savings:
+        return np.array([]), np.array([], dtype=np.intp), np.array([], dtype=np.intp)
+    savings, firsts, seconds = np.concatenate(savings), np.concatenate(firsts), np.concatenate(seconds)
+    order = np.argsort(-savings, kind="stable")
+    return savings[order], firsts[order], seconds[order]
+
+
+def savings_batches(order_set, capacity, deadline=None, neighbours=16):
+    """
+    The savings_batches function merges the batches of the pairs of orders with the largest savings,
+    while the merged batch fits in a cart. The savings are those of the orders, computed once.
+
+    :param order_set: The OrderSet
+    :param capacity: The largest number of orders of a batch
+    :param deadline: The perf_counter() time the orders left are batched in arrival order at
+    :param neighbours: The number of pairs kept per order, see pair_savings()
+    :return: A list of batches, each a list of order indices
+    """
+
+    _, firsts, seconds = pair_savings(order_set, neighbours, deadline)
+    batch_of = list(range(len(order_set)))
+    members = {order: [order] for order in range(len(order_set))}
+    for first, second in zip(firsts.tolist(), seconds.tolist()):
+        a, b = batch_of[first], batch_of[second]
+        if a == b or len(members[a]) + len(members[b]) > capacity:
+            continue
+        if len(members[a]) < len(members[b]):
+            a, b = b, a
+        for order in members[b]:
+            batch_of[order] = a
+        members[a].extend(members.pop(b))
+
+    # The orders no pair was merged for share carts in arrival order
+    batches = [batch for batch in members.values() if len(batch) > 1]
+    batches.extend(_in_arrival_order([batch[0] for batch in members.values() if len(batch) == 1], capacity))
+    return batches
+
+
+HEURISTICS = {
+    "fcfs": fcfs,
+    "seed": seed_batches,
+    "savings": savings_batches
+}
+
+
+def batch_orders(layout, orders, depot, capacity=8, heuristic="savings", time_budget=None):
+    """
+    API entry point, group orders into batches of at most capacity orders.
+
+    :param layout: The AisleLayout of the map
+    :param orders: A list of orders, each a list of (x, y) shelf positions
+    :param depot: The (x, y) position the tours start and end at
+    :param capacity: The largest number of orders of a batch (the totes of a cart)
+    :param heuristic: The name of the heuristic, see HEURISTICS
+    :param time_budget: The time in seconds the heuristic may take, None for no limit
+    :return: A list of batches, each a list of indices in orders
+    """
+
+    if capacity < 1:
+        raise ValueError("The capacity of a batch must be at least one order")
+    deadline = None if time_budget is None else perf_counter() + time_budget
+    return HEURISTICS[heuristic](OrderSet(layout, orders, depot), capacity, deadline)
+
+
+def route_batches(map_data, orders, batches, policy="s-shape", workers=1, with_path=False):
+    """
+    The route_batches function routes one tour per batch, through the order pipeline of stream.py.
+
+    :param map_data: The MapData object, the tours start and end at the worker's position
+    :param orders: A list of orders, each a list of (x, y) shelf positions
+    :param batches: A list of batches, each a list of indices in orders
+    :param policy: The name of the routing policy
+    :param workers: The number of routing processes
+    :param with_path: Whether the records keep the cells of the tours
+    :return: A generator of result records, one per batch, with the indices of its orders
+    """
+
+    tours = ((number, [pos for order in batch for pos in orders[order]], [], None)
+             for number, batch in enumerate(batches))
+    for batch, record in zip(batches, route_orders(tours, map_data, policy, workers, with_path=with_path)):
+        record["orders"] = batch
+        yield record
+
+
+def random_orders(map_data, count, max_lines=5, seed=0):
+    """Returns count random orders of 1 to max_lines items of the map data, as (order id, item ids)."""
+
+    rng = random.Random(seed)
+    return [(str(number), [rng.choice(map_data.items).item_id for _ in range(rng.randint(1, max_lines))])
+            for number in range(count)]
+
+
+def benchmark(map_data, orders, capacity=8, policy="s-shape", workers=1, time_budget=None):
+    """
+    The benchmark function batches a wave of orders with each heuristic and routes the batches.
+
+    :param map_data: The MapData object, with an item index
+    :param orders: A list of (order id, item ids)
+    :param capacity: The largest number of orders of a batch
+    :param policy: The name of the routing policy
+    :param workers: The number of routing processes
+    :param time_budget: The time in seconds each heuristic may take
+    :return: A dictionary per heuristic of the number of batches, total tour length, failed tours
+             and the batching and routing times in seconds
+    """
+
+    resolved = list(resolve_orders(((order_id, item_ids, None) for order_id, item_ids in orders), map_data))
+    positions = [positions for _, positions, _, error in resolved if error is None]
+    layout = AisleLayout(map_data)
+    results = {}
+    for heuristic in HEURISTICS:
+        start = perf_counter()
+        batches = batch_orders(layout, positions, map_data.worker.pos, capacity, heuristic, time_budget)
+        batching = perf_counter() - start
+        start = perf_counter()
+        records = list(route_batches(map_data, positions, batches, policy, workers))
+        results[heuristic] = {
+            "batches": len(batches),
+            "length": sum(record.get("length", 0) for record in records),
+            "failed": sum("error" in record for record in records),
+            "batching": batching,
+            "routing": perf_counter() - start
+        }
+    return results
+
+
+def main():
+    """
+    Command line entry point, batch a wave of orders of a file or random orders and compare the heuristics.
+    """
+
+    from core import gen_item_index, load_map_data
+    from stream import parse_orders, read_lines
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Batch a wave of orders into carts and route them.")
+    parser.add_argument("orders", nargs="?", help="the order file (order id then item ids on each line), "
+                                                  "default to random orders")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--count", type=int, default=10000, help="the number of random orders")
+    parser.add_argument("--lines", type=int, default=5, help="the largest number of lines of a random order")
+    parser.add_argument("--capacity", type=int, default=8, help="the largest number of orders of a batch")
+    parser.add_argument("--policy", default="s-shape", help="the routing policy of the tours")
+    parser.add_argument("--workers", type=int, default=1, help="the number of routing processes")
+    parser.add_argument("--budget", type=float, help="the time in seconds each heuristic may take")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+        map_data.update("item_index", gen_item_index(map_data.items))
+    else:
+        map_data = load_map_data(args.data)
+
+    if args.orders:
+        orders = [(order_id, item_ids) for order_id, item_ids, error in parse_orders(read_lines(args.orders))
+                  if error is None]
+    else:
+        orders = random_orders(map_data, args.count, args.lines)
+
+    results = benchmark(map_data, orders, args.capacity, args.policy, args.workers, args.budget)
+    print("{} orders, carts of {} orders".format(len(orders), args.capacity))
+    print("{:<10} {:>8} {:>14} {:>8} {:>14} {:>12}".format("Heuristic", "Batches", "Total length", "Failed",
+                                                          "Batching (s)", "Routing (s)"))
+    for heuristic, result in results.items():
+        print("{:<10} {:>8} {:>14} {:>8} {:>14.2f} {:>12.2f}".format(
+            heuristic, result["batches"], result["length"], result["failed"], result["batching"],
+            result["routing"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,477 @@
+"""--------------------------------------------------------
+    Memory-bounded searches (IDA* and SMA*) over an implicit grid.
+    The grid is not built as Block objects: the neighbours of a cell are generated from the occupancy grid
+    when the cell is expanded, and the search state only holds the cells the search is working on.
+    Both searches take a node budget and never hold more search nodes than it allows:
+    - IDA* keeps the current path, and a transposition table in the room the path leaves in the budget,
+      the table gives way to the path when the budget is full and is cleared at every iteration,
+      the cells cut in the iteration are kept too while there is room, to tell when every reachable cell was seen;
+    - SMA* is A* that forgets the open leaf with the highest f-cost when the budget is reached,
+      the parent is opened again with the smallest forgotten f-cost, to generate the child again when needed.
+    The heuristic is the Manhattan distance, admissible and consistent since every step costs at least 1.
+    No shortest path costs more than the free cells times the largest cell cost (it enters each cell once at most),
+    both searches give up the nodes whose f-cost is over this bound, so they end when the target can not be reached.
+    A small budget can still make them search the same cells over and over, so they also stop, incomplete,
+    after a number of expansions (by default EXPANSIONS_PER_NODE times the budget).
+    --------------------------------------------------------"""
+
+import argparse
+import heapq
+import tracemalloc
+from time import perf_counter
+
+import numpy as np
+
+from wavefront import DIRECTIONS, occupancy_grid
+
+INFINITY = float("inf")
+
+# Bytes held per search node of SMA* (node, dictionary entry and heap entries, stale ones included),
+# measured with tracemalloc at 500 to 900, an IDA* node (path and table entry) takes less
+NODE_BYTES = 1024
+
+# Default expansion limit per node of the budget, the queries of the benchmark expand less than 25 per node
+EXPANSIONS_PER_NODE = 1000
+
+# Node states of SMA*
+OPEN = 0
+CLOSED = 1
+
+
+def nodes_for(memory):
+    """Returns the node budget that fits in the given number of bytes."""
+
+    return max(2, int(memory) // NODE_BYTES)
+
+
+class ImplicitGrid:
+    """
+    A class to represent the grid implicitly, by its occupancy grid and its per-cell costs.
+    Like the Map, the shelves can not be walked through and only the target shelf can be entered.
+    """
+
+    def __init__(self, blocked, costs=None):
+        """
+        :param blocked: A (map_row, map_col) boolean numpy array, True for the shelves
+        :param costs: The per-cell cost of stepping into a cell, {(x, y): cost}, cells not listed cost 1
+        """
+
+        self.blocked = blocked
+        self.map_row, self.map_col = blocked.shape
+        self.costs = costs or {}
+        self._cost_bound = None
+
+    @staticmethod
+    def from_map_data(map_data):
+        """Returns the implicit grid of a MapData object."""
+
+        return ImplicitGrid(occupancy_grid(map_data), map_data.costs)
+
+    def cost_bound(self):
+        """Returns an upper bound of the cost of any shortest path: the free cells and the target, less the start,
+        each entered once at most, at the largest cell cost."""
+
+        if self._cost_bound is None:
+            free = self.blocked.size - int(np.count_nonzero(self.blocked))
+            self._cost_bound = free * max(max(self.costs.values(), default=1), 1)
+        return self._cost_bound
+
+    def neighbours(self, cell, target):
+        """
+        Returns the cells reachable in one step and the cost of stepping into them.
+
+        :param cell: The (x, y) cell
+        :param target: The (x, y) target, the only shelf that can be entered
+        :return: A list of ((x, y), cost)
+        """
+
+        x, y = cell
+        result = []
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.map_row and 0 <= ny < self.map_col and \
+                    (not self.blocked[nx, ny] or (nx, ny) == target):
+                result.append(((nx, ny), self.costs.get((nx, ny), 1)))
+        return result
+
+
+def _manhattan(cell, target):
+    return abs(cell[0] - target[0]) + abs(cell[1] - target[1])
+
+
+def _bounded(f, bound):
+    """Returns the f-cost, or infinity when it is over the cost bound: no shortest path goes through the node."""
+
+    return f if f <= bound else INFINITY
+
+
+def _result(path, grid, expanded, peak, complete=True):
+    """Returns the result dictionary of a bounded search."""
+
+    return {
+        "path": path,
+        "cost": sum(grid.costs.get(cell, 1) for cell in path[1:]) if path else None,
+        "expanded": expanded,
+        "peak_nodes": peak,
+        "complete": complete,
+    }
+
+
+def ida_star(grid, start, target, max_nodes=100000, max_expanded=None):
+    """
+    The ida_star function searches with iterative deepening A*.
+    Each iteration is a depth-first search that cuts the paths whose f-cost is over the threshold,
+    the next threshold is the smallest f-cost that was cut. A transposition table keeps the smallest cost
+    each cell was reached with in the iteration, a cell reached again at no smaller cost is not searched again.
+    The search ends with no path when the target can not be reached: when an iteration held every cell it reached
+    and cut no cell it did not reach otherwise, or when the threshold goes over the cost bound of the grid.
+
+    :param grid: The ImplicitGrid
+    :param start: The (x, y) start cell
+    :param target: The (x, y) target cell
+    :param max_nodes: The node budget, the path comes first and the transposition table gets the rest
+    :param max_expanded: The largest number of expansions, EXPANSIONS_PER_NODE times the budget by default
+    :return: A dictionary of the path (list of (x, y)), its cost, the nodes expanded, the peak number of nodes
+             held and whether the search completed within the budget
+    """
+
+    if max_expanded is None:
+        max_expanded = EXPANSIONS_PER_NODE * max_nodes
+    threshold = _manhattan(start, target)
+    bound = grid.cost_bound()
+    expanded = peak = 0
+    while threshold <= bound:
+        smallest_cut = INFINITY
+        table = {start: 0}
+        path = [start]
+        costs = [0]
+        # One iterator of neighbours per cell of the path, sorted by heuristic
+        stack = [iter(sorted(grid.neighbours(start, target), key=lambda step: _manhattan(step[0], target)))]
+        on_path = {start}
+        # The cells cut in the iteration, None when they did not fit in the budget or the table gave way
+        cut = set()
+        truncated = False
+        while stack:
+            step = next(stack[-1], None)
+            if step is None:
+                stack.pop()
+                on_path.discard(path.pop())
+                costs.pop()
+                continue
+
+            cell, cost = step
+            g = costs[-1] + cost
+            if cell in on_path or table.get(cell, INFINITY) <= g:
+                continue
+            f = g + _manhattan(cell, target)
+            if f > threshold:
+                smallest_cut = min(smallest_cut, f)
+                if cut is not None:
+                    cut.add(cell)
+                    if len(table) + len(path) + len(cut) > max_nodes:
+                        cut = None
+                continue
+            if cell == target:
+                return _result(path + [cell], grid, expanded, peak)
+
+            # The cell takes one node on the path and one in the table
+            if len(path) + 2 > max_nodes:
+                # The path alone fills the budget, the cell is not searched from
+                truncated = True
+                continue
+            while len(table) + len(path) + len(cut or ()) + 2 > max_nodes:
+                # The path needs the room, the cut cells make way first, then the last transposition recorded
+                if cut is None:
+                    table.popitem()
+                cut = None
+            if expanded >= max_expanded:
+                return _result([], grid, expanded, peak, False)
+            table[cell] = g
+            expanded += 1
+            path.append(cell)
+            costs.append(g)
+            on_path.add(cell)
+            peak = max(peak, len(table) + len(path) + len(cut or ()))
+            stack.append(iter(sorted(grid.neighbours(cell, target), key=lambda step: _manhattan(step[0], target))))
+
+        # A larger threshold would only run into the budget again
+        if smallest_cut == INFINITY or truncated:
+            return _result([], grid, expanded, peak, not truncated)
+        # Every cell cut was reached by another path, a larger threshold would not reach a new cell
+        if cut is not None and all(cell in table for cell in cut):
+            return _result([], grid, expanded, peak)
+        threshold = smallest_cut
+    return _result([], grid, expanded, peak)
+
+
+class _Node:
+    """A search node of SMA*."""
+
+    __slots__ = ("cell", "g", "f", "parent", "depth", "children", "forgotten", "state", "version")
+
+    def __init__(self, cell, g, f, parent):
+        self.cell = cell
+        self.g = g
+        self.f = f
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+        self.children = 0
+        self.forgotten = INFINITY
+        self.state = OPEN
+        self.version = 0
+
+
+class SMAStar:
+    """
+    A class to run SMA* (simplified memory-bounded A*) with a node budget.
+    When a leaf is forgotten, its parent is opened again with the smallest f-cost of its forgotten children,
+    expanding it again only generates the children that are not held anymore.
+    A budget close to the smallest one that holds the search frontier makes it regenerate the same nodes
+    many times over, the searches are meant for budgets well above it.
+    """
+
+    def __init__(self, grid, max_nodes=100000, max_expanded=None):
+        """
+        :param grid: The ImplicitGrid
+        :param max_nodes: The largest number of search nodes held at once, at least 2
+        :param max_expanded: The largest number of expansions, EXPANSIONS_PER_NODE times the budget by default
+        """
+
+        self.grid = grid
+        self.max_nodes = max(2, max_nodes)
+        self.max_expanded = EXPANSIONS_PER_NODE * self.max_nodes if max_expanded is None else max_expanded
+
+    def _push(self, node):
+        """Puts a node in the open heaps, the best one pops first from the first heap, the worst from the second."""
+
+        node.state = OPEN
+        node.version += 1
+        self.counter += 1
+        heapq.heappush(self.best, (node.f, -node.g, self.counter, node, node.version))
+        heapq.heappush(self.worst, (-node.f, node.depth, self.counter, node, node.version))
+
+    def _valid(self, node, version):
+        """Tells whether a heap entry is still the current entry of an open node held in memory."""
+
+        return node.state == OPEN and node.version == version and self.nodes.get(node.cell) is node
+
+    def _compact(self):
+        """Drops the stale heap entries, so the heaps stay in proportion to the nodes held."""
+
+        self.best = [entry for entry in self.best if self._valid(entry[3], entry[4])]
+        self.worst = [entry for entry in self.worst if self._valid(entry[3], entry[4])]
+        heapq.heapify(self.best)
+        heapq.heapify(self.worst)
+
+    def _release(self, node):
+        """Called when a closed node may have no child held anymore, it is forgotten then: every way on from it
+        is reached more cheaply from elsewhere (its forgotten children would have put it back in the open heaps)."""
+
+        while node is not None and node.state == CLOSED and node.children == 0:
+            if node.parent is None:
+                return
+            # Every way on from the node is reached more cheaply from elsewhere
+            del self.nodes[node.cell]
+            node.state = None
+            node.parent.children -= 1
+            node = node.parent
+
+    def _forget_worst(self, expanding):
+        """Forgets the open leaf with the highest f-cost (the shallowest on ties),
+        except the root and the children of the node being expanded."""
+
+        skipped = []
+        while self.worst:
+            entry = heapq.heappop(self.worst)
+            node, version = entry[3], entry[4]
+            if not self._valid(node, version):
+                continue
+            if node.parent is None or node.parent is expanding or node.children:
+                skipped.append(entry)
+                continue
+            for kept in skipped:
+                heapq.heappush(self.worst, kept)
+            del self.nodes[node.cell]
+            node.state = None
+            parent = node.parent
+            parent.children -= 1
+            # The parent goes back in the open heaps, to generate the forgotten child again when it is the best
+            parent.forgotten = min(parent.forgotten, node.f)
+            parent.f = parent.forgotten
+            self._push(parent)
+            return True
+        for kept in skipped:
+            heapq.heappush(self.worst, kept)
+        return False
+
+    def search(self, start, target):
+        """
+        The search function runs SMA* from the start to the target.
+
+        :param start: The (x, y) start cell
+        :param target: The (x, y) target cell
+        :return: A dictionary of the path (list of (x, y)), its cost, the nodes expanded, the peak number of nodes
+                 held and whether the search completed within the budget
+        """
+
+        grid = self.grid
+        self.best = []
+        self.worst = []
+        self.counter = 0
+        bound = grid.cost_bound()
+        root = _Node(start, 0, _bounded(_manhattan(start, target), bound), None)
+        self.nodes = {start: root}
+        self._push(root)
+        expanded = peak = 0
+        truncated = False
+
+        while self.best:
+            f, _, _, node, version = heapq.heappop(self.best)
+            if not self._valid(node, version):
+                continue
+            if node.f == INFINITY:
+                break
+            if node.cell == target:
+                path = []
+                while node is not None:
+                    path.append(node.cell)
+                    node = node.parent
+                path.reverse()
+                return _result(path, grid, expanded, peak)
+
+            if expanded >= self.max_expanded:
+                truncated = True
+                break
+            node.state = CLOSED
+            node.forgotten = INFINITY
+            expanded += 1
+            for cell, cost in grid.neighbours(node.cell, target):
+                g = node.g + cost
+                held = self.nodes.get(cell)
+                if held is not None:
+                    if held.g <= g:
+                        continue
+                    # A cheaper way to a held cell, it moves under this node and is searched again
+                    old_parent = held.parent
+                    held.g, held.f = g, _bounded(g + _manhattan(cell, target), bound)
+                    held.parent, held.depth = node, node.depth + 1
+                    node.children += 1
+                    self._push(held)
+                    old_parent.children -= 1
+                    self._release(old_parent)
+                    continue
+
+                while len(self.nodes) >= self.max_nodes:
+                    if not self._forget_worst(node):
+                        break
+                if len(self.nodes) >= self.max_nodes:
+                    # Nothing left to forget, the path alone fills the budget
+                    truncated = True
+                    break
+                child = _Node(cell, g, _bounded(max(node.f, g + _manhattan(cell, target)), bound), node)
+                self.nodes[cell] = child
+                node.children += 1
+                self._push(child)
+
+            peak = max(peak, len(self.nodes))
+            if truncated:
+                break
+            self._release(node)
+            if len(self.best) + len(self.worst) > 4 * len(self.nodes) + 64:
+                self._compact()
+
+        return _result([], grid, expanded, peak, not truncated)
+
+
+def sma_star(grid, start, target, max_nodes=100000, max_expanded=None):
+    """
+    API entry point, search with SMA* within a node budget, see SMAStar.
+
+    :param grid: The ImplicitGrid
+    :param start: The (x, y) start cell
+    :param target: The (x, y) target cell
+    :param max_nodes: The largest number of search nodes held at once
+    :param max_expanded: The largest number of expansions, EXPANSIONS_PER_NODE times the budget by default
+    :return: The result dictionary of SMAStar.search()
+    """
+
+    return SMAStar(grid, max_nodes, max_expanded).search(start, target)
+
+
+ALGORITHMS = {
+    "ida*": ida_star,
+    "sma*": sma_star,
+}
+
+
+def measure(grid, queries, algorithm, max_nodes):
+    """
+    The measure function runs a bounded search on every query and measures it, the peak memory with tracemalloc.
+
+    :param grid: The ImplicitGrid
+    :param queries: A list of (start, target) cells
+    :param algorithm: The name of the algorithm, see ALGORITHMS
+    :param max_nodes: The node budget
+    :return: A list of the result dictionaries, each with the wall time and the peak memory added
+    """
+
+    search = ALGORITHMS[algorithm]
+    results = []
+    for start_cell, target in queries:
+        tracemalloc.start()
+        start = perf_counter()
+        result = search(grid, start_cell, target, max_nodes)
+        result["time"] = perf_counter() - start
+        result["memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        results.append(result)
+    return results
+
+
+def main():
+    """
+    Command line entry point, run the bounded searches on a synthetic floor of any size.
+    """
+
+    import random
+
+    from synthetic import synthetic_occupancy
+
+    parser = argparse.ArgumentParser(description="Memory-bounded searches on a large implicit grid.")
+    parser.add_argument("--size", nargs=2, type=int, default=(5000, 5000), metavar=("ROWS", "COLS"),
+                        help="the size of the synthetic floor")
+    parser.add_argument("--memory", type=float, default=64, help="the memory budget of the search nodes, in MB")
+    parser.add_argument("--algorithm", default="sma*", choices=sorted(ALGORITHMS), help="the bounded search")
+    parser.add_argument("--queries", type=int, default=3, help="the number of random queries")
+    parser.add_argument("--span", type=int, default=300, help="the largest distance along each axis of a query")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random queries")
+    args = parser.parse_args()
+
+    start = perf_counter()
+    blocked = synthetic_occupancy(*args.size, seed=args.seed)
+    grid = ImplicitGrid(blocked)
+    print("Floor {}x{}, occupancy grid {:.1f} MB, built in {:.2f} s".format(
+        args.size[0], args.size[1], blocked.nbytes / 2 ** 20, perf_counter() - start))
+
+    rng = random.Random(args.seed)
+    free = ~blocked
+    queries = []
+    while len(queries) < args.queries:
+        x, y = rng.randrange(args.size[0]), rng.randrange(args.size[1])
+        tx = min(args.size[0] - 1, max(0, x + rng.randint(-args.span, args.span)))
+        ty = min(args.size[1] - 1, max(0, y + rng.randint(-args.span, args.span)))
+        if free[x, y]:
+            queries.append(((x, y), (tx, ty)))
+
+    max_nodes = nodes_for(args.memory * 2 ** 20)
+    print("{} with a budget of {:.0f} MB ({} nodes)".format(args.algorithm.upper(), args.memory, max_nodes))
+    print("{:<24} {:>8} {:>10} {:>10} {:>12} {:>10}".format("Query", "Cost", "Expanded", "Peak nodes",
+                                                              "Memory (MB)", "Time (s)"))
+    for (start_cell, target), result in zip(queries, measure(grid, queries, args.algorithm, max_nodes)):
+        print("{:<24} {:>8} {:>10} {:>10} {:>12.1f} {:>10.2f}".format(
+            str(start_cell) + "->" + str(target), str(result["cost"]) + ("" if result["complete"] else "*"),
+            result["expanded"], result["peak_nodes"], result["memory"] / 2 ** 20, result["time"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""--------------------------------------------------------
+    Memory-mapped item catalogue.
+    The items are stored in a binary file sorted by item id, one fixed-size record per row of the data file.
+    The file is memory-mapped, so only the pages that are looked up are loaded,
+    and an Item object is only created when it is asked for.
+    --------------------------------------------------------"""
+
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+
+from entities import Item, Shelf, to_cell
+
+MAGIC = b"LPCAT"
+VERSION = 1
+# magic, version, number of records, number of shelves
+HEADER = struct.Struct("<5sHQQ")
+# item_id, x, y
+RECORD = struct.Struct("<qdd")
+# shelf x, shelf y, stored after the records
+SHELF = struct.Struct("<ii")
+
+
+def catalogue_path(filename, resolution=1):
+    """Returns the name of the catalogue file built from the given item data file.
+    The shelf table depends on the resolution, a finer grid has its own catalogue.
+
+    :param filename: A string representing the name of the item data file.
+    :param resolution: The number of grid cells per unit of the coordinates.
+    :return: A string representing the name of the catalogue file.
+    """
+
+    root, _ = os.path.splitext(filename)
+    if resolution != 1:
+        root += "-x" + str(resolution)
+    return root + ".catalogue"
+
+
+def build_catalogue(filename, output=None, resolution=1):
+    """
+    The build_catalogue function converts an item data file to a sorted binary catalogue.
+    The rows are read into compact arrays instead of Item objects, then written sorted by item id.
+    The distinct shelf positions are written after the records, so opening the catalogue does not scan the items.
+
+    :param filename: A string representing the name of the item data file.
+    :param output: A string representing the name of the catalogue file, default to catalogue_path(filename)
+    :param resolution: The number of grid cells per unit of the coordinates, for the shelf table
+    :return: The name of the catalogue file
+    """
+
+    if output is None:
+        output = catalogue_path(filename, resolution)
+
+    ids = array("q")
+    xs = array("d")
+    ys = array("d")
+    positions = set()
+    with open(filename, 'r') as file:
+        # Skip the first line of the file
+        next(file)
+        for line in file:
+            data = line.strip().split()
+            if not data:
+                continue
+            ids.append(int(data[0]))
+            xs.append(float(data[1]))
+            ys.append(float(data[2]))
+            positions.add((to_cell(data[1], resolution), to_cell(data[2], resolution)))
+
+    with open(output, 'wb') as file:
+        write_catalogue(file, ids, xs, ys, positions)
+
+    return output
+
+
+def write_catalogue(file, ids, xs, ys, positions):
+    """
+    The write_catalogue function writes the header, the records sorted by item id and the shelf table.
+
+    :param file: A binary file (or any object with a write method)
+    :param ids: The item id of each row
+    :param xs: The x-coordinate of each row
+    :param ys: The y-coordinate of each row
+    :param positions: The set of distinct shelf positions
+    """
+
+    order = sorted(range(len(ids)), key=ids.__getitem__)
+    file.write(HEADER.pack(MAGIC, VERSION, len(ids), len(positions)))
+    for i in order:
+        file.write(RECORD.pack(ids[i], xs[i], ys[i]))
+    for pos in sorted(positions):
+        file.write(SHELF.pack(*pos))
+
+
+class _Ids:
+    """A read-only sequence of the item ids of a catalogue, so that the bisect module can search it."""
+
+    def __init__(self, catalogue):
+        self.catalogue = catalogue
+
+    def __len__(self):
+        return len(self.catalogue)
+
+    def __getitem__(self, index):
+        return self.catalogue.item_id(index)
+
+
+class ItemCatalogue:
+    """
+    A class to represent the memory-mapped item catalogue.
+    It can be used in place of the list of items: it can be iterated, paged and searched by item id.
+    It also works as the item index of MapData, get(item_id) returns every location of the item.
+    """
+
+    def __init__(self, filename, offset=0, resolution=1):
+        """
+        :param filename: A string representing the name of the catalogue file
+        :param offset: The offset of the catalogue in the file, when it is a section of a larger file (a snapshot)
+        :param resolution: The number of grid cells per unit the catalogue was built with
+        """
+
+        self.filename = filename
+        self.resolution = resolution
+        self.file = open(filename, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.count, self.shelf_count = HEADER.unpack_from(self.buffer, offset)
+        # The offset of the first record
+        self.start = offset + HEADER.size
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a lazy picker catalogue (version " + str(VERSION) + "): " + filename)
+
+    def close(self):
+        """Releases the memory map and the file."""
+
+        self.buffer.close()
+        self.file.close()
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        """
+        Returns the raw record at the given index of the catalogue.
+
+        :param index: The index of the record, in item id order
+        :return: A tuple of (item_id, x, y)
+        """
+
+        return RECORD.unpack_from(self.buffer, self.start + index * RECORD.size)
+
+    def item_id(self, index):
+        """Returns the item id of the record at the given index."""
+
+        return struct.unpack_from("<q", self.buffer, self.start + index * RECORD.size)[0]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("catalogue index out of range")
+        return Item(*self.record(index), resolution=self.resolution)
+
+    def __iter__(self):
+        for index in range(self.count):
+            yield Item(*self.record(index), resolution=self.resolution)
+
+    def _range(self, item_id):
+        """Returns the range of indexes whose records have the given item id, found by binary search."""
+
+        ids = _Ids(self)
+        low = bisect_left(ids, item_id)
+        high = low
+        while high < self.count and self.item_id(high) == item_id:
+            high += 1
+        return low, high
+
+    def find(self, item_id):
+        """
+        The find function returns the first item with the given id.
+
+        :param item_id: The id of the item
+        :return: The Item, or None if the id is not in the catalogue
+        """
+
+        low, high = self._range(item_id)
+        if low == high:
+            return None
+        return Item(*self.record(low), resolution=self.resolution)
+
+    def find_all(self, item_id):
+        """
+        The find_all function returns every row of the item, one per location it is stocked at.
+
+        :param item_id: The id of the item
+        :return: A list of Items
+        """
+
+        low, high = self._range(item_id)
+        return [Item(*self.record(index), resolution=self.resolution) for index in range(low, high)]
+
+    def get(self, item_id, default=None):
+        """
+        Returns every location of the item, like the dictionary built by core.gen_item_index().
+
+        :param item_id: The id of the item
+        :param default: The value returned if the id is not in the catalogue
+        :return: A list of (x, y) positions
+        """
+
+        locations = []
+        for item in self.find_all(item_id):
+            if item.pos not in locations:
+                locations.append(item.pos)
+        return locations if locations else default
+
+    def page(self, number, size=20):
+        """
+        The page function returns one page of the catalogue, in item id order.
+
+        :param number: The number of the page, starting from 0
+        :param size: The number of items on a page
+        :return: A list of Items
+        """
+
+        start = number * size
+        return [Item(*self.record(index), resolution=self.resolution)
+                for index in range(start, min(start + size, self.count))]
+
+    def gen_shelves(self):
+        """
+        The gen_shelves function builds the shelves from the shelf table stored after the records.
+        Unlike core.gen_shelves(), the shelves do not hold the Item objects,
+        the items of a position are found through the catalogue when needed.
+
+        :return: A list of shelves, sorted by position
+        """
+
+        offset = self.start + self.count * RECORD.size
+        return [Shelf(index, *SHELF.unpack_from(self.buffer, offset + index * SHELF.size))
+                for index in range(self.shelf_count)]
+
+
+def load_catalogue(filename, resolution=1):
+    """
+    The load_catalogue function opens the catalogue of the given item data file.
+    The catalogue is (re)built first if it does not exist or is older than the data file.
+
+    :param filename: A string representing the name of the item data file.
+    :param resolution: The number of grid cells per unit of the coordinates.
+    :return: The ItemCatalogue and the shelves generated from it
+    """
+
+    path = catalogue_path(filename, resolution)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(filename):
+        build_catalogue(filename, path, resolution)
+
+    catalogue = ItemCatalogue(path, resolution=resolution)
+    return catalogue, catalogue.gen_shelves()
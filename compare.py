@@ -0,0 +1,216 @@
+"""--------------------------------------------------------
+    Algorithm comparison mode.
+    The same query is run with every Algorithm at once in a process pool,
+    each run builds its own Map, and the results are printed side by side.
+    --------------------------------------------------------"""
+
+import argparse
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from core import find_item, load_map_data
+from data import Algorithm, MapData
+from entities import Worker
+from service import Map
+
+# The map data of a pool process, set once by _init_process()
+_base = None
+
+
+def _init_process(map_data):
+    """Keeps the map data in the pool process, so it is sent once per process instead of once per run."""
+
+    global _base
+    _base = map_data
+
+
+def _query_data(base, worker_pos, target):
+    """Returns the map data of one query, sharing the shelves, costs and resolution of the base map data."""
+
+    return MapData(Worker(*worker_pos), base.shelves, base.items, target, map_row=base.map_row,
+                   map_col=base.map_col, costs=base.costs, resolution=base.resolution)
+
+
+def run_algorithm(map_data, algorithm, measure_memory=True):
+    """
+    The run_algorithm function runs one algorithm on its own Map and measures it.
+    The wall time of the search is measured on a first run, the peak memory of the Map and the search with
+    tracemalloc on a second run, so that tracing the allocations does not slow down the timed run.
+
+    :param map_data: The MapData object of the query
+    :param algorithm: The algorithm to run
+    :param measure_memory: Whether to measure the peak memory
+    :return: A dictionary of the algorithm name, path length, path cost, nodes expanded, wall time and peak memory
+    """
+
+    grid = Map(map_data, render=False)
+    start = perf_counter()
+    grid.search(algorithm)
+    wall_time = perf_counter() - start
+
+    peak = None
+    if measure_memory:
+        tracemalloc.start()
+        Map(map_data, render=False).search(algorithm)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {
+        "algorithm": algorithm.name,
+        "length": len(grid.path) - 1 if grid.has_path else None,
+        "cost": grid.path_cost(),
+        "expanded": grid.iteration,
+        "time": wall_time,
+        "memory": peak,
+    }
+
+
+def _run(task):
+    """Runs one (worker position, target, algorithm) task in a pool process."""
+
+    worker_pos, target, algorithm, measure_memory = task
+    return run_algorithm(_query_data(_base, worker_pos, target), algorithm, measure_memory)
+
+
+def compare_queries(map_data, queries, algorithms=tuple(Algorithm), processes=None, measure_memory=True):
+    """
+    The compare_queries function runs every algorithm on every query in a process pool.
+
+    :param map_data: The MapData object holding the shelves (and costs) of the map
+    :param queries: A list of (worker position, target item) tuples
+    :param algorithms: The algorithms to compare
+    :param processes: The number of processes, default to the number of CPUs
+    :param measure_memory: Whether to measure the peak memory of each run
+    :return: A list with, for each query, the list of results of run_algorithm() in the order of algorithms
+    """
+
+    tasks = [(worker_pos, target, algorithm, measure_memory)
+             for worker_pos, target in queries for algorithm in algorithms]
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_process,
+                             initargs=(map_data.without_items(),)) as pool:
+        results = list(pool.map(_run, tasks))
+
+    size = len(algorithms)
+    return [results[i:i + size] for i in range(0, len(results), size)]
+
+
+def compare(map_data, algorithms=tuple(Algorithm), processes=None, measure_memory=True):
+    """
+    The compare function runs every algorithm on the query of the map data (worker and target) concurrently.
+
+    :param map_data: The MapData object of the query
+    :param algorithms: The algorithms to compare
+    :param processes: The number of processes, default to the number of CPUs
+    :param measure_memory: Whether to measure the peak memory of each run
+    :return: The list of results of run_algorithm(), in the order of algorithms
+    """
+
+    return compare_queries(map_data, [(map_data.worker.pos, map_data.target)], algorithms, processes,
+                           measure_memory)[0]
+
+
+def summarize(query_results):
+    """
+    The summarize function adds up the results of many queries per algorithm.
+
+    :param query_results: The list returned by compare_queries()
+    :return: One result per algorithm, with the mean path length and cost, and the total nodes expanded and wall time
+    """
+
+    summary = []
+    for runs in zip(*query_results):
+        found = [run for run in runs if run["length"] is not None]
+        memory = [run["memory"] for run in runs if run["memory"] is not None]
+        summary.append({
+            "algorithm": runs[0]["algorithm"],
+            "length": sum(run["length"] for run in found) / len(found) if found else None,
+            "cost": sum(run["cost"] for run in found) / len(found) if found else None,
+            "expanded": sum(run["expanded"] for run in runs),
+            "time": sum(run["time"] for run in runs),
+            "memory": max(memory) if memory else None,
+        })
+    return summary
+
+
+def format_table(results):
+    """
+    The format_table function lays out the results side by side, one row per algorithm.
+
+    :param results: A list of results of run_algorithm() or summarize()
+    :return: The table as a string
+    """
+
+    def show(value, form):
+        return "-" if value is None else form.format(value)
+
+    lines = ["{:<10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+        "Algorithm", "Length", "Cost", "Expanded", "Time (ms)", "Memory (KB)")]
+    for result in results:
+        lines.append("{:<10} {:>10} {:>10} {:>10} {:>12} {:>12}".format(
+            result["algorithm"], show(result["length"], "{:g}"), show(result["cost"], "{:g}"),
+            result["expanded"], show(result["time"] * 1000, "{:.2f}"),
+            show(result["memory"] and result["memory"] / 1024, "{:.1f}")))
+    return "\n".join(lines)
+
+
+def read_queries(filename, items):
+    """
+    The read_queries function reads a query file: a header line, then one query per line,
+    the worker's x-coordinate, y-coordinate and the target item's id.
+
+    :param filename: A string representing the name of the query file
+    :param items: The list of all items, or an ItemCatalogue
+    :return: A list of (worker position, target item) tuples, the unknown item ids are skipped
+    """
+
+    queries = []
+    with open(filename, 'r') as file:
+        # Skip the first line of the file
+        next(file)
+        for line in file:
+            data = line.strip().split()
+            if not data:
+                continue
+            target = find_item(items, int(data[2]))
+            if target is not None:
+                queries.append(((int(data[0]), int(data[1])), target))
+    return queries
+
+
+def main():
+    """
+    Command line entry point, compare the algorithms on one query or on a query file.
+    """
+
+    parser = argparse.ArgumentParser(description="Compare the path finding algorithms side by side.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--queries", help="a query file (worker x, worker y, item id per line)")
+    parser.add_argument("--processes", type=int, help="the number of processes, default to the number of CPUs")
+    parser.add_argument("--no-memory", action="store_true", help="do not measure the peak memory")
+    parser.add_argument("query", nargs="*", type=int, help="worker x, worker y and item id of a single query")
+    args = parser.parse_args()
+
+    if args.queries:
+        map_data = load_map_data(args.data)
+        queries = read_queries(args.queries, map_data.items)
+        if not queries:
+            parser.error("the query file " + args.queries + " has no query with a known item")
+        map_data.update("target", queries[0][1])
+        results = compare_queries(map_data, queries, processes=args.processes, measure_memory=not args.no_memory)
+        print("Compared", len(queries), "queries")
+        print(format_table(summarize(results)))
+    else:
+        if len(args.query) != 3:
+            parser.error("give worker x, worker y and item id, or a query file")
+        worker_x, worker_y, item_id = args.query
+        map_data = load_map_data(args.data, (worker_x, worker_y))
+        target = find_item(map_data.items, item_id)
+        if target is None:
+            parser.error("cannot find item with id " + str(item_id))
+        map_data.update("target", target)
+        print(format_table(compare(map_data, processes=args.processes, measure_memory=not args.no_memory)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,447 @@
+"""--------------------------------------------------------
+    Contraction hierarchies for fast route queries.
+    The walkable graph of the map is preprocessed once: the cells are contracted one by one in order of importance,
+    and shortcuts are added so that the shortest paths between the remaining cells are kept.
+    A query is then a bidirectional Dijkstra that only goes up the hierarchy, and visits a few hundred cells
+    at most, the shortcuts of the path are unpacked back to grid cells.
+    Cell ids are flat, cell id = x * map_col + y.
+    --------------------------------------------------------"""
+
+import argparse
+import heapq
+import math
+import random
+import struct
+import tracemalloc
+from array import array
+from time import perf_counter
+
+from wavefront import DIRECTIONS, occupancy_grid
+
+MAGIC = b"LPCH"
+VERSION = 1
+# magic, version, map_row, map_col, forward edges, backward edges, shortcuts
+HEADER = struct.Struct("<4sHIIQQQ")
+
+# The middle of an original edge, which is not a shortcut
+NO_MIDDLE = -1
+# The number of cells a witness search may settle before it gives up (and a shortcut is added)
+WITNESS_LIMIT = 60
+
+
+def walkable_graph(map_data):
+    """
+    The walkable_graph function builds the directed graph of the map.
+    There is an edge from each free cell to each neighbour inside the map, its cost is the cost of stepping into
+    the neighbour (1, or the cost from the cost map). Shelves only have incoming edges, they are entered but
+    never walked through, like the target of a Map search.
+
+    :param map_data: The MapData object
+    :return: The outgoing and incoming edges, one dictionary per cell, {other cell: (cost, middle)}
+    """
+
+    map_row, map_col = map_data.map_row, map_data.map_col
+    size = map_row * map_col
+    walkable = (~occupancy_grid(map_data)).ravel().tolist()
+    cost = [1] * size
+    for (x, y), value in (map_data.costs or {}).items():
+        if 0 <= x < map_row and 0 <= y < map_col:
+            cost[x * map_col + y] = value
+
+    out_edges = [{} for _ in range(size)]
+    in_edges = [{} for _ in range(size)]
+    for x in range(map_row):
+        for y in range(map_col):
+            u = x * map_col + y
+            if not walkable[u]:
+                continue
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < map_row and 0 <= ny < map_col:
+                    v = nx * map_col + ny
+                    out_edges[u][v] = (cost[v], NO_MIDDLE)
+                    in_edges[v][u] = (cost[v], NO_MIDDLE)
+    return out_edges, in_edges
+
+
+class ContractionHierarchy:
+    """
+    A class to represent a built contraction hierarchy.
+    Only the upward graphs are kept: forward edges go to a higher ranked cell,
+    backward edges come from a higher ranked cell, both in compressed (offset, target, cost) arrays.
+    """
+
+    def __init__(self, map_row, map_col, rank, forward, backward, shortcuts):
+        self.map_row = map_row
+        self.map_col = map_col
+        self.rank = rank
+        # (offsets, targets, costs)
+        self.forward = forward
+        self.backward = backward
+        # {(from cell, to cell): middle cell}
+        self.shortcuts = shortcuts
+
+    @staticmethod
+    def build(map_data):
+        """
+        The build function contracts every cell of the walkable graph of the map.
+        The next cell to contract is the one with the lowest priority,
+        (shortcuts added - edges removed + neighbours already contracted), the priorities are updated lazily.
+
+        :param map_data: The MapData object
+        :return: The ContractionHierarchy
+        """
+
+        out_edges, in_edges = walkable_graph(map_data)
+        size = len(out_edges)
+        contracted = [False] * size
+        deleted_neighbours = [0] * size
+        rank = array("i", [0] * size)
+
+        def witness(source, skip, limit, targets):
+            # A local Dijkstra from source that avoids the cell being contracted
+            dist = {source: 0}
+            heap = [(0, source)]
+            settled = 0
+            remaining = set(targets)
+            while heap and remaining and settled < WITNESS_LIMIT:
+                total, cell = heapq.heappop(heap)
+                if total > dist[cell]:
+                    continue
+                if total > limit:
+                    break
+                settled += 1
+                remaining.discard(cell)
+                for other, (cost, _) in out_edges[cell].items():
+                    if other == skip or contracted[other]:
+                        continue
+                    new_total = total + cost
+                    if new_total < dist.get(other, math.inf):
+                        dist[other] = new_total
+                        heapq.heappush(heap, (new_total, other))
+            return dist
+
+        def shortcuts_of(v):
+            # The shortcuts needed to contract v, [(from cell, to cell, cost)]
+            ins = [(u, cost) for u, (cost, _) in in_edges[v].items() if not contracted[u]]
+            outs = [(w, cost) for w, (cost, _) in out_edges[v].items() if not contracted[w]]
+            needed = []
+            if not outs:
+                return needed, ins, outs
+            for u, in_cost in ins:
+                targets = [w for w, _ in outs if w != u]
+                if not targets:
+                    continue
+                limit = in_cost + max(cost for w, cost in outs if w != u)
+                dist = witness(u, v, limit, targets)
+                for w, out_cost in outs:
+                    if w != u and dist.get(w, math.inf) > in_cost + out_cost:
+                        needed.append((u, w, in_cost + out_cost))
+            return needed, ins, outs
+
+        def priority(v):
+            needed, ins, outs = shortcuts_of(v)
+            return len(needed) - len(ins) - len(outs) + deleted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(size) if out_edges[v] or in_edges[v]]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update, put the cell back if its priority went up past the next one
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            needed, ins, outs = shortcuts_of(v)
+            for u, w, cost in needed:
+                if cost < out_edges[u].get(w, (math.inf, NO_MIDDLE))[0]:
+                    out_edges[u][w] = (cost, v)
+                    in_edges[w][u] = (cost, v)
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for u, _ in ins:
+                deleted_neighbours[u] += 1
+            for w, _ in outs:
+                deleted_neighbours[w] += 1
+
+        # Keep the upward edges only
+        forward = ([], [], [])
+        backward = ([], [], [])
+        shortcuts = {}
+        for u in range(size):
+            forward[0].append(len(forward[1]))
+            for w, (cost, middle) in out_edges[u].items():
+                if rank[w] > rank[u]:
+                    forward[1].append(w)
+                    forward[2].append(cost)
+                    if middle != NO_MIDDLE:
+                        shortcuts[(u, w)] = middle
+            backward[0].append(len(backward[1]))
+            for w, (cost, middle) in in_edges[u].items():
+                if rank[w] > rank[u]:
+                    backward[1].append(w)
+                    backward[2].append(cost)
+                    if middle != NO_MIDDLE:
+                        shortcuts[(w, u)] = middle
+        forward[0].append(len(forward[1]))
+        backward[0].append(len(backward[1]))
+
+        return ContractionHierarchy(map_data.map_row, map_data.map_col, rank,
+                                    tuple(array("i", part) for part in forward),
+                                    tuple(array("i", part) for part in backward), shortcuts)
+
+    def _cell(self, pos):
+        """Returns the flat cell id of a position, or None if it is outside the map."""
+
+        x, y = pos
+        if 0 <= x < self.map_row and 0 <= y < self.map_col:
+            return x * self.map_col + y
+        return None
+
+    def query(self, source, target):
+        """
+        The query function finds the shortest route between two cells with a bidirectional upward Dijkstra.
+        Each side stops when its smallest distance is not lower than the best route found so far.
+
+        :param source: The (x, y) start cell, e.g. the worker's position
+        :param target: The (x, y) target cell, e.g. the target item's shelf
+        :return: The cost of the route and the list of (x, y) positions from source to target,
+                 (None, []) if the target can not be reached
+        """
+
+        s, t = self._cell(source), self._cell(target)
+        if s is None or t is None:
+            return None, []
+        if s == t:
+            return 0, [source]
+
+        dist = ({s: 0}, {t: 0})
+        parent = ({s: None}, {t: None})
+        heaps = ([(0, s)], [(0, t)])
+        graphs = (self.forward, self.backward)
+        best = math.inf
+        meet = None
+        while heaps[0] or heaps[1]:
+            # Go on with the side whose smallest distance is lower
+            if not heaps[1] or (heaps[0] and heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            heap = heaps[side]
+            if heap[0][0] >= best:
+                break
+
+            total, cell = heapq.heappop(heap)
+            if total > dist[side][cell]:
+                continue
+            other = dist[1 - side].get(cell)
+            if other is not None and total + other < best:
+                best = total + other
+                meet = cell
+
+            offsets, targets, costs = graphs[side]
+            for index in range(offsets[cell], offsets[cell + 1]):
+                neighbour = targets[index]
+                new_total = total + costs[index]
+                if new_total < dist[side].get(neighbour, math.inf):
+                    dist[side][neighbour] = new_total
+                    parent[side][neighbour] = cell
+                    heapq.heappush(heap, (new_total, neighbour))
+
+        if meet is None:
+            return None, []
+
+        # The edges of the upward route, from source to the meeting cell then down to target
+        cells = []
+        cell = meet
+        while cell is not None:
+            cells.append(cell)
+            cell = parent[0][cell]
+        cells.reverse()
+        cell = parent[1][meet]
+        while cell is not None:
+            cells.append(cell)
+            cell = parent[1][cell]
+
+        path = [cells[0]]
+        for a, b in zip(cells, cells[1:]):
+            self._unpack(a, b, path)
+        return best, [divmod(cell, self.map_col) for cell in path]
+
+    def _unpack(self, a, b, path):
+        """Appends the grid cells of the edge a -> b to the path, after a, replacing the shortcuts by their cells."""
+
+        stack = [(a, b)]
+        while stack:
+            a, b = stack.pop()
+            middle = self.shortcuts.get((a, b))
+            if middle is None:
+                path.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+
+    def save(self, filename):
+        """
+        The save function writes the hierarchy to a binary file: the header, the ranks,
+        the forward and backward upward graphs and the shortcut table, as int32 arrays.
+
+        :param filename: A string representing the name of the file to write
+        """
+
+        shortcuts = array("i")
+        for (a, b), middle in self.shortcuts.items():
+            shortcuts.extend((a, b, middle))
+        with open(filename, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.map_row, self.map_col, len(self.forward[1]),
+                                   len(self.backward[1]), len(self.shortcuts)))
+            self.rank.tofile(file)
+            for part in self.forward + self.backward:
+                part.tofile(file)
+            shortcuts.tofile(file)
+
+    @staticmethod
+    def load(filename):
+        """
+        The load function reads a hierarchy written by save().
+
+        :param filename: A string representing the name of the file to read
+        :return: The ContractionHierarchy
+        """
+
+        def read(file, count):
+            part = array("i")
+            part.fromfile(file, count)
+            return part
+
+        with open(filename, 'rb') as file:
+            magic, version, map_row, map_col, forward_edges, backward_edges, shortcut_count = \
+                HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not a lazy picker contraction hierarchy (version " + str(VERSION) + "): "
+                                 + filename)
+            size = map_row * map_col
+            rank = read(file, size)
+            forward = (read(file, size + 1), read(file, forward_edges), read(file, forward_edges))
+            backward = (read(file, size + 1), read(file, backward_edges), read(file, backward_edges))
+            triples = read(file, 3 * shortcut_count)
+
+        shortcuts = {(triples[i], triples[i + 1]): triples[i + 2] for i in range(0, len(triples), 3)}
+        return ContractionHierarchy(map_row, map_col, rank, forward, backward, shortcuts)
+
+    def nbytes(self):
+        """Returns the size of the arrays of the hierarchy in bytes, without the shortcut dictionary."""
+
+        return sum(part.itemsize * len(part) for part in (self.rank,) + self.forward + self.backward)
+
+
+def benchmark(map_data, queries=200, seed=0):
+    """
+    The benchmark function measures the preprocessing and compares the query time with Map.a_star()
+    and with the exact Map.dial(), both timed with the Map.reset() every query needs.
+    Every route of the hierarchy is checked against the cost found by Map.dial().
+
+    :param map_data: The MapData object
+    :param queries: The number of random (free cell, item) queries
+    :param seed: The seed of the random generator
+    :return: A dictionary of the measures
+    """
+
+    from entities import Worker
+    from service import Map
+
+    tracemalloc.start()
+    start = perf_counter()
+    hierarchy = ContractionHierarchy.build(map_data)
+    build_time = perf_counter() - start
+    build_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    rng = random.Random(seed)
+    blocked = occupancy_grid(map_data)
+    free = [(x, y) for x in range(map_data.map_row) for y in range(map_data.map_col) if not blocked[x, y]]
+    pairs = [(rng.choice(free), rng.choice(map_data.items)) for _ in range(queries)]
+
+    ch_time = 0.0
+    astar_time = 0.0
+    dijkstra_time = 0.0
+    grid = Map(map_data, render=False)
+    for worker_pos, target in pairs:
+        start = perf_counter()
+        cost, path = hierarchy.query(worker_pos, target.pos)
+        ch_time += perf_counter() - start
+
+        # A query of the Map is a reset of the grid and a search
+        map_data.update("worker", Worker(*worker_pos))
+        map_data.update("target", target)
+        start = perf_counter()
+        grid.reset()
+        grid.a_star()
+        astar_time += perf_counter() - start
+
+        start = perf_counter()
+        grid.reset()
+        grid.dial()
+        dijkstra_time += perf_counter() - start
+        if cost != grid.path_cost():
+            raise AssertionError("Route cost " + str(cost) + " differs from Dijkstra " + str(grid.path_cost()))
+
+    return {
+        "cells": map_data.map_row * map_data.map_col,
+        "build_time": build_time,
+        "build_peak": build_peak,
+        "size": hierarchy.nbytes(),
+        "shortcuts": len(hierarchy.shortcuts),
+        "ch_query": ch_time / queries,
+        "astar_query": astar_time / queries,
+        "dijkstra_query": dijkstra_time / queries,
+    }
+
+
+def main():
+    """
+    Command line entry point, build the hierarchy of a map, save it, and run the benchmark.
+    """
+
+    from core import read_map_data
+    from data import MapData
+    from entities import Worker
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Build a contraction hierarchy and benchmark it against A*.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--queries", type=int, default=200, help="the number of random queries")
+    parser.add_argument("--output", help="save the hierarchy to this file")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+    else:
+        items, shelves = read_map_data(args.data)
+        map_data = MapData(Worker(0, 0), shelves, items, items[0])
+
+    if args.output:
+        ContractionHierarchy.build(map_data).save(args.output)
+
+    result = benchmark(map_data, args.queries)
+    print("Cells:                  ", result["cells"])
+    print("Preprocessing time (s): ", "{:.2f}".format(result["build_time"]))
+    print("Preprocessing peak (MB):", "{:.1f}".format(result["build_peak"] / 1024 / 1024))
+    print("Hierarchy arrays (KB):  ", "{:.1f}".format(result["size"] / 1024))
+    print("Shortcuts:              ", result["shortcuts"])
+    print("CH query (ms):          ", "{:.3f}".format(result["ch_query"] * 1000))
+    print("A* query (ms):          ", "{:.3f}".format(result["astar_query"] * 1000))
+    print("Dijkstra query (ms):    ", "{:.3f}".format(result["dijkstra_query"] * 1000))
+    print("Speedup over A*:        ", "{:.1f}x".format(result["astar_query"] / result["ch_query"]))
+    print("Speedup over Dijkstra:  ", "{:.1f}x".format(result["dijkstra_query"] / result["ch_query"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+"""--------------------------------------------------------
+    Headless routing core.
+    The data model and the searches, without the interactive menus and the terminal rendering:
+    reading the item data and cost map, building the MapData and the Map, and routing to items.
+    Only the standard library modules the searches need are imported, so a short-lived process
+    that routes a few items starts quickly; lazy_picker (the interactive program), display (the terminal
+    rendering) and the benchmarks are never loaded. `python startup.py` measures the import and first-query times.
+
+    Command line: python core.py [--data FILE] [--catalogue] [--resolution N] [--algorithm NAME] X Y ITEM_ID ...
+    prints one line per item: the item id, the length of the route from (X, Y) and its cells as x,y pairs,
+    or the item id and 'none' if it is not stocked or can not be reached.
+    --------------------------------------------------------"""
+
+import os
+import sys
+
+from data import Algorithm, MapData
+from entities import Item, Shelf, Worker, to_cell
+from service import Map
+
+# The QVBox item data and the size of its floor, in units
+DATA_FILE = 'qvBox-warehouse-data-s23-v01.txt'
+FLOOR_ROWS = 40
+FLOOR_COLS = 21
+
+USAGE = ("usage: python core.py [--data FILE] [--catalogue] [--resolution N] [--algorithm NAME] "
+         "X Y ITEM_ID [ITEM_ID ...]")
+
+
+def read_map_data(filename, resolution=1):
+    """Reads the map data from the given file.
+    It first generates a list of items by reading the file line by line.
+    Then it generates a list of shelves by calling the gen_shelves function.
+
+    :param filename: A string representing the name of the file to read from.
+    :param resolution: The number of grid cells per unit of the coordinates, e.g. 5 keeps the bays at 10.2 and
+                       10.4 on separate shelves.
+    :return: items and shelves generated from the data in the file.
+    """
+
+    items = []
+    with open(filename, 'r') as file:
+        # Skip the first line of the file
+
+        next(file)
+        # Read the file line by line
+        for line in file:
+            data = line.strip().split()
+            item = Item(int(data[0]), float(data[1]), float(data[2]), resolution)
+
+            items.append(item)
+
+    shelves = gen_shelves(items)
+
+    return items, shelves
+
+
+def cost_map_path(filename):
+    """Returns the name of the cost-map file that goes with the given item data file.
+    It sits next to the item data, with '-costs' added before the extension.
+
+    :param filename: A string representing the name of the item data file.
+    :return: A string representing the name of the cost-map file.
+    """
+
+    root, ext = os.path.splitext(filename)
+    return root + "-costs" + ext
+
+
+def read_cost_map(filename, resolution=1):
+    """Reads the per-cell costs from the given cost-map file.
+    The file has a header line, then one line per cell: x-coordinate, y-coordinate and the integer cost of
+    stepping into the cell (e.g. 3 for a congested aisle). The cells not listed in the file cost 1.
+
+    :param filename: A string representing the name of the file to read from.
+    :param resolution: The number of grid cells per unit, each unit cell of the file covers resolution x resolution
+                       cells of the grid.
+    :return: A dictionary of the costs, {(x, y): cost}
+    """
+
+    costs = {}
+    with open(filename, 'r') as file:
+        # Skip the first line of the file
+        next(file)
+        for line in file:
+            data = line.strip().split()
+            if not data:
+                continue
+            cost = int(data[2])
+            if cost < 1:
+                raise ValueError("The cost of cell (" + data[0] + ", " + data[1] + ") must be at least 1")
+            x, y = to_cell(data[0], resolution), to_cell(data[1], resolution)
+            for dx in range(resolution):
+                for dy in range(resolution):
+                    costs[(x + dx, y + dy)] = cost
+
+    return costs
+
+
+def gen_shelves(items):
+    """
+    The gen_shelves function takes in a list of items and returns a list of shelves.
+    The function first sorts the items by their position (x-coordinate, y-coordinate).
+    It then iterates through the sorted list, if the current item has the same position as the previous item,
+    it adds the item to the existing shelf. Otherwise, it creates a new shelf and adds the item to the shelf.
+
+    :param items: A list of items read from the database file(from read_map_data function)
+    :return: A list of shelves generated from the list of items
+    """
+
+    temp = list(items)
+    # Sort the items by their position
+    temp.sort(key=lambda item: item.pos)
+    index = 0
+
+    pre = temp[0]
+    shelf = Shelf(index, pre.pos[0], pre.pos[1])
+    shelf.add_item(pre)
+    shelves = [shelf]
+    # Iterate through the sorted list of items
+    for i in range(1, len(temp)):
+
+        curr = temp[i]
+        # If the current item has the same position as the previous item, add the item to the existing shelf
+        if curr.pos == pre.pos:
+            i += 1
+            shelf.add_item(curr)
+        # Otherwise, create a new shelf and add the item to the shelf
+        else:
+            pre = curr
+            index += 1
+
+            shelf = Shelf(index, pre.pos[0], pre.pos[1])
+            shelf.add_item(pre)
+            shelves.append(shelf)
+
+    return shelves
+
+
+def gen_item_index(items):
+    """
+    The gen_item_index function builds the index of every location of each item.
+    The same product can be stocked in several bays, each bay is a separate row of the data file.
+
+    :param items: A list of items read from the database file(from read_map_data function)
+    :return: A dictionary of the locations, {item_id: [(x, y), ...]}
+    """
+
+    index = {}
+    for item in items:
+        locations = index.setdefault(item.item_id, [])
+        if item.pos not in locations:
+            locations.append(item.pos)
+    return index
+
+
+def find_item(items, item_id):
+    """
+    The find_item function returns the first item with the given id.
+    An ItemCatalogue is searched by binary search, a list of items is scanned.
+
+    :param items: The list of all items, or an ItemCatalogue
+    :param item_id: The id of the item
+    :return: The item, or None if there is no item with that id
+    """
+
+    # The catalogue module is not imported for the check, a catalogue is the one with a find method
+    if hasattr(items, "find"):
+        return items.find(item_id)
+    for item in items:
+        if item.item_id == item_id:
+            return item
+    return None
+
+
+def load_map_data(filename=DATA_FILE, worker=(0, 0), resolution=1, map_row=FLOOR_ROWS, map_col=FLOOR_COLS,
+                  use_catalogue=False):
+    """
+    API entry point, load the map data of an item data file with its item index,
+    and its cost map if one sits next to it. The first item is the target.
+    With the catalogue, the items are memory-mapped from the binary catalogue instead of parsed,
+    which makes the first query of a process much faster once the catalogue is built.
+
+    :param filename: The name of the item data file
+    :param worker: The (x, y) position of the worker, in units
+    :param resolution: The number of grid cells per unit of the coordinates
+    :param map_row: The size of the floor along x, in units
+    :param map_col: The size of the floor along y, in units
+    :param use_catalogue: Whether to keep the items in a memory-mapped catalogue, see catalogue.py
+    :return: A MapData object
+    """
+
+    if use_catalogue:
+        # Imported here, only the processes that use the catalogue load it
+        from catalogue import load_catalogue
+        items, shelves = load_catalogue(filename, resolution)
+        item_index = items
+    else:
+        items, shelves = read_map_data(filename, resolution)
+        item_index = gen_item_index(items)
+    costs = None
+    if os.path.exists(cost_map_path(filename)):
+        costs = read_cost_map(cost_map_path(filename), resolution)
+    return MapData(Worker(worker[0] * resolution, worker[1] * resolution), shelves, items, items[0],
+                   map_row=map_row * resolution, map_col=map_col * resolution, costs=costs,
+                   item_index=item_index, resolution=resolution)
+
+
+def route(grid_map, item_id, algorithm=None):
+    """
+    API entry point, route the worker of the map to an item.
+    Without an algorithm, the route goes to the nearest location of the item in one search,
+    otherwise the algorithm is run to its first location.
+
+    :param grid_map: The Map, built with render=False
+    :param item_id: The id of the item
+    :param algorithm: An Algorithm, or None
+    :return: The list of (x, y) cells of the route, or None if the item is not stocked or can not be reached
+    """
+
+    locations = grid_map.map_data.get_locations(item_id)
+    if not locations:
+        return None
+    # The target of the map data is the item in both modes, a search never stops at the previous item
+    grid_map.map_data.update("target", Item(item_id, *locations[0]))
+    if algorithm is None:
+        path = grid_map.nearest_location(locations)
+    else:
+        grid_map.reset()
+        path = grid_map.search(algorithm)
+    return [block.pos for block in path] if path else None
+
+
+def _parse_args(argv):
+    """Parses the command line, see the module docstring. argparse is not used, it costs more than the routing."""
+
+    options = {"--data": DATA_FILE, "--resolution": "1", "--algorithm": None}
+    use_catalogue = False
+    values = []
+    args = iter(argv)
+    for arg in args:
+        if arg in options:
+            options[arg] = next(args, None)
+            if options[arg] is None:
+                raise ValueError(arg + " expects a value")
+        elif arg == "--catalogue":
+            use_catalogue = True
+        elif arg.startswith("--"):
+            raise ValueError("unknown option " + arg)
+        else:
+            values.append(int(arg))
+    if len(values) < 3:
+        raise ValueError("expected the position X Y of the worker and at least one item id")
+    algorithm = None
+    if options["--algorithm"] is not None:
+        name = options["--algorithm"].upper().replace("*", "_STAR").replace("-", "_")
+        if name not in Algorithm.__members__:
+            raise ValueError("unknown algorithm " + options["--algorithm"])
+        algorithm = Algorithm[name]
+    return options["--data"], use_catalogue, int(options["--resolution"]), algorithm, values[:2], values[2:]
+
+
+def main():
+    """
+    Command line entry point, print the route from a position to each item.
+    """
+
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(USAGE)
+        print("Algorithms: " + ", ".join(algorithm.name.lower() for algorithm in Algorithm)
+              + ", default to the nearest location of each item")
+        return
+    try:
+        data_file, use_catalogue, resolution, algorithm, worker, item_ids = _parse_args(sys.argv[1:])
+    except ValueError as error:
+        print(USAGE, file=sys.stderr)
+        print("error: " + str(error), file=sys.stderr)
+        sys.exit(2)
+
+    grid_map = Map(load_map_data(data_file, worker, resolution, use_catalogue=use_catalogue), render=False)
+    lines = []
+    for item_id in item_ids:
+        path = route(grid_map, item_id, algorithm)
+        if path is None:
+            lines.append(str(item_id) + " none")
+        else:
+            lines.append(str(item_id) + " " + str(len(path) - 1) + " " + " ".join(
+                str(x) + "," + str(y) for x, y in path))
+    print("\n".join(lines))
+
+
+if __name__ == '__main__':
+    main()
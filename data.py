@@ -1,31 +1,68 @@
-import json
 from enum import unique, Enum
 
 
 @unique
 class Algorithm(Enum):
     """An enumeration of the different algorithms that can be used to solve the problem.
-        0: A*, 1: BFS, 2: DFS, 3: Dijkstra
+        0: A*, 1: BFS, 2: DFS, 3: Dijkstra, 4: Dial (bucket-queue Dijkstra for weighted maps)
     """
     A_STAR = 0
     BFS = 1
     DFS = 2
     DIJKSTRA = 3
+    DIAL = 4
 
 
 class MapData:
     """A class to store the data for the map."""
 
-    def __init__(self, worker, shelves, items, target, algorithm=Algorithm.A_STAR, map_row=40, map_col=21):
+    def __init__(self, worker, shelves, items, target, algorithm=Algorithm.A_STAR, map_row=40, map_col=21,
+                 costs=None, item_index=None, resolution=1):
         self.worker_org = worker.pos
         self.map_row = map_row
         self.map_col = map_col
+        # The number of grid cells per unit of the data file coordinates, the map size is in cells
+        self.resolution = resolution
+        # Bumped whenever the shelves, items or costs change, so the structures built on them know to update
+        self.version = 0
         self.worker = worker
         self.shelves = shelves
         self.items = items
         self.target = target
         self.target_pos = target.pos
         self.algorithm = algorithm
+        # Per-cell cost of stepping into a cell, {(x, y): cost}, cells not listed cost 1
+        self.costs = costs
+        # Every location of each item, {item_id: [(x, y), ...]}, see core.gen_item_index()
+        self.item_index = item_index
+
+    @staticmethod
+    def from_snapshot(filename, worker=None, target=None, verify=True):
+        """
+        The from_snapshot function loads the map data from a preprocessed snapshot, see snapshot.write_snapshot().
+        The file is memory-mapped, the items are not parsed nor sorted again.
+
+        :param filename: A string representing the name of the snapshot file
+        :param worker: The Worker, default to a worker at (0, 0)
+        :param target: The target Item, default to the first item of the snapshot
+        :param verify: Whether to check the checksum of the snapshot
+        :return: A MapData object
+        """
+
+        # Imported here, the snapshot module depends on this one
+        from snapshot import Snapshot
+        return Snapshot(filename, verify).map_data(worker, target)
+
+    def without_items(self):
+        """
+        Returns a copy of the map data without the items and the item index, which the searches do not use,
+        e.g. to send the map to pool processes.
+
+        :return: A MapData object sharing the worker, shelves, target and costs
+        """
+
+        return MapData(self.worker, self.shelves, [], self.target, map_row=self.map_row, map_col=self.map_col,
+                       costs=self.costs, resolution=self.resolution)
 
     def get_map_row(self):
         return self.map_row
@@ -45,6 +82,24 @@ class MapData:
     def get_worker_org(self):
         return self.worker_org
 
+    def get_costs(self):
+        return self.costs
+
+    def get_locations(self, item_id):
+        """
+        The get_locations function returns every position where the item is stocked.
+        Without an item index, only the current target's position is known.
+
+        :param item_id: The id of the item
+        :return: A list of (x, y) positions
+        """
+
+        if self.item_index is not None:
+            return self.item_index.get(item_id, [])
+        if self.target is not None and self.target.item_id == item_id:
+            return [self.target.pos]
+        return []
+
     def update(self, attribute, value):
         """
         The update function takes in an attribute and a value.
@@ -60,10 +115,18 @@ class MapData:
             self.worker = value
         elif attribute == "shelves":
             self.shelves = value
+            self.version += 1
         elif attribute == "items":
             self.items = value
+            self.version += 1
         elif attribute == "target":
             self.target = value
+            self.target_pos = value.pos
+        elif attribute == "costs":
+            self.costs = value
+            self.version += 1
+        elif attribute == "item_index":
+            self.item_index = value
         else:
             print("Invalid attribute")
 
@@ -79,6 +142,9 @@ class MapData:
         :return: A Json String with the map_row, map_col, worker, shelves and items
 
         """
+        # Imported here, json is only needed to export the map
+        import json
+
         return {
             "map_row": self.map_row,
             "map_col": self.map_col,
@@ -0,0 +1,224 @@
+"""--------------------------------------------------------
+    Nearest-available-worker dispatch.
+    Instead of one search per worker, a single reverse search runs from the shelves of the item
+    (every location of the item is a source) and stops at the first worker cell it reaches:
+    that worker is the nearest one, and the successors recorded by the search lead it to the shelf,
+    so its route comes out of the same search. The search is a BFS on a unit-cost map and a Dijkstra
+    on a weighted one, it only touches the cells closer to the item than the nearest worker.
+    --------------------------------------------------------"""
+
+import argparse
+import heapq
+import random
+from collections import deque
+from time import perf_counter
+
+from wavefront import DIRECTIONS, occupancy_grid
+
+
+class Dispatcher:
+    """
+    A class to pick the nearest available worker for a pick, the occupancy grid and the costs are prepared once.
+    Like the Map, the shelves can not be walked through and only the target shelf is entered.
+    """
+
+    def __init__(self, map_data):
+        """
+        :param map_data: The MapData object (shelves, costs and item index)
+        """
+
+        self.map_data = map_data
+        self.map_row = map_data.map_row
+        self.map_col = map_data.map_col
+        self.walkable = (~occupancy_grid(map_data)).ravel().tolist()
+        self.cost = None
+        if map_data.costs:
+            self.cost = [1] * (self.map_row * self.map_col)
+            for (x, y), value in map_data.costs.items():
+                if 0 <= x < self.map_row and 0 <= y < self.map_col:
+                    self.cost[x * self.map_col + y] = value
+
+    def nearest(self, workers, locations):
+        """
+        The nearest function finds the worker nearest to any of the locations and its route, in one search.
+
+        :param workers: The available workers (Worker objects), the first one listed wins a tie on the same cell
+        :param locations: The (x, y) positions of the shelves the item can be picked from
+        :return: A tuple of the worker, its route (list of (x, y) from the worker to the shelf) and its length
+                 (or cost on a weighted map), or None if no worker can reach a location
+        """
+
+        map_col = self.map_col
+        waiting = {}
+        for worker in workers:
+            x, y = worker.pos
+            if 0 <= x < self.map_row and 0 <= y < map_col:
+                waiting.setdefault(x * map_col + y, worker)
+        sources = [x * map_col + y for x, y in locations if 0 <= x < self.map_row and 0 <= y < map_col]
+        if not waiting or not sources:
+            return None
+
+        if self.cost is None:
+            found, dist, successor = self._bfs(sources, waiting)
+        else:
+            found, dist, successor = self._dijkstra(sources, waiting)
+        if found is None:
+            return None
+
+        route = []
+        cell = found
+        while cell is not None:
+            route.append(divmod(cell, map_col))
+            cell = successor[cell]
+        return waiting[found], route, dist[found]
+
+    def dispatch(self, workers, item_id):
+        """
+        API entry point, pick the nearest available worker for an item of the item index.
+
+        :param workers: The available workers
+        :param item_id: The id of the item
+        :return: See nearest(), None if the item is not stocked or can not be reached
+        """
+
+        return self.nearest(workers, self.map_data.get_locations(item_id))
+
+    def _bfs(self, sources, waiting):
+        """The reverse BFS of a unit-cost map, returns the first worker cell reached, the distances and successors."""
+
+        map_row, map_col, walkable = self.map_row, self.map_col, self.walkable
+        dist = {}
+        successor = {}
+        for source in sources:
+            dist[source] = 0
+            successor[source] = None
+        frontier = deque(sources)
+        while frontier:
+            cell = frontier.popleft()
+            if cell in waiting:
+                return cell, dist, successor
+            x, y = divmod(cell, map_col)
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < map_row and 0 <= ny < map_col:
+                    neighbour = nx * map_col + ny
+                    # Only free cells are walked through, the shelves are the sources
+                    if neighbour not in dist and walkable[neighbour]:
+                        dist[neighbour] = dist[cell] + 1
+                        successor[neighbour] = cell
+                        frontier.append(neighbour)
+        return None, dist, successor
+
+    def _dijkstra(self, sources, waiting):
+        """The reverse Dijkstra of a weighted map, stepping from a cell to the next one costs the next cell."""
+
+        map_row, map_col, walkable, cost = self.map_row, self.map_col, self.walkable, self.cost
+        dist = {}
+        successor = {}
+        for source in sources:
+            dist[source] = 0
+            successor[source] = None
+        heap = [(0, source) for source in sources]
+        heapq.heapify(heap)
+        while heap:
+            total, cell = heapq.heappop(heap)
+            if total != dist[cell]:
+                continue  # Skip the stale heap entries
+            if cell in waiting:
+                return cell, dist, successor
+            x, y = divmod(cell, map_col)
+            # The forward route steps from the neighbour into this cell and pays its cost
+            new_total = total + cost[cell]
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < map_row and 0 <= ny < map_col:
+                    neighbour = nx * map_col + ny
+                    if walkable[neighbour] and (neighbour not in dist or new_total < dist[neighbour]):
+                        dist[neighbour] = new_total
+                        successor[neighbour] = cell
+                        heapq.heappush(heap, (new_total, neighbour))
+        return None, dist, successor
+
+
+def benchmark(map_data, workers=300, queries=50, seed=0):
+    """
+    The benchmark function compares the single reverse search with one A* search per worker,
+    on random worker positions and random items, and checks that both find the same distance.
+
+    :param map_data: The MapData object, with an item index
+    :param workers: The number of available workers
+    :param queries: The number of picks to dispatch
+    :param seed: The seed of the random generator
+    :return: A dictionary per method of the mean time per pick in seconds, and the number of disagreements
+    """
+
+    from entities import Item, Worker
+    from service import Map
+
+    rng = random.Random(seed)
+    shelves = {shelf.pos for shelf in map_data.shelves}
+    free = [(x, y) for x in range(map_data.map_row) for y in range(map_data.map_col) if (x, y) not in shelves]
+    dispatcher = Dispatcher(map_data)
+    grid = Map(map_data, render=False)
+    times = {"reverse search": 0.0, "a_star per worker": 0.0}
+    mismatches = 0
+    for _ in range(queries):
+        pool = [Worker(*rng.choice(free)) for _ in range(workers)]
+        item = rng.choice(map_data.items)
+        locations = map_data.get_locations(item.item_id)
+
+        start = perf_counter()
+        found = dispatcher.nearest(pool, locations)
+        times["reverse search"] += perf_counter() - start
+
+        start = perf_counter()
+        best = None
+        for worker in pool:
+            for location in locations:
+                map_data.update("worker", worker)
+                map_data.update("target", Item(item.item_id, location[0], location[1]))
+                grid.reset()
+                if grid.a_star() and (best is None or grid.path_cost() < best):
+                    best = grid.path_cost()
+        times["a_star per worker"] += perf_counter() - start
+        if (found[2] if found else None) != best:
+            mismatches += 1
+
+    return {"times": {method: total / queries for method, total in times.items()}, "mismatches": mismatches}
+
+
+def main():
+    """
+    Command line entry point, compare the dispatch search with one search per worker on the QVBox map
+    or a synthetic map.
+    """
+
+    from core import gen_item_index, read_map_data
+    from data import MapData
+    from entities import Worker
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Dispatch picks to the nearest available worker.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--workers", type=int, default=300, help="the number of available workers")
+    parser.add_argument("--queries", type=int, default=20, help="the number of picks to dispatch")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+    else:
+        items, shelves = read_map_data(args.data)
+        map_data = MapData(Worker(0, 0), shelves, items, items[0])
+    map_data.update("item_index", gen_item_index(map_data.items))
+
+    result = benchmark(map_data, args.workers, args.queries)
+    print("{} workers, {} picks, {} disagreements".format(args.workers, args.queries, result["mismatches"]))
+    print("{:<20} {:>16}".format("Method", "Mean time (ms)"))
+    for method, elapsed in result["times"].items():
+        print("{:<20} {:>16.3f}".format(method, 1000 * elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""--------------------------------------------------------
+    Terminal rendering of the map.
+    The map is drawn with one emoji per node, the screen is cleared between the steps of a search.
+    Only the interactive program and the search trace replay load this module, see Map.visualize().
+    --------------------------------------------------------"""
+
+import os
+
+from service import NodeState
+
+
+def draw_map(state_at, map_row, map_col):
+    """A function to print a map in the terminal, see Map.visualize().
+    It only needs the state of each node, so a replayed search trace is printed the same way as a live search.
+
+    :param state_at: A function returning the NodeState of the node at (x, y)
+    :param map_row: The number of rows of the map (size of the x-axis)
+    :param map_col: The number of columns of the map (size of the y-axis)
+    """
+
+    print_banner()
+    # Print the map
+    for y in range(map_col - 1, -1, -1):
+        # Print the y-axis index
+        # if the y-axis index is less than 10, then print the index with 2 spaces
+        if 0 <= y < 10:
+            print(y, end="  ")
+        # if the y-axis index is more than 10, then print the index with 1 space
+        elif y >= 10:
+            print(y, end=" ")
+        # Print the map content
+        for x in range(map_row):
+            state = state_at(x, y)
+            if state == NodeState.GOAL:
+                print("\U0001F3AF", end=" ")
+            elif state == NodeState.START:
+                print("\U0001F680", end=" ")
+            elif state == NodeState.BLOCK:
+                print("\U0001F6AA", end=" ")
+            elif state == NodeState.PATH:
+                print("\U0001F7E9", end=" ")
+            elif state == NodeState.CLOSE:
+                print("\U0001F534", end=" ")
+            elif state == NodeState.OPEN:
+                print("\U0001F50E", end=" ")
+                # print("\U0001F7E9", end=" ")
+            else:
+                print("\U0001F518", end=" ")
+                # print("\U0001F535", end=" ")
+        print()
+    # Print the x-axis index
+    for i in range(map_row + 1):
+        # Empty space for the left bottom corner
+        if i == 0:
+            print(" ", end="  ")
+        # Print the x-axis index
+        elif 0 < i < 10:
+            print(i - 1, end="  ")
+        elif i >= 10:
+            print(i - 1, end=" ")
+    print()
+    print()
+    print("'\U0001F680': is the start point, '\U0001F3AF': is where your target item located, "
+          "'\U0001F6AA' is the block")
+    print("'\U0001F7E9' is the path, '\U0001F50E': is in the node will be searched. "
+          "'\U0001F534' is the node has been searched")
+
+
+def refresh():
+    """A function to clear the screen by using the os.system() function.
+    :return: None
+    """
+
+    os.system('cls' if os.name == 'nt' else 'clear')
+
+
+def print_banner():
+    """ Used to print the banner."""
+
+    print()
+    print("--------------------------------------------------------------------------------------------------------")
+    print("▄▀▀▀▀▄      ▄▀▀█▄   ▄▀▀▀▀▄   ▄▀▀▄ ▀▀▄      ▄▀▀▄▀▀▀▄  ▄▀▀█▀▄    ▄▀▄▄▄▄   ▄▀▀▄ █  ▄▀▀█▄▄▄▄  ▄▀▀▄▀▀▀▄")
+    print("█    █      ▐ ▄▀ ▀▄ █     ▄▀ █   ▀▄ ▄▀     █   █   █ █   █  █  █ █    ▌ █  █ ▄▀ ▐  ▄▀   ▐ █   █   █")
+    print("▐    █        █▄▄▄█ ▐ ▄▄▀▀   ▐     █       ▐  █▀▀▀▀  ▐   █  ▐  ▐ █      ▐  █▀▄    █▄▄▄▄▄  ▐  █▀▀█▀ ")
+    print("    █        ▄▀   █   █            █          █          █       █        █   █   █    ▌   ▄▀    █ ")
+    print("  ▄▀▄▄▄▄▄▄▀ █   ▄▀     ▀▄▄▄▄▀    ▄▀         ▄▀        ▄▀▀▀▀▀▄   ▄▀▄▄▄▄▀ ▄▀   █   ▄▀▄▄▄▄   █     █ ")
+    print("  █         ▐   ▐          ▐     █         █         █       █ █     ▐  █    ▐   █    ▐   ▐     ▐ ")
+    print("  ▐                              ▐         ▐         ▐       ▐ ▐        ▐        ▐            ")
+    print("--------------------------------------------------------------------------------------------------------")
+    print()
@@ -6,14 +6,29 @@ class Entity:
         self.pos = (x, y)
 
 
+def to_cell(value, resolution=1):
+    """
+    The to_cell function returns the grid cell of a coordinate of the data file.
+    The coordinate is scaled by the resolution (cells per unit) and truncated,
+    a tiny tolerance keeps e.g. 10.2 at 5 cells per unit on cell 51 despite the rounding of 10.2 * 5.
+
+    :param value: The coordinate, a number or a string
+    :param resolution: The number of grid cells per unit of the coordinates
+    :return: The cell index
+    """
+
+    return int(float(value) * resolution + 1e-9)
+
+
 class Item:
     """ A class to represent an item in the warehouse. """
 
-    def __init__(self, item_id, x, y):
+    def __init__(self, item_id, x, y, resolution=1):
         self.x = x
         self.y = y
         self.item_id = item_id
-        self.pos = (int(float(self.x)), int(float(self.y)))
+        # The position is a cell of the grid, a finer resolution keeps the fractional bays apart
+        self.pos = (to_cell(self.x, resolution), to_cell(self.y, resolution))
 
     def __str__(self):
         return "Item ID: " + str(self.item_id) + " \t" + "X: " + str(self.x) + "\t" + "Y: " + str(self.y) + "\t"\
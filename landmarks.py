@@ -0,0 +1,222 @@
+"""--------------------------------------------------------
+    ALT (A*, Landmarks, Triangle inequality) heuristics.
+    The BFS distances from K landmark cells to every cell are computed once with the wavefront.
+    For any landmark L, |d(L, t) - d(L, v)| <= d(v, t), so the largest of these bounds over the landmarks
+    is an admissible heuristic that knows about the aisles, unlike the Euclidean distance.
+    --------------------------------------------------------"""
+
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+
+from service import FACTOR
+from wavefront import DIRECTIONS, UNREACHABLE, distance_transform, occupancy_grid
+
+# Landmark selection strategies
+FARTHEST = "farthest"
+RANDOM = "random"
+CORNERS = "corners"
+
+
+class Landmarks:
+    """
+    A class to represent the landmarks of a map and their BFS distance fields,
+    kept in one (K, map_row, map_col) int32 array.
+    """
+
+    def __init__(self, map_data, count=8, strategy=FARTHEST, seed=0):
+        self.blocked = occupancy_grid(map_data)
+        self.map_row, self.map_col = self.blocked.shape
+        self.positions = []
+        fields = []
+
+        rng = random.Random(seed)
+        free = np.argwhere(~self.blocked)
+        if strategy == RANDOM:
+            picks = rng.sample(range(len(free)), min(count, len(free)))
+            for index in picks:
+                self.positions.append(tuple(int(value) for value in free[index]))
+                fields.append(distance_transform(self.blocked, self.positions[-1])[0])
+        elif strategy == CORNERS:
+            # The free cells closest to the corners and the middles of the sides
+            anchors = [(0, 0), (self.map_row - 1, self.map_col - 1), (0, self.map_col - 1), (self.map_row - 1, 0),
+                       (self.map_row // 2, 0), (self.map_row // 2, self.map_col - 1),
+                       (0, self.map_col // 2), (self.map_row - 1, self.map_col // 2)]
+            for anchor in anchors[:count]:
+                nearest = free[np.abs(free - np.array(anchor)).sum(axis=1).argmin()]
+                self.positions.append(tuple(int(value) for value in nearest))
+                fields.append(distance_transform(self.blocked, self.positions[-1])[0])
+        elif strategy == FARTHEST:
+            # Start from a random free cell, each next landmark is the cell farthest from the ones already picked
+            first = tuple(int(value) for value in free[rng.randrange(len(free))])
+            start_field = distance_transform(self.blocked, first)[0]
+            nearest = np.where(start_field >= 0, start_field, -1)
+            nearest[self.blocked] = -1
+            for _ in range(count):
+                pos = np.unravel_index(int(nearest.argmax()), nearest.shape)
+                self.positions.append((int(pos[0]), int(pos[1])))
+                field = distance_transform(self.blocked, self.positions[-1])[0]
+                fields.append(field)
+                nearest = np.where(field >= 0, np.minimum(nearest, field), nearest)
+                nearest[self.blocked] = -1
+        else:
+            raise ValueError("Unknown landmark strategy: " + str(strategy))
+
+        self.dist = np.stack(fields).astype(np.int32)
+
+    @staticmethod
+    def from_arrays(blocked, positions, dist):
+        """
+        Returns landmarks over existing arrays, e.g. views of shared memory, without computing the fields.
+
+        :param blocked: The (map_row, map_col) occupancy grid
+        :param positions: The (x, y) positions of the landmarks
+        :param dist: The (K, map_row, map_col) int32 distance fields
+        :return: The Landmarks
+        """
+
+        landmarks = Landmarks.__new__(Landmarks)
+        landmarks.blocked = blocked
+        landmarks.map_row, landmarks.map_col = blocked.shape
+        landmarks.positions = [tuple(int(value) for value in pos) for pos in positions]
+        landmarks.dist = dist
+        return landmarks
+
+    def _bound(self, pos):
+        """Returns the ALT lower bound from every cell to a free cell, as a (map_row, map_col) array."""
+
+        x, y = pos
+        to_target = self.dist[:, x, y][:, None, None]
+        known = (self.dist != UNREACHABLE) & (to_target != UNREACHABLE)
+        bounds = np.where(known, np.abs(to_target - self.dist), 0)
+        return bounds.max(axis=0)
+
+    def table(self, target):
+        """
+        The table function builds the heuristic table of a target for Map.use_heuristic_table().
+        The triangle inequality only holds between walkable cells, so the bound to a shelf is
+        one step more than the smallest bound to the free cells next to it.
+
+        :param target: The (x, y) position of the target
+        :return: A (map_row, map_col) int32 array of lower bounds of the distance to the target
+        """
+
+        x, y = target
+        if not self.blocked[x, y]:
+            return self._bound(target).astype(np.int32)
+
+        access = [(x + dx, y + dy) for dx, dy in DIRECTIONS
+                  if 0 <= x + dx < self.map_row and 0 <= y + dy < self.map_col and not self.blocked[x + dx, y + dy]]
+        if not access:
+            return np.zeros((self.map_row, self.map_col), dtype=np.int32)
+        return (np.minimum.reduce([self._bound(pos) for pos in access]) + 1).astype(np.int32)
+
+    def use(self, grid_map):
+        """Lets A* on the given Map use the landmark heuristic of its current target."""
+
+        grid_map.use_heuristic_table(self.table(grid_map.target_block.pos))
+
+    def nbytes(self):
+        """Returns the size of the distance fields in bytes."""
+
+        return self.dist.nbytes
+
+
+def euclidean_table(map_data, target, factor=1):
+    """Returns the (scaled) Euclidean distance from every cell to the target, as a heuristic table."""
+
+    xs, ys = np.indices((map_data.map_row, map_data.map_col))
+    return factor * np.sqrt((xs - target[0]) ** 2 + (ys - target[1]) ** 2)
+
+
+def measure(map_data, queries=200, count=8, strategy=FARTHEST, seed=0):
+    """
+    The measure function compares the nodes A* expands with the Euclidean heuristics and with ALT.
+    The default Map heuristic is FACTOR times the Euclidean distance, it expands few nodes but the paths are
+    not always the shortest, the admissible Euclidean distance (factor 1) is the fair comparison for ALT.
+
+    :param map_data: The MapData object
+    :param queries: The number of random (free cell, item) queries
+    :param count: The number of landmarks
+    :param strategy: The landmark selection strategy
+    :param seed: The seed of the random generator
+    :return: A dictionary per heuristic of the mean nodes expanded, mean path length and total search time
+    """
+
+    from entities import Worker
+    from service import Map
+
+    start = perf_counter()
+    landmarks = Landmarks(map_data, count, strategy, seed)
+    build_time = perf_counter() - start
+
+    rng = random.Random(seed)
+    free = [tuple(int(value) for value in pos) for pos in np.argwhere(~landmarks.blocked)]
+    pairs = [(rng.choice(free), rng.choice(map_data.items)) for _ in range(queries)]
+    heuristics = {
+        "Euclidean x" + str(FACTOR) + " (default)": lambda target: None,
+        "Euclidean": lambda target: euclidean_table(map_data, target),
+        "ALT": landmarks.table,
+    }
+
+    results = {}
+    grid = Map(map_data, render=False)
+    for name, table_of in heuristics.items():
+        expanded = length = 0
+        elapsed = 0.0
+        for worker_pos, target in pairs:
+            map_data.update("worker", Worker(*worker_pos))
+            map_data.update("target", target)
+            grid.reset()
+            start = perf_counter()
+            grid.use_heuristic_table(table_of(target.pos))
+            grid.a_star()
+            elapsed += perf_counter() - start
+            expanded += grid.iteration
+            length += len(grid.path) - 1
+        results[name] = {"expanded": expanded / queries, "length": length / queries, "time": elapsed}
+
+    results["build_time"] = build_time
+    results["size"] = landmarks.nbytes()
+    return results
+
+
+def main():
+    """
+    Command line entry point, measure the node expansions with ALT on the QVBox map or a synthetic map.
+    """
+
+    from core import read_map_data
+    from data import MapData
+    from entities import Worker
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Measure the node expansions of A* with ALT landmark heuristics.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--landmarks", type=int, default=8, help="the number of landmarks")
+    parser.add_argument("--strategy", default=FARTHEST, choices=(FARTHEST, RANDOM, CORNERS),
+                        help="the landmark selection strategy")
+    parser.add_argument("--queries", type=int, default=200, help="the number of random queries")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+    else:
+        items, shelves = read_map_data(args.data)
+        map_data = MapData(Worker(0, 0), shelves, items, items[0])
+
+    results = measure(map_data, args.queries, args.landmarks, args.strategy)
+    print("Landmarks:", args.landmarks, "(" + args.strategy + "),",
+          "built in {:.3f} s, {:.1f} KB".format(results.pop("build_time"), results.pop("size") / 1024))
+    print("{:<24} {:>14} {:>14} {:>12}".format("Heuristic", "Mean expanded", "Mean length", "Time (s)"))
+    for name, result in results.items():
+        print("{:<24} {:>14.1f} {:>14.2f} {:>12.3f}".format(name, result["expanded"], result["length"],
+                                                             result["time"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,74 +1,14 @@
+import argparse
+import itertools
+import os
 import sys
+from enum import Enum, unique
 
+from core import cost_map_path, find_item, gen_item_index, read_cost_map, read_map_data
 from data import Algorithm, MapData
-from entities import Item, Shelf, Worker
-from service import Map, print_banner, refresh
-
-
-def read_map_data(filename):
-    """Reads the map data from the given file.
-    It first generates a list of items by reading the file line by line.
-    Then it generates a list of shelves by calling the gen_shelves function.
-
-    :param filename: A string representing the name of the file to read from.
-    :return: items and shelves generated from the data in the file.
-    """
-
-    items = []
-    with open(filename, 'r') as file:
-        # Skip the first line of the file
-
-        next(file)
-        # Read the file line by line
-        for line in file:
-            data = line.strip().split()
-            item = Item(int(data[0]), float(data[1]), float(data[2]))
-
-            items.append(item)
-
-    shelves = gen_shelves(items)
-
-    return items, shelves
-
-
-def gen_shelves(items):
-    """
-    The gen_shelves function takes in a list of items and returns a list of shelves.
-    The function first sorts the items by their position (x-coordinate, y-coordinate).
-    It then iterates through the sorted list, if the current item has the same position as the previous item,
-    it adds the item to the existing shelf. Otherwise, it creates a new shelf and adds the item to the shelf.
-
-    :param items: A list of items read from the database file(from read_map_data function)
-    :return: A list of shelves generated from the list of items
-    """
-
-    temp = list(items)
-    # Sort the items by their position
-    temp.sort(key=lambda item: item.pos)
-    index = 0
-
-    pre = temp[0]
-    shelf = Shelf(index, pre.pos[0], pre.pos[1])
-    shelf.add_item(pre)
-    shelves = [shelf]
-    # Iterate through the sorted list of items
-    for i in range(1, len(temp)):
-
-        curr = temp[i]
-        # If the current item has the same position as the previous item, add the item to the existing shelf
-        if curr.pos == pre.pos:
-            i += 1
-            shelf.add_item(curr)
-        # Otherwise, create a new shelf and add the item to the shelf
-        else:
-            pre = curr
-            index += 1
-
-            shelf = Shelf(index, pre.pos[0], pre.pos[1])
-            shelf.add_item(pre)
-            shelves.append(shelf)
-
-    return shelves
+from display import print_banner, refresh
+from entities import Worker
+from service import Map
 
 
 def get_worker_pos():
@@ -119,14 +59,22 @@ def get_worker_pos():
             print("invalid input")
 
 
-def peek_items(items):
-    """ Prints the items in the list.
-        :param items: The list of all items
+def peek_items(items, page_size=20):
+    """ Prints the items page by page, the next page is only read when the user asks for it.
+        :param items: The list of all items, or an ItemCatalogue
+        :param page_size: The number of items on a page
     """
-    for item in items:
-        print(item)
 
-    input("Press any key to continue:")
+    pages = iter(items)
+    while True:
+        page = list(itertools.islice(pages, page_size))
+        for item in page:
+            print(item)
+        if len(page) < page_size:
+            input("Press any key to continue:")
+            break
+        if input("Press enter to see the next page, or 'q' to stop:") == "q":
+            break
     print()
 
 
@@ -140,46 +88,83 @@ def set_target_item(items):
     :return: The target item
     """
 
-    print()
-    print("Please enter the target item's id:")
-    print("(If you forgot the id, you can press 'p' to see all the items' information)")
-    target_id = input()
-    if target_id.isnumeric():
-        converted_id = int(target_id)
-        for item in items:
-            if item.item_id == converted_id:
+    while True:
+        print()
+        print("Please enter the target item's id:")
+        print("(If you forgot the id, you can press 'p' to see all the items' information)")
+        target_id = input()
+        if target_id.isnumeric():
+            item = find_item(items, int(target_id))
+            if item is not None:
                 print("Target item is:", item)
                 return item
-            else:
-                continue
-        print()
-        print("Cannot find item with that id, please try again!")
+            print()
+            print("Cannot find item with that id, please try again!")
 
-        return set_target_item(items)
+        elif target_id == "p":
+            peek_items(items)
+        else:
+            print("Invalid input")
 
-    elif target_id == "p":
-        peek_items(items)
-        return set_target_item(items)
-    else:
-        print("Invalid input")
-        return set_target_item(items)
+
+def get_worker_cell(resolution=1):
+    """
+    The get_worker_cell function asks for the worker's starting position with get_worker_pos(), in units,
+    and returns the worker on its cell of a grid with the given resolution.
+
+    :param resolution: The number of grid cells per unit of the coordinates
+    :return: A Worker object, on its cell of the grid
+    """
+
+    worker = get_worker_pos()
+    if resolution != 1:
+        worker = Worker(worker.x * resolution, worker.y * resolution)
+    return worker
 
 
-def initialize_data():
+def initialize_data(use_catalogue=False, snapshot=None, resolution=1):
     """
     The initialize_data function reads the data from the database file to get the items and shelves,
     It first calls the read_map_data function to read the data from the file,
     then calls the get_worker_pos function to get the worker's starting position,
     then calls the set_target_item function to get the target item.
+    If a cost-map file sits next to the data file, the per-cell costs are read from it as well.
     finally, it generates a MapData object with the data it got from the previous functions.
+    With a snapshot file, the preprocessed items, shelves and costs are memory-mapped from it instead.
+    With a finer resolution, the map has resolution x resolution cells per unit and the worker's position,
+    given in units, is scaled to its cell.
+
+    :param use_catalogue: Whether to keep the items in a memory-mapped catalogue
+    :param snapshot: The name of a snapshot file built by snapshot.py, or None
+    :param resolution: The number of grid cells per unit of the coordinates
 
     :return: A MapData object, which contains all the data needed to create a map
     """
 
-    items, shelves = read_map_data('qvBox-warehouse-data-s23-v01.txt')
-    worker = get_worker_pos()
+    if snapshot is not None:
+        map_data = MapData.from_snapshot(snapshot)
+        map_data.update("worker", get_worker_cell(map_data.resolution))
+        map_data.update("target", set_target_item(map_data.items))
+        return map_data
+
+    filename = 'qvBox-warehouse-data-s23-v01.txt'
+    if use_catalogue:
+        # Imported here, like core.load_map_data(), only the runs that use the catalogue load it
+        from catalogue import load_catalogue
+        items, shelves = load_catalogue(filename, resolution)
+        item_index = items
+    else:
+        items, shelves = read_map_data(filename, resolution)
+        item_index = gen_item_index(items)
+    # The cost map is optional, without it every cell costs 1
+    costs = None
+    if os.path.exists(cost_map_path(filename)):
+        costs = read_cost_map(cost_map_path(filename), resolution)
+    worker = get_worker_cell(resolution)
     target = set_target_item(items)
-    map_data = MapData(worker, shelves, items, target)
+    # The QVBox floor is 40 x 21 units
+    map_data = MapData(worker, shelves, items, target, map_row=40 * resolution, map_col=21 * resolution,
+                       costs=costs, item_index=item_index, resolution=resolution)
 
     return map_data
 
@@ -210,20 +195,36 @@ def display_welcome():
             print("Invalid input")
 
 
-def find_path(map_data):
+@unique
+class Screen(Enum):
+    """An enumeration of the screens of an interactive session.
+        0: MENU, 1: FIND_PATH, 2: SETTING, 3: EXIT
+    """
+    MENU = 0
+    FIND_PATH = 1
+    SETTING = 2
+    EXIT = 3
+
+
+def find_path(grid):
     """
-    The find_path function takes in a MapData object and prompts the user to select an algorithm.
+    The find_path function takes in the session's Map and prompts the user to select an algorithm.
     It then calls the corresponding function in the Map class.
     If the user input 1, it calls the a_star function in the Map class.
     If the user input 2, it calls the bfs function in the Map class.
     If the user input 3, it calls the dijkstra function in the Map class.
     If the user input 4, it calls the dfs function in the Map class.
+    If the user input 5, it calls the dial function in the Map class.
+    If the user input 6, it calls the nearest_location function in the Map class with every location of the item.
+    If the user input 7, it runs every algorithm on the same query in parallel and prints them side by side.
+    The map is reset after each search, so the same Map is used for every query.
 
-    :param map_data: Pass the MapData object to the function
+    :param grid: The Map object shared by the session
+    :return: The next screen
     """
 
     refresh()
-    grid = Map(map_data)
+    grid.reset()
     grid.visualize(False)
     while True:
         print('-------------------------------------------------------------------------------------------------------')
@@ -231,6 +232,9 @@ def find_path(map_data):
         print("Welcome to the lazy picker for warehouse!")
         print("Press '1' to find path faster(using A *), '2' to find the shortest path(using BFS),")
         print("'3' to find the shortest path in another way(using Dijkstra), '4' to find a longer path(using DFS).")
+        print("'5' to find the cheapest path on a weighted map(using Dial's bucket-queue Dijkstra),")
+        print("'6' to go to the nearest place the item is stocked(one search over all its locations),")
+        print("'7' to compare all the algorithms side by side.")
         print("Press 'r' to return to the main menu")
         print()
         print('-------------------------------------------------------------------------------------------------------')
@@ -249,22 +253,33 @@ def find_path(map_data):
         elif choice == '4':
             grid.dfs()
 
+        elif choice == '5':
+            grid.dial()
+
+        elif choice == '6':
+            grid.nearest_location(grid.map_data.get_locations(grid.target.item_id))
+
+        elif choice == '7':
+            # Imported here, the comparison starts a process pool
+            from compare import compare, format_table
+            print(format_table(compare(grid.map_data)))
+
         elif choice == 'r':
-            display_menu(map_data)
+            return Screen.MENU
 
         else:
             print('Invalid input')
 
-        grid = Map(map_data)
+        grid.reset()
 
 
 def setting(map_data):
     """
-    The setting function prompts the user to enter a new target item or algorithm.
-    It then returns the new map data.
+    The setting function prompts the user to enter a new target item or start point.
+    The new values are set on the map data, the shared Map picks them up on its next reset.
 
     :param map_data: Pass the map data to the function
-    :return: The new map data
+    :return: The next screen
     """
 
     print()
@@ -276,21 +291,20 @@ def setting(map_data):
         choice = input()
         if choice == "1":
             new_target = set_target_item(map_data.items)
-            map_data.target = new_target
+            map_data.update("target", new_target)
 
         elif choice == "2":
-            new_worker = get_worker_pos()
-            map_data.worker = new_worker
+            new_worker = get_worker_cell(map_data.resolution)
+            map_data.update("worker", new_worker)
 
         elif choice == "r":
-            return display_menu(map_data)
+            return Screen.MENU
 
         else:
             print("Invalid input")
-            return setting(map_data)
 
 
-def display_menu(map_data):
+def display_menu():
     """
     Displays the menu for the user to choose from.
     The function will display a list of options and then prompt the user to enter their choice.
@@ -310,27 +324,75 @@ def display_menu(map_data):
         choice = input('Press the corresponding number and enter to continue: ')
 
         if choice == '1':
-            return find_path(map_data)
+            return Screen.FIND_PATH
 
         elif choice == '2':
-            return setting(map_data)
+            return Screen.SETTING
 
         elif choice == '3':
-            print('Exiting program...')
-            sys.exit(0)
+            return Screen.EXIT
 
         else:
             print('Invalid choice. Please try again.')
 
 
+def run_session(map_data):
+    """
+    The run_session function is the loop of an interactive session.
+    Each screen function returns the next screen instead of calling it,
+    so the call stack stays flat however long the session runs.
+    One Map and one item catalogue are shared by every query of the session.
+
+    :param map_data: The MapData object of the session
+    """
+
+    grid = Map(map_data)
+    screen = Screen.MENU
+    while screen != Screen.EXIT:
+        if screen == Screen.MENU:
+            screen = display_menu()
+        elif screen == Screen.FIND_PATH:
+            screen = find_path(grid)
+        elif screen == Screen.SETTING:
+            screen = setting(map_data)
+
+    print('Exiting program...')
+
+
 def main():
     """
     The main function is the entry point of the program.
     """
 
-    display_welcome()
-    map_data = initialize_data()
-    display_menu(map_data)
+    parser = argparse.ArgumentParser(description="Lazy Picker, find the path to an item in the warehouse.")
+    parser.add_argument("--catalogue", action="store_true",
+                        help="keep the items in a memory-mapped catalogue instead of loading them all")
+    parser.add_argument("--snapshot", help="load the preprocessed map from a snapshot file built by snapshot.py")
+    parser.add_argument("--resolution", type=int, default=1,
+                        help="the number of grid cells per unit, e.g. 5 keeps the bays at 10.2 and 10.4 apart")
+    parser.add_argument("--profile", action="store_true",
+                        help="report the memory and allocations of loading the data, the Map and the searches on exit")
+    parser.add_argument("--cprofile", action="store_true", help="with --profile, also report cProfile statistics")
+    args = parser.parse_args()
+
+    if not args.profile:
+        display_welcome()
+        map_data = initialize_data(use_catalogue=args.catalogue, snapshot=args.snapshot,
+                                   resolution=args.resolution)
+        run_session(map_data)
+        return
+
+    # Imported here, the profiling module imports this one
+    import profiling
+
+    with profiling.profile(use_cprofile=args.cprofile, loader=sys.modules[__name__]) as profiler:
+        try:
+            display_welcome()
+            map_data = initialize_data(use_catalogue=args.catalogue, snapshot=args.snapshot,
+                                       resolution=args.resolution)
+            run_session(map_data)
+        finally:
+            print(profiler.report())
 
 
 if __name__ == '__main__':
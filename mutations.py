@@ -0,0 +1,350 @@
+"""--------------------------------------------------------
+    Incremental map mutations with versioned deltas.
+    Restocks and re-slotting change a few items or shelves at a time: the MapEditor applies each change in place
+    (the items, the shelves, the item index, the shelf index and the occupancy grid of the MapData object),
+    bumps the map version and appends the change to a change log.
+    The structures built from the map subscribe to the changes and only update what a change affects,
+    e.g. a TreeCache only drops the trees whose routes go through a new shelf, a Map picks the shelves up on reset().
+    --------------------------------------------------------"""
+
+import argparse
+import random
+from time import perf_counter
+
+from core import gen_item_index
+from entities import Item, Shelf
+from wavefront import occupancy_grid
+
+# Kinds of changes
+ADD_ITEM = "add_item"
+REMOVE_ITEM = "remove_item"
+MOVE_ITEM = "move_item"
+ADD_SHELF = "add_shelf"
+REMOVE_SHELF = "remove_shelf"
+
+
+class Change:
+    """ A class to represent one change of the map, the delta between a version and the previous one. """
+
+    def __init__(self, version, kind, pos, item_id=None, old_pos=None):
+        self.version = version
+        self.kind = kind
+        self.pos = pos
+        self.item_id = item_id
+        self.old_pos = old_pos
+
+    def __str__(self):
+        return "Version " + str(self.version) + ": " + self.kind + " " + (
+            "" if self.item_id is None else "item " + str(self.item_id) + " ") + (
+            "" if self.old_pos is None else "from " + str(self.old_pos) + " to ") + str(self.pos)
+
+    def toJSON(self):
+        return {
+            "version": self.version,
+            "kind": self.kind,
+            "pos": self.pos,
+            "item_id": self.item_id,
+            "old_pos": self.old_pos
+        }
+
+
+class MapEditor:
+    """
+    A class to change the items and shelves of a MapData object in place.
+    The map data keeps its list of items and shelves (a Map built on it reads them again on reset()),
+    its item index is kept up to date, and the editor keeps the shelf index and the occupancy grid.
+    """
+
+    def __init__(self, map_data):
+        """
+        :param map_data: The MapData object, its items must be a list (a memory-mapped catalogue is read-only)
+        """
+
+        if not isinstance(map_data.items, list):
+            raise ValueError("The items of the map are read-only, load them as a list to edit the map")
+        if map_data.item_index is None or not isinstance(map_data.item_index, dict):
+            map_data.update("item_index", gen_item_index(map_data.items))
+
+        self.map_data = map_data
+        self.shelf_index = {shelf.pos: shelf for shelf in map_data.shelves}
+        self.blocked = occupancy_grid(map_data)
+        self.next_shelf_id = max((shelf.shelf_id for shelf in map_data.shelves), default=-1) + 1
+        self.log = []
+        self.listeners = []
+
+    def subscribe(self, listener):
+        """
+        Registers a function called with each Change once it is applied.
+
+        :param listener: A function of one argument, the Change
+        """
+
+        self.listeners.append(listener)
+
+    @property
+    def version(self):
+        """The version of the map, see MapData.version."""
+
+        return self.map_data.version
+
+    def watch_trees(self, cache):
+        """Keeps a TreeCache of the map up to date: the trees a shelf change affects are dropped,
+        the others are kept at the new version."""
+
+        def invalidate(change):
+            if change.kind in (ADD_SHELF, REMOVE_SHELF):
+                cache.invalidate(change.pos, change.kind == ADD_SHELF)
+            cache.advance(change.version)
+
+        self.subscribe(invalidate)
+
+    def changes_since(self, version):
+        """
+        Returns the changes applied after a version, for a structure that was built at that version.
+
+        :param version: The version the structure was built at
+        :return: The list of changes, oldest first
+        """
+
+        # The versions of the log are increasing, the changes after the version are at its end
+        index = len(self.log)
+        while index > 0 and self.log[index - 1].version > version:
+            index -= 1
+        return self.log[index:]
+
+    def _commit(self, kind, pos, item_id=None, old_pos=None):
+        """Bumps the version, logs the change and tells the listeners."""
+
+        self.map_data.version += 1
+        change = Change(self.map_data.version, kind, pos, item_id, old_pos)
+        self.log.append(change)
+        for listener in self.listeners:
+            listener(change)
+        return change
+
+    def _check(self, pos):
+        x, y = pos
+        if not (0 <= x < self.map_data.map_row and 0 <= y < self.map_data.map_col):
+            raise ValueError("The position " + str(pos) + " is out of the map")
+
+    def add_shelf(self, x, y):
+        """
+        The add_shelf function puts a new empty shelf on a free cell.
+
+        :param x: The x-coordinate of the shelf
+        :param y: The y-coordinate of the shelf
+        :return: The new Shelf
+        """
+
+        pos = (x, y)
+        self._check(pos)
+        if pos in self.shelf_index:
+            raise ValueError("There is already a shelf at " + str(pos))
+        if pos == self.map_data.worker.pos:
+            raise ValueError("The worker stands at " + str(pos))
+
+        shelf = Shelf(self.next_shelf_id, x, y)
+        self.next_shelf_id += 1
+        self.map_data.shelves.append(shelf)
+        self.shelf_index[pos] = shelf
+        self.blocked[x, y] = True
+        self._commit(ADD_SHELF, pos)
+        return shelf
+
+    def remove_shelf(self, x, y):
+        """
+        The remove_shelf function takes an empty shelf away, its cell becomes free.
+        The items of a shelf must be moved or removed first.
+
+        :param x: The x-coordinate of the shelf
+        :param y: The y-coordinate of the shelf
+        :return: The Change
+        """
+
+        pos = (x, y)
+        shelf = self.shelf_index.get(pos)
+        if shelf is None:
+            raise ValueError("There is no shelf at " + str(pos))
+        if shelf.items:
+            raise ValueError("The shelf at " + str(pos) + " still holds " + str(len(shelf.items)) + " items")
+
+        self.map_data.shelves.remove(shelf)
+        del self.shelf_index[pos]
+        self.blocked[x, y] = False
+        return self._commit(REMOVE_SHELF, pos)
+
+    def _place(self, item):
+        """Puts an item on the shelf of its position, the shelf is added if the cell is free."""
+
+        shelf = self.shelf_index.get(item.pos)
+        if shelf is None:
+            shelf = self.add_shelf(*item.pos)
+        shelf.add_item(item)
+        self.map_data.items.append(item)
+        locations = self.map_data.item_index.setdefault(item.item_id, [])
+        if item.pos not in locations:
+            locations.append(item.pos)
+
+    def _check_place(self, pos):
+        """Checks that an item can be placed at a position: on the map, on a shelf or on a cell the worker is not on."""
+
+        self._check(pos)
+        if pos not in self.shelf_index and pos == self.map_data.worker.pos:
+            raise ValueError("The worker stands at " + str(pos))
+
+    def _find(self, item_id, pos):
+        """Returns the shelf, the Item and the position of an item, the position defaults to its first location."""
+
+        if pos is None:
+            locations = self.map_data.item_index.get(item_id)
+            if not locations:
+                raise ValueError("There is no item with the id " + str(item_id))
+            pos = locations[0]
+        shelf = self.shelf_index.get(pos)
+        item = shelf.get_item(item_id) if shelf is not None else None
+        if item is None:
+            raise ValueError("There is no item " + str(item_id) + " at " + str(pos))
+        return shelf, item, pos
+
+    def _take(self, item_id, pos):
+        """Takes an item off its shelf, returns the Item."""
+
+        shelf, item, pos = self._find(item_id, pos)
+        shelf.remove_item(item)
+        self.map_data.items.remove(item)
+        # The same product may be stocked twice on a shelf, the location stays while one is left
+        if shelf.get_item(item_id) is None:
+            locations = self.map_data.item_index[item_id]
+            locations.remove(pos)
+            if not locations:
+                del self.map_data.item_index[item_id]
+        return item
+
+    def add_item(self, item_id, x, y):
+        """
+        The add_item function stocks an item at a position, a shelf is added there if the cell is free.
+
+        :param item_id: The id of the item
+        :param x: The x-coordinate of the item (a float, as in the data file)
+        :param y: The y-coordinate of the item
+        :return: The new Item
+        """
+
+        item = Item(item_id, x, y, resolution=self.map_data.resolution)
+        self._check_place(item.pos)
+        self._place(item)
+        self._commit(ADD_ITEM, item.pos, item_id)
+        return item
+
+    def remove_item(self, item_id, pos=None):
+        """
+        The remove_item function takes an item out of the map, its shelf stays.
+
+        :param item_id: The id of the item
+        :param pos: The (x, y) position of the item, default to its first location
+        :return: The removed Item
+        """
+
+        item = self._take(item_id, pos)
+        self._commit(REMOVE_ITEM, item.pos, item_id)
+        return item
+
+    def move_item(self, item_id, x, y, pos=None):
+        """
+        The move_item function re-slots an item to another position, in one change.
+
+        :param item_id: The id of the item
+        :param x: The new x-coordinate of the item
+        :param y: The new y-coordinate of the item
+        :param pos: The (x, y) position the item is moved from, default to its first location
+        :return: The moved Item
+        """
+
+        moved = Item(item_id, x, y, resolution=self.map_data.resolution)
+        # Everything is checked before the item is taken, a failed move leaves the map as it was
+        self._find(item_id, pos)
+        self._check_place(moved.pos)
+        old = self._take(item_id, pos)
+        self._place(moved)
+        self._commit(MOVE_ITEM, moved.pos, item_id, old.pos)
+        return moved
+
+
+def benchmark(map_data, changes=200, trees=50, seed=0):
+    """
+    The benchmark function applies random restocks and shelf changes and compares keeping a TreeCache up to date
+    through the change log with rebuilding the occupancy grid and every cached tree after each change.
+
+    :param map_data: The MapData object, its items must be a list
+    :param changes: The number of changes
+    :param trees: The number of cached trees, rooted at random free cells
+    :param seed: The seed of the random generator
+    :return: A dictionary of the times in seconds and the number of trees rebuilt
+    """
+
+    from path_tree import ShortestPathTree, TreeCache
+
+    rng = random.Random(seed)
+    editor = MapEditor(map_data)
+    free = [(x, y) for x in range(map_data.map_row) for y in range(map_data.map_col) if not editor.blocked[x, y]]
+    starts = rng.sample(free, trees)
+    cache = TreeCache(map_data, capacity=trees)
+    for start in starts:
+        cache.get(start)
+    editor.watch_trees(cache)
+
+    results = {"incremental": 0.0, "rebuild": 0.0, "trees rebuilt": 0}
+    for _ in range(changes):
+        start = perf_counter()
+        if rng.random() < 0.8:
+            item = rng.choice(map_data.items)
+            target = rng.choice(list(editor.shelf_index))
+            editor.move_item(item.item_id, target[0], target[1], item.pos)
+        else:
+            empty = [pos for pos, shelf in editor.shelf_index.items() if not shelf.items]
+            if empty:
+                editor.remove_shelf(*rng.choice(empty))
+            else:
+                cell = rng.choice([pos for pos in free if not editor.blocked[pos] and pos not in starts
+                                   and pos != map_data.worker.pos])
+                editor.add_shelf(*cell)
+        for start_pos in starts:
+            if start_pos not in cache.trees:
+                results["trees rebuilt"] += 1
+            cache.get(start_pos)
+        results["incremental"] += perf_counter() - start
+
+        start = perf_counter()
+        occupancy_grid(map_data)
+        for start_pos in starts:
+            ShortestPathTree(map_data, start_pos)
+        results["rebuild"] += perf_counter() - start
+    return results
+
+
+def main():
+    """
+    Command line entry point, apply random changes to the QVBox map and compare the incremental updates
+    with rebuilding everything.
+    """
+
+    from core import read_map_data
+    from data import MapData
+    from entities import Worker
+
+    parser = argparse.ArgumentParser(description="Apply incremental changes to the warehouse map.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--changes", type=int, default=200, help="the number of random changes")
+    parser.add_argument("--trees", type=int, default=50, help="the number of cached shortest-path trees")
+    args = parser.parse_args()
+
+    items, shelves = read_map_data(args.data)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0])
+    results = benchmark(map_data, args.changes, args.trees)
+    print("{} changes, {} cached trees".format(args.changes, args.trees))
+    print("Incremental:  {:.3f} s, {} trees rebuilt".format(results["incremental"], results["trees rebuilt"]))
+    print("Full rebuild: {:.3f} s, {} trees rebuilt".format(results["rebuild"], args.changes * args.trees))
+
+
+if __name__ == '__main__':
+    main()
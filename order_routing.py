@@ -0,0 +1,490 @@
+"""--------------------------------------------------------
+    Routing policies for orders with many lines.
+    The classic single-block warehouse policies (S-shape, return, midpoint, largest gap) order the picks
+    aisle by aisle in linear time, the aisles and cross aisles are derived from the shelves:
+    the aisles are the free lines of the grid in the direction with the most of them (the rows of QVBox),
+    the front and back cross aisles are the first and last free lines across them.
+    Each pick is made from the aisle next to its shelf, the policy gives the turning points of the tour,
+    which are joined into a grid path straight along the free lines, or through a Map search otherwise.
+
+    The exact (Held-Karp, small orders only) and local-search (nearest neighbour + 2-opt) planners
+    order the same stops over their BFS distances, for comparison.
+    --------------------------------------------------------"""
+
+import argparse
+import random
+from time import perf_counter
+
+import numpy as np
+
+from entities import Item, Worker
+from service import Map
+from wavefront import DIRECTIONS, distance_transform, occupancy_grid
+
+# The largest number of stops the exact planner is run on
+EXACT_LIMIT = 12
+
+
+class AisleLayout:
+    """
+    A class to represent the aisle structure of a map.
+    A position on the map is given in aisle coordinates (aisle, offset): the coordinate of the aisle line
+    and the position along it, whatever the direction of the aisles on the grid.
+    """
+
+    def __init__(self, map_data):
+        self.blocked = occupancy_grid(map_data)
+        rows = [y for y in range(map_data.map_col) if not self.blocked[:, y].any()]
+        columns = [x for x in range(map_data.map_row) if not self.blocked[x, :].any()]
+        shelf_xs, shelf_ys = np.nonzero(self.blocked)
+        if len(shelf_xs) == 0:
+            raise ValueError("No shelf: the map has no aisle structure")
+
+        # The aisles are the free lines most shelves are picked from
+        def picked_from(lines, coordinates):
+            lines = np.array(lines)
+            return 0 if len(lines) == 0 else int((np.abs(coordinates[:, None] - lines[None, :]) <= 1).any(axis=1).sum())
+
+        self.horizontal = picked_from(rows, shelf_ys) >= picked_from(columns, shelf_xs)
+        self.aisles, crossing = (rows, columns) if self.horizontal else (columns, rows)
+        if not self.aisles:
+            raise ValueError("No aisle: no line of the map is free of shelves")
+
+        # The cross aisles nearest the shelves on each side, without them the ends of the aisles are used
+        # and the Map search joins them
+        offsets = shelf_xs if self.horizontal else shelf_ys
+        length = map_data.map_row if self.horizontal else map_data.map_col
+        self.front = max((line for line in crossing if line < offsets.min()), default=0)
+        self.back = min((line for line in crossing if line > offsets.max()), default=length - 1)
+
+    def cell(self, aisle, offset):
+        """Returns the (x, y) cell of aisle coordinates."""
+
+        return (offset, aisle) if self.horizontal else (aisle, offset)
+
+    def coordinates(self, pos):
+        """Returns the aisle coordinates of an (x, y) cell."""
+
+        return (pos[1], pos[0]) if self.horizontal else pos
+
+    def locate(self, pos):
+        """
+        The locate function finds where a shelf is picked from.
+
+        :param pos: The (x, y) position of the shelf
+        :return: The aisle coordinates of the pick and the free cell the worker stands on
+        """
+
+        line, offset = self.coordinates(pos)
+        aisle = min(self.aisles, key=lambda value: (abs(value - line), value))
+        if abs(aisle - line) <= 1:
+            return (aisle, offset), self.cell(aisle, offset)
+
+        # The shelf is not next to an aisle, it is picked from a free neighbour
+        x, y = pos
+        rows, cols = self.blocked.shape
+        for dx, dy in DIRECTIONS:
+            if 0 <= x + dx < rows and 0 <= y + dy < cols and not self.blocked[x + dx, y + dy]:
+                return (aisle, offset), (x + dx, y + dy)
+        return (aisle, offset), pos
+
+
+def _by_aisle(layout, picks, depot):
+    """Groups the picks by aisle, the aisles nearest the depot first and the picks sorted by offset."""
+
+    groups = {}
+    for (aisle, offset), stop in picks:
+        groups.setdefault(aisle, []).append((offset, stop))
+    depot_aisle = layout.coordinates(depot)[0]
+    reverse = depot_aisle > (layout.aisles[0] + layout.aisles[-1]) / 2
+    return [(aisle, sorted(groups[aisle])) for aisle in sorted(groups, reverse=reverse)]
+
+
+def s_shape(layout, picks, depot):
+    """
+    The S-shape (traversal) policy: every aisle with a pick is walked through from end to end,
+    the last one is entered and left from the front if the worker is at the front.
+
+    :param layout: The AisleLayout
+    :param picks: A list of (aisle coordinates, stop cell) of the picks
+    :param depot: The (x, y) position the tour starts and ends at
+    :return: The waypoints of the tour, from the depot to the depot
+    """
+
+    aisles = _by_aisle(layout, picks, depot)
+    waypoints = [depot]
+    at_front = True
+    for index, (aisle, stops) in enumerate(aisles):
+        if at_front and index == len(aisles) - 1:
+            waypoints.append(layout.cell(aisle, layout.front))
+            waypoints.extend(stop for _, stop in stops)
+            waypoints.append(layout.cell(aisle, layout.front))
+            break
+        waypoints.append(layout.cell(aisle, layout.front if at_front else layout.back))
+        waypoints.extend(stop for _, stop in (stops if at_front else reversed(stops)))
+        at_front = not at_front
+        waypoints.append(layout.cell(aisle, layout.front if at_front else layout.back))
+    waypoints.append(depot)
+    return waypoints
+
+
+def return_policy(layout, picks, depot):
+    """
+    The return policy: every aisle with a pick is entered from the front cross aisle,
+    up to the farthest pick and back.
+
+    :param layout: The AisleLayout
+    :param picks: A list of (aisle coordinates, stop cell) of the picks
+    :param depot: The (x, y) position the tour starts and ends at
+    :return: The waypoints of the tour, from the depot to the depot
+    """
+
+    waypoints = [depot]
+    for aisle, stops in _by_aisle(layout, picks, depot):
+        waypoints.append(layout.cell(aisle, layout.front))
+        waypoints.extend(stop for _, stop in stops)
+        waypoints.append(layout.cell(aisle, layout.front))
+    waypoints.append(depot)
+    return waypoints
+
+
+def _split_tour(layout, picks, depot, split):
+    """
+    The tour shared by the midpoint and largest gap policies: the first and the last aisles are walked through,
+    the picks of the other aisles are split by split(stops) into the ones reached from the front cross aisle
+    and the ones reached from the back cross aisle.
+    """
+
+    aisles = _by_aisle(layout, picks, depot)
+    if len(aisles) == 1:
+        return return_policy(layout, picks, depot)
+
+    (first, first_stops), middle, (last, last_stops) = aisles[0], aisles[1:-1], aisles[-1]
+    parts = [split(stops) for _, stops in middle]
+    waypoints = [depot, layout.cell(first, layout.front)]
+    waypoints.extend(stop for _, stop in first_stops)
+    waypoints.append(layout.cell(first, layout.back))
+    # Out along the back cross aisle
+    for (aisle, _), (_, back) in zip(middle, parts):
+        if back:
+            waypoints.append(layout.cell(aisle, layout.back))
+            waypoints.extend(stop for _, stop in reversed(back))
+            waypoints.append(layout.cell(aisle, layout.back))
+    waypoints.append(layout.cell(last, layout.back))
+    waypoints.extend(stop for _, stop in reversed(last_stops))
+    waypoints.append(layout.cell(last, layout.front))
+    # Back along the front cross aisle
+    for (aisle, _), (front, _) in reversed(list(zip(middle, parts))):
+        if front:
+            waypoints.append(layout.cell(aisle, layout.front))
+            waypoints.extend(stop for _, stop in front)
+            waypoints.append(layout.cell(aisle, layout.front))
+    waypoints.append(depot)
+    return waypoints
+
+
+def midpoint(layout, picks, depot):
+    """
+    The midpoint policy: the picks in the front half of an aisle are reached from the front cross aisle,
+    the ones in the back half from the back cross aisle, the first and last aisles are walked through.
+
+    :param layout: The AisleLayout
+    :param picks: A list of (aisle coordinates, stop cell) of the picks
+    :param depot: The (x, y) position the tour starts and ends at
+    :return: The waypoints of the tour, from the depot to the depot
+    """
+
+    middle = (layout.front + layout.back) / 2
+    return _split_tour(layout, picks, depot, lambda stops: ([pick for pick in stops if pick[0] <= middle],
+                                                            [pick for pick in stops if pick[0] > middle]))
+
+
+def largest_gap(layout, picks, depot):
+    """
+    The largest gap policy: the largest gap between two picks of an aisle (or a pick and a cross aisle)
+    is never walked, the picks before it are reached from the front, the ones after it from the back.
+
+    :param layout: The AisleLayout
+    :param picks: A list of (aisle coordinates, stop cell) of the picks
+    :param depot: The (x, y) position the tour starts and ends at
+    :return: The waypoints of the tour, from the depot to the depot
+    """
+
+    def split(stops):
+        offsets = [layout.front] + [offset for offset, _ in stops] + [layout.back]
+        gap = max(range(len(offsets) - 1), key=lambda i: offsets[i + 1] - offsets[i])
+        return stops[:gap], stops[gap:]
+
+    return _split_tour(layout, picks, depot, split)
+
+
+POLICIES = {
+    "s-shape": s_shape,
+    "return": return_policy,
+    "midpoint": midpoint,
+    "largest gap": largest_gap,
+}
+
+
+def connect(grid_map, waypoints, blocked=None):
+    """
+    The connect function joins the waypoints of a tour into a grid path.
+    Two waypoints on the same free line are joined straight, the others through a BFS of the Map.
+    The worker and target of the map data are put back after the searches.
+
+    :param grid_map: The Map of the warehouse
+    :param waypoints: The (x, y) waypoints of the tour
+    :param blocked: The occupancy grid of the map, computed if not given
+    :return: The list of (x, y) cells of the tour, or None if a waypoint can not be reached
+    """
+
+    if blocked is None:
+        blocked = occupancy_grid(grid_map.map_data)
+    map_data = grid_map.map_data
+    worker, target = map_data.worker, map_data.target
+    try:
+        return _connect(grid_map, waypoints, blocked)
+    finally:
+        map_data.update("worker", worker)
+        map_data.update("target", target)
+
+
+def _connect(grid_map, waypoints, blocked):
+    """Joins the waypoints, see connect()."""
+
+    path = [waypoints[0]]
+    for start, end in zip(waypoints, waypoints[1:]):
+        if start == end:
+            continue
+        if start[0] == end[0] or start[1] == end[1]:
+            step_x = (end[0] > start[0]) - (end[0] < start[0])
+            step_y = (end[1] > start[1]) - (end[1] < start[1])
+            length = abs(end[0] - start[0]) + abs(end[1] - start[1])
+            line = [(start[0] + i * step_x, start[1] + i * step_y) for i in range(1, length + 1)]
+            if not any(blocked[cell] for cell in line):
+                path.extend(line)
+                continue
+
+        grid_map.map_data.update("worker", Worker(*start))
+        grid_map.map_data.update("target", Item(0, end[0], end[1]))
+        grid_map.reset()
+        leg = grid_map.bfs()
+        if not leg:
+            return None
+        path.extend(block.pos for block in leg[1:])
+    return path
+
+
+def order_picks(layout, map_data, item_ids):
+    """
+    The order_picks function locates the picks of an order, one per shelf.
+
+    :param layout: The AisleLayout
+    :param map_data: The MapData object, its item index gives the locations of the items
+    :param item_ids: The ids of the items of the order
+    :return: A list of (aisle coordinates, stop cell), the items that are not stocked are left out
+    """
+
+    picks = {}
+    for item_id in item_ids:
+        locations = map_data.get_locations(item_id)
+        if locations and locations[0] not in picks:
+            picks[locations[0]] = layout.locate(locations[0])
+    return list(picks.values())
+
+
+def route_order(map_data, item_ids, policy="s-shape", grid_map=None):
+    """
+    API entry point, route an order with a policy.
+
+    :param map_data: The MapData object, the tour starts and ends at the worker's position
+    :param item_ids: The ids of the items of the order
+    :param policy: The name of the policy, see POLICIES
+    :param grid_map: An optional Map of the map data, reused for the searches
+    :return: The list of (x, y) cells of the tour
+    """
+
+    layout = AisleLayout(map_data)
+    depot = map_data.worker.pos
+    picks = order_picks(layout, map_data, item_ids)
+    waypoints = POLICIES[policy](layout, picks, depot)
+    return connect(grid_map if grid_map is not None else Map(map_data, render=False), waypoints, layout.blocked)
+
+
+def distance_matrix(blocked, stops):
+    """
+    The distance_matrix function computes the BFS distances between the stops with the wavefront.
+
+    :param blocked: The occupancy grid
+    :param stops: The (x, y) cells of the stops
+    :return: A (len(stops), len(stops)) int array, -1 where a stop can not be reached
+    """
+
+    xs = [x for x, _ in stops]
+    ys = [y for _, y in stops]
+    return np.array([distance_transform(blocked, stop)[0][xs, ys] for stop in stops])
+
+
+def tour_length(matrix, order):
+    """Returns the length of a closed tour visiting the stops in the given order."""
+
+    return int(sum(matrix[a, b] for a, b in zip(order, order[1:] + order[:1])))
+
+
+def held_karp(matrix):
+    """
+    The held_karp function finds the shortest closed tour from stop 0 with the Held-Karp dynamic programming,
+    in O(2^n n^2), only for small orders.
+
+    :param matrix: The distance matrix, stop 0 is the depot
+    :return: The visiting order, starting with 0
+    """
+
+    count = len(matrix)
+    if count <= 2:
+        return list(range(count))
+    full = 1 << (count - 1)
+    # best[mask][j]: the shortest path from 0 through the stops of mask, ending at stop j + 1
+    best = [[None] * (count - 1) for _ in range(full)]
+    previous = [[-1] * (count - 1) for _ in range(full)]
+    for j in range(count - 1):
+        best[1 << j][j] = int(matrix[0, j + 1])
+    for mask in range(1, full):
+        for j in range(count - 1):
+            cost = best[mask][j]
+            if cost is None or not mask & (1 << j):
+                continue
+            for k in range(count - 1):
+                if mask & (1 << k):
+                    continue
+                new_mask = mask | (1 << k)
+                new_cost = cost + int(matrix[j + 1, k + 1])
+                if best[new_mask][k] is None or new_cost < best[new_mask][k]:
+                    best[new_mask][k] = new_cost
+                    previous[new_mask][k] = j
+
+    mask = full - 1
+    last = min(range(count - 1), key=lambda j: best[mask][j] + int(matrix[j + 1, 0]))
+    order = []
+    while last != -1:
+        order.append(last + 1)
+        mask, last = mask & ~(1 << last), previous[mask][last]
+    return [0] + order[::-1]
+
+
+def two_opt(matrix):
+    """
+    The two_opt function builds a nearest neighbour tour from stop 0 and improves it with 2-opt moves
+    until no move shortens it.
+
+    :param matrix: The distance matrix, stop 0 is the depot
+    :return: The visiting order, starting with 0
+    """
+
+    count = len(matrix)
+    order = [0]
+    left = set(range(1, count))
+    while left:
+        nearest = min(left, key=lambda j: matrix[order[-1], j])
+        order.append(nearest)
+        left.remove(nearest)
+
+    tour = np.array(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, count - 1):
+            # Reversing tour[i:j + 1] replaces the edges (i - 1, i) and (j, j + 1) for every j at once
+            a, b = tour[i - 1], tour[i]
+            c = tour[i + 1:]
+            d = np.append(tour[i + 2:], tour[0])
+            delta = matrix[a, c] + matrix[b, d] - matrix[a, b] - matrix[c, d]
+            j = int(delta.argmin())
+            if delta[j] < 0:
+                tour[i:i + j + 2] = tour[i:i + j + 2][::-1].copy()
+                improved = True
+    return tour.tolist()
+
+
+def compare_planners(map_data, item_ids):
+    """
+    The compare_planners function routes an order with every policy and with the exact and local-search planners.
+
+    :param map_data: The MapData object, the tour starts and ends at the worker's position
+    :param item_ids: The ids of the items of the order
+    :return: A dictionary per planner of the tour length and the time in seconds
+    """
+
+    results = {}
+    grid = Map(map_data, render=False)
+    depot = map_data.worker.pos
+    layout = AisleLayout(map_data)
+    picks = order_picks(layout, map_data, item_ids)
+    for name, policy in POLICIES.items():
+        start = perf_counter()
+        path = connect(grid, policy(layout, picks, depot), layout.blocked)
+        results[name] = {"length": len(path) - 1 if path else None, "time": perf_counter() - start}
+
+    start = perf_counter()
+    stops = [depot] + list(dict.fromkeys(stop for _, stop in picks))
+    matrix = distance_matrix(layout.blocked, stops)
+    matrix_time = perf_counter() - start
+    planners = {"2-opt": two_opt}
+    if len(stops) <= EXACT_LIMIT:
+        planners["exact"] = held_karp
+    for name, planner in planners.items():
+        start = perf_counter()
+        order = planner(matrix)
+        results[name] = {"length": tour_length(matrix, order), "time": matrix_time + perf_counter() - start}
+    results["stops"] = len(stops) - 1
+    return results
+
+
+def main():
+    """
+    Command line entry point, compare the planners on random orders of the QVBox map or a synthetic map.
+    """
+
+    from core import gen_item_index, read_map_data
+    from data import MapData
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Route large orders with warehouse routing policies.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--lines", type=int, default=200, help="the number of lines of each order")
+    parser.add_argument("--orders", type=int, default=5, help="the number of random orders")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the random orders")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+    else:
+        items, shelves = read_map_data(args.data)
+        map_data = MapData(Worker(0, 0), shelves, items, items[0])
+    map_data.update("item_index", gen_item_index(map_data.items))
+
+    rng = random.Random(args.seed)
+    totals = {}
+    stops = 0
+    for _ in range(args.orders):
+        order = [rng.choice(map_data.items).item_id for _ in range(args.lines)]
+        map_data.update("worker", Worker(0, 0))
+        results = compare_planners(map_data, order)
+        stops += results.pop("stops")
+        for name, result in results.items():
+            total = totals.setdefault(name, {"length": 0, "time": 0.0, "runs": 0})
+            total["length"] += result["length"]
+            total["time"] += result["time"]
+            total["runs"] += 1
+
+    print("Orders of {} lines, {:.1f} shelves to visit on average".format(args.lines, stops / args.orders))
+    print("{:<14} {:>16} {:>16}".format("Planner", "Mean length", "Mean time (ms)"))
+    for name, total in totals.items():
+        print("{:<14} {:>16.1f} {:>16.2f}".format(name, total["length"] / total["runs"],
+                                                  1000 * total["time"] / total["runs"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+"""--------------------------------------------------------
+    One-to-all shortest-path trees.
+    A single full search from the worker's start cell reaches every cell of the map,
+    the distances and predecessors are kept in two flat int32 arrays (cell id = x * map_col + y).
+    Routes and distances to any shelf are then read from the tree in O(path length).
+    --------------------------------------------------------"""
+
+import heapq
+from collections import OrderedDict
+
+import numpy as np
+
+from wavefront import DIRECTIONS, NO_DIRECTION, UNREACHABLE, distance_transform, occupancy_grid
+
+NO_PARENT = -1
+
+
+class ShortestPathTree:
+    """
+    A class to represent the shortest-path tree rooted at a start cell.
+    Shelf cells are leaves of the tree: they are reached from their best free neighbour but never walked through,
+    like the target of a Map search.
+    """
+
+    def __init__(self, map_data, start):
+        self.start = start
+        self.map_row = map_data.map_row
+        self.map_col = map_data.map_col
+        blocked = occupancy_grid(map_data)
+
+        if map_data.costs:
+            self.dist, self.parent = self._dijkstra(blocked, map_data.costs)
+        else:
+            self.dist, self.parent = self._wavefront(blocked)
+
+    @staticmethod
+    def from_arrays(start, map_row, map_col, dist, parent):
+        """
+        Returns a tree over existing distance and predecessor arrays, e.g. views of shared memory, without a search.
+
+        :param start: The (x, y) start cell of the tree
+        :param map_row: The number of rows of the map
+        :param map_col: The number of columns of the map
+        :param dist: The flat int32 distance array
+        :param parent: The flat int32 predecessor array
+        :return: The ShortestPathTree
+        """
+
+        tree = ShortestPathTree.__new__(ShortestPathTree)
+        tree.start = start
+        tree.map_row = map_row
+        tree.map_col = map_col
+        tree.dist = dist
+        tree.parent = parent
+        return tree
+
+    def _wavefront(self, blocked):
+        """Builds the tree of a unit-cost map from the BFS wavefront, the direction field gives the predecessors."""
+
+        dist, direction = distance_transform(blocked, self.start)
+        cells = np.arange(self.map_row * self.map_col, dtype=np.int32).reshape(self.map_row, self.map_col)
+        parent = np.full(dist.shape, NO_PARENT, dtype=np.int32)
+        for code, (dx, dy) in enumerate(DIRECTIONS):
+            moved = direction == code
+            parent[moved] = cells[moved] + dx * self.map_col + dy
+        parent[direction == NO_DIRECTION] = NO_PARENT
+        return dist.ravel(), parent.ravel()
+
+    def _dijkstra(self, blocked, costs):
+        """Builds the tree of a weighted map with a heap-based Dijkstra over the flat cell ids."""
+
+        map_row, map_col = self.map_row, self.map_col
+        size = map_row * map_col
+        walkable = (~blocked).ravel().tolist()
+        cost = [1] * size
+        for (x, y), value in costs.items():
+            if 0 <= x < map_row and 0 <= y < map_col:
+                cost[x * map_col + y] = value
+
+        dist = [UNREACHABLE] * size
+        parent = [NO_PARENT] * size
+        sx, sy = self.start
+        if not (0 <= sx < map_row and 0 <= sy < map_col):
+            return np.array(dist, dtype=np.int32), np.array(parent, dtype=np.int32)
+
+        source = sx * map_col + sy
+        dist[source] = 0
+        heap = [(0, source)]
+        while heap:
+            total, cell = heapq.heappop(heap)
+            if total != dist[cell]:
+                continue  # Skip the stale heap entries
+            if cell != source and not walkable[cell]:
+                continue  # A shelf is entered, not walked through
+            x, y = divmod(cell, map_col)
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < map_row and 0 <= ny < map_col:
+                    neighbour = nx * map_col + ny
+                    new_total = total + cost[neighbour]
+                    if dist[neighbour] == UNREACHABLE or new_total < dist[neighbour]:
+                        dist[neighbour] = new_total
+                        parent[neighbour] = cell
+                        heapq.heappush(heap, (new_total, neighbour))
+
+        return np.array(dist, dtype=np.int32), np.array(parent, dtype=np.int32)
+
+    def distance(self, pos):
+        """
+        Returns the distance (or cost on a weighted map) from the start to the given cell.
+
+        :param pos: The (x, y) position of the cell
+        :return: The distance, or None if the cell can not be reached
+        """
+
+        value = int(self.dist[pos[0] * self.map_col + pos[1]])
+        return None if value == UNREACHABLE else value
+
+    def route(self, pos):
+        """
+        Returns the route from the start to the given cell, by following the predecessors back to the start.
+
+        :param pos: The (x, y) position of the cell
+        :return: A list of (x, y) positions from the start to the cell, empty if the cell can not be reached
+        """
+
+        cell = pos[0] * self.map_col + pos[1]
+        if self.dist[cell] == UNREACHABLE:
+            return []
+
+        path = []
+        while cell != NO_PARENT:
+            path.append(divmod(int(cell), self.map_col))
+            cell = self.parent[cell]
+        path.reverse()
+        return path
+
+    def rank(self, positions):
+        """
+        The rank function sorts candidate cells by their distance from the start, e.g. to choose the next pick.
+
+        :param positions: The (x, y) positions of the candidates
+        :return: A list of (distance, position) tuples, nearest first, the unreachable candidates are left out
+        """
+
+        ranked = []
+        for pos in positions:
+            distance = self.distance(pos)
+            if distance is not None:
+                ranked.append((distance, pos))
+        ranked.sort()
+        return ranked
+
+    def nbytes(self):
+        """Returns the size of the tree arrays in bytes."""
+
+        return self.dist.nbytes + self.parent.nbytes
+
+    def affected_by(self, pos, blocked, costs=None):
+        """
+        The affected_by function tells whether a shelf added or removed at a cell changes the tree.
+        A new shelf only matters if a route of the tree walks through the cell, the shelf keeps its distance.
+        A removed shelf only matters if a neighbour gets closer through the freed cell.
+
+        :param pos: The (x, y) position of the cell
+        :param blocked: True if a shelf was added on the cell, False if one was removed
+        :param costs: The per-cell costs of the map, {(x, y): cost}
+        :return: True if the tree must be built again
+        """
+
+        if pos == self.start:
+            return True
+        x, y = pos
+        cell = x * self.map_col + y
+        if self.dist[cell] == UNREACHABLE:
+            return False
+        if blocked:
+            return bool((self.parent == cell).any())
+
+        costs = costs or {}
+        for dx, dy in DIRECTIONS:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < self.map_row and 0 <= ny < self.map_col:
+                through = self.dist[cell] + costs.get((nx, ny), 1)
+                value = self.dist[nx * self.map_col + ny]
+                if value == UNREACHABLE or value > through:
+                    return True
+        return False
+
+
+class TreeCache:
+    """
+    A class to cache the shortest-path trees of a map per start cell.
+    When more than capacity trees are cached, the least recently used one is evicted.
+    The cache records the version of the map data its trees were built at, they are all dropped when the map
+    data has another version on the next request, unless the change was passed on (see MapEditor.watch_trees).
+    """
+
+    def __init__(self, map_data, capacity=64):
+        self.map_data = map_data
+        self.capacity = capacity
+        self.trees = OrderedDict()
+        self.version = map_data.version
+
+    def get(self, start=None):
+        """
+        Returns the tree rooted at the start cell, it is built on the first request.
+
+        :param start: The (x, y) start cell, default to the worker's position
+        :return: The ShortestPathTree
+        """
+
+        if start is None:
+            start = self.map_data.worker.pos
+        if self.version != self.map_data.version:
+            # The shelves or costs may have changed since the trees were built
+            self.clear()
+        tree = self.trees.get(start)
+        if tree is not None:
+            self.trees.move_to_end(start)
+            return tree
+
+        tree = ShortestPathTree(self.map_data, start)
+        self.trees[start] = tree
+        while len(self.trees) > self.capacity:
+            self.trees.popitem(last=False)
+        return tree
+
+    def clear(self):
+        """Removes every cached tree, the trees built next are those of the current version of the map data."""
+
+        self.trees.clear()
+        self.version = self.map_data.version
+
+    def invalidate(self, pos, blocked):
+        """
+        Removes the cached trees a shelf added or removed at a cell changes, the others are kept.
+
+        :param pos: The (x, y) position of the cell
+        :param blocked: True if a shelf was added on the cell, False if one was removed
+        :return: The number of trees removed
+        """
+
+        stale = [start for start, tree in self.trees.items() if tree.affected_by(pos, blocked, self.map_data.costs)]
+        for start in stale:
+            del self.trees[start]
+        return len(stale)
+
+    def advance(self, version):
+        """
+        Records that the cached trees are still valid at a new version of the map data,
+        after a change that does not touch them or whose trees were removed with invalidate().
+
+        :param version: The version of the map data after the change, the one before it must be the cache's
+        """
+
+        if self.version == version - 1:
+            self.version = version
+
+    def __len__(self):
+        return len(self.trees)
+
+
+def rank_items(map_data, item_ids, cache=None):
+    """
+    The rank_items function ranks items by the distance from the worker to their nearest location.
+
+    :param map_data: The MapData object
+    :param item_ids: The ids of the candidate items
+    :param cache: An optional TreeCache of the map, to reuse the tree of the worker's cell
+    :return: A list of (distance, item_id, position) tuples, nearest first
+    """
+
+    tree = cache.get(map_data.worker.pos) if cache is not None else ShortestPathTree(map_data, map_data.worker.pos)
+    ranked = []
+    for item_id in item_ids:
+        nearest = tree.rank(map_data.get_locations(item_id))
+        if nearest:
+            distance, pos = nearest[0]
+            ranked.append((distance, item_id, pos))
+    ranked.sort()
+    return ranked
@@ -0,0 +1,221 @@
+"""--------------------------------------------------------
+    Memory-footprint and allocation profiling mode.
+    When enabled, read_map_data, Map.__init__ and every search method of Map are wrapped in a profiling phase:
+    tracemalloc records the peak memory, the number of allocations, the memory the phase leaves behind
+    and the top allocation sites, cProfile optionally records where the time goes.
+    Nothing is wrapped until enable() is called, so the normal runs are not slowed down.
+    --------------------------------------------------------"""
+
+import argparse
+import cProfile
+import functools
+import io
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+
+import lazy_picker
+from data import Algorithm, MapData
+from entities import Worker
+from service import Map
+
+# The Map methods wrapped in a phase, one phase per method
+SEARCH_METHODS = ("a_star", "bfs", "dfs", "dijkstra", "dial", "heap_dijkstra", "nearest_location")
+
+
+class PhaseStats:
+    """A class to add up the measures of every call of a phase."""
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+        self.peak = 0
+        self.allocations = 0
+        self.retained = 0
+        self.top_sites = []
+        self.profile = None
+
+    def add(self, time, peak, allocations, retained, top_sites):
+        """Adds the measures of one call, the top sites are kept from the call with the highest peak."""
+
+        self.calls += 1
+        self.time += time
+        self.allocations += allocations
+        self.retained = retained
+        if peak >= self.peak:
+            self.peak = peak
+            self.top_sites = top_sites
+
+
+class Profiler:
+    """
+    A class to profile the phases of a run.
+    Phases can be nested, only the outermost phase running is measured, the inner ones are part of it.
+    """
+
+    def __init__(self, top=5, use_cprofile=False):
+        self.top = top
+        self.use_cprofile = use_cprofile
+        self.phases = {}
+        self.active = False
+        self.originals = []
+
+    @contextmanager
+    def phase(self, name):
+        """
+        A context manager to measure a phase of the run.
+
+        :param name: The name of the phase, the calls with the same name are added up
+        """
+
+        if self.active:
+            yield
+            return
+
+        self.active = True
+        started = tracemalloc.is_tracing()
+        if not started:
+            tracemalloc.start()
+        stats = self.phases.setdefault(name, PhaseStats(name))
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        profile = cProfile.Profile() if self.use_cprofile else None
+        start = perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            elapsed = perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            if not started:
+                tracemalloc.stop()
+            self.active = False
+
+            differences = after.compare_to(before, "lineno")
+            allocations = sum(diff.count_diff for diff in differences if diff.count_diff > 0)
+            sites = [diff for diff in differences if diff.size_diff > 0][:self.top]
+            top_sites = [(str(diff.traceback[0]), diff.size_diff, diff.count_diff) for diff in sites]
+            stats.add(elapsed, peak - base, allocations, current - base, top_sites)
+            if profile is not None:
+                if stats.profile is None:
+                    stats.profile = pstats.Stats(profile)
+                else:
+                    stats.profile.add(profile)
+
+    def wrap(self, owner, attribute, name):
+        """Replaces a function of a module or class by one that runs it in a phase."""
+
+        original = getattr(owner, attribute)
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return original(*args, **kwargs)
+
+        self.originals.append((owner, attribute, original))
+        setattr(owner, attribute, wrapper)
+
+    def enable(self, loader=lazy_picker):
+        """
+        Wraps read_map_data, Map.__init__ and the search methods of Map in phases.
+
+        :param loader: The module whose read_map_data is wrapped, e.g. __main__ when lazy_picker runs as a script
+        """
+
+        self.wrap(loader, "read_map_data", "read_map_data")
+        self.wrap(Map, "__init__", "Map.__init__")
+        for method in SEARCH_METHODS:
+            self.wrap(Map, method, "Map." + method)
+
+    def disable(self):
+        """Puts back the original functions."""
+
+        while self.originals:
+            owner, attribute, original = self.originals.pop()
+            setattr(owner, attribute, original)
+
+    def report(self):
+        """
+        The report function lays out the measures of every phase.
+
+        :return: The report as a string
+        """
+
+        lines = ["{:<24} {:>7} {:>12} {:>12} {:>14} {:>13}".format(
+            "Phase", "Calls", "Time (ms)", "Peak (KB)", "Retained (KB)", "Allocations")]
+        for stats in self.phases.values():
+            lines.append("{:<24} {:>7} {:>12.2f} {:>12.1f} {:>14.1f} {:>13}".format(
+                stats.name, stats.calls, stats.time * 1000, stats.peak / 1024, stats.retained / 1024,
+                stats.allocations))
+
+        for stats in self.phases.values():
+            lines.append("")
+            lines.append("Top allocation sites of " + stats.name + ":")
+            for site, size, count in stats.top_sites:
+                lines.append("    {:<60} {:>10.1f} KB {:>8} blocks".format(site, size / 1024, count))
+            if stats.profile is not None:
+                stream = io.StringIO()
+                stats.profile.stream = stream
+                stats.profile.sort_stats("cumulative").print_stats(self.top)
+                lines.append(stream.getvalue().rstrip())
+
+        return "\n".join(lines)
+
+
+@contextmanager
+def profile(top=5, use_cprofile=False, loader=lazy_picker):
+    """
+    API entry point, profile everything that runs inside the with block.
+
+        with profiling.profile() as profiler:
+            ...
+        print(profiler.report())
+
+    :param top: The number of allocation sites (and cProfile functions) reported per phase
+    :param use_cprofile: Whether to run cProfile in each phase as well
+    :param loader: The module whose read_map_data is wrapped
+    """
+
+    profiler = Profiler(top, use_cprofile)
+    profiler.enable(loader)
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+
+
+def main():
+    """
+    Command line entry point, profile loading the data, building the Map and every search on one query.
+    """
+
+    parser = argparse.ArgumentParser(description="Profile the memory footprint of the map and the searches.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--top", type=int, default=5, help="the number of allocation sites reported per phase")
+    parser.add_argument("--cprofile", action="store_true", help="run cProfile in each phase as well")
+    parser.add_argument("query", nargs="*", type=int, default=[0, 0, 1500],
+                        help="worker x, worker y and item id of the query")
+    args = parser.parse_args()
+    worker_x, worker_y, item_id = args.query
+
+    with profile(args.top, args.cprofile) as profiler:
+        items, shelves = lazy_picker.read_map_data(args.data)
+        target = lazy_picker.find_item(items, item_id)
+        if target is None:
+            parser.error("cannot find item with id " + str(item_id))
+        map_data = MapData(Worker(worker_x, worker_y), shelves, items, target)
+        for algorithm in Algorithm:
+            Map(map_data, render=False).search(algorithm)
+
+    print(profiler.report())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,482 @@
+"""--------------------------------------------------------
+    Cross-algorithm regression and performance gate.
+    Thousands of random (start, item) queries are run with every search engine on the QVBox map and on synthetic
+    maps, with and without per-cell costs. Every path is checked (it starts at the worker, ends at the item's shelf,
+    moves one cell at a time and never walks through a shelf) and the engines that find the shortest route
+    must agree with the reference search on its length or cost.
+    The throughput of each engine is compared with a stored baseline, the gate fails when it drops by more than
+    the threshold. The exit status is 1 when a check or the gate fails.
+    --------------------------------------------------------"""
+
+import argparse
+import json
+import os
+import random
+import sys
+from collections import deque
+from time import perf_counter
+
+from data import MapData
+from entities import Worker
+
+BASELINE_FILE = "regression-baseline.json"
+
+# The engines that find the shortest route on maps without costs and on maps with costs,
+# the others (default A* with its inflated Euclidean heuristic, DFS) only have to return valid paths.
+UNIT_EXACT = {"bfs", "dijkstra", "heap_dijkstra", "dial", "a_star_exact", "a_star_alt", "nearest_location",
+              "wavefront", "path_tree", "contraction", "dispatch", "ida_star"}
+WEIGHTED_EXACT = UNIT_EXACT - {"bfs", "wavefront"}
+# The engines not run on the maps with costs: BFS and the wavefront ignore the costs,
+# IDA* starts a new iteration for every distinct f-cost and takes seconds per query
+UNWEIGHTED_ONLY = {"bfs", "wavefront", "ida_star"}
+
+
+class Workbench:
+    """
+    A class to hold one map and the structures the engines build on it once (hierarchy, landmarks, dispatcher),
+    their build time is reported apart from the query throughput.
+    """
+
+    def __init__(self, map_data):
+        """
+        :param map_data: The MapData object of the map, its worker and target are changed by the queries
+        """
+
+        from bounded_search import ImplicitGrid
+        from contraction import ContractionHierarchy
+        from dispatch import Dispatcher
+        from landmarks import Landmarks
+        from service import Map
+        from wavefront import occupancy_grid
+
+        self.map_data = map_data
+        self.blocked = occupancy_grid(map_data)
+        self.costs = map_data.costs or {}
+        self.build_times = {}
+
+        start = perf_counter()
+        self.grid = Map(map_data, render=False)
+        self.build_times["map"] = perf_counter() - start
+        start = perf_counter()
+        self.hierarchy = ContractionHierarchy.build(map_data)
+        self.build_times["contraction"] = perf_counter() - start
+        start = perf_counter()
+        self.landmarks = Landmarks(map_data)
+        self.build_times["landmarks"] = perf_counter() - start
+        self.dispatcher = Dispatcher(map_data)
+        self.implicit = ImplicitGrid.from_map_data(map_data)
+
+    def search(self, start, target, method, table_of=None):
+        """
+        Runs a search of the Map from the start to the target item.
+
+        :param start: The (x, y) position of the worker
+        :param target: The target Item
+        :param method: The name of the Map method, e.g. "bfs"
+        :param table_of: A function returning the heuristic table of A*, or None for the default heuristic
+        :return: The cost and the list of (x, y) positions of the path, (None, []) if there is no path
+        """
+
+        self.map_data.update("worker", Worker(*start))
+        self.map_data.update("target", target)
+        self.grid.reset()
+        if table_of is not None:
+            self.grid.use_heuristic_table(table_of())
+        getattr(self.grid, method)()
+        if not self.grid.has_path:
+            return None, []
+        return self.grid.path_cost(), [block.pos for block in self.grid.path]
+
+    def nearest_location(self, start, target):
+        """
+        Runs Map.nearest_location() with every location of the item,
+        while the target of the map data is another item, as when a Map is reused for many items.
+        """
+
+        self.map_data.update("worker", Worker(*start))
+        items = self.map_data.items
+        self.map_data.update("target", items[0] if items[0].item_id != target.item_id else items[-1])
+        self.grid.nearest_location(self.map_data.get_locations(target.item_id))
+        if not self.grid.has_path:
+            return None, []
+        return self.grid.path_cost(), [block.pos for block in self.grid.path]
+
+    def wavefront(self, start, target):
+        """Runs the wavefront from the target and follows its direction field from the start."""
+
+        from wavefront import distance_transform, route
+
+        dist, direction = distance_transform(self.blocked, target.pos)
+        path = route(dist, direction, start)
+        return (len(path) - 1 if path else None), path
+
+    def path_tree(self, start, target):
+        """Builds the shortest-path tree of the start and reads the route to the target from it."""
+
+        from path_tree import ShortestPathTree
+
+        tree = ShortestPathTree(self.map_data, start)
+        return tree.distance(target.pos), tree.route(target.pos)
+
+    def contraction(self, start, target):
+        """Queries the contraction hierarchy built once for the map."""
+
+        return self.hierarchy.query(start, target.pos)
+
+    def dispatch(self, start, target):
+        """Dispatches the only worker at the start to the target shelf."""
+
+        found = self.dispatcher.nearest([Worker(*start)], [target.pos])
+        if found is None:
+            return None, []
+        _, path, cost = found
+        return cost, path
+
+    def ida_star(self, start, target):
+        """Searches with IDA* on the implicit grid."""
+
+        from bounded_search import ida_star
+
+        result = ida_star(self.implicit, start, target.pos)
+        return result["cost"], result["path"]
+
+
+def _exact_table(bench):
+    from wavefront import heuristic_table
+
+    return lambda: heuristic_table(bench.map_data)
+
+
+def _alt_table(bench):
+    return lambda: bench.landmarks.table(bench.map_data.target.pos)
+
+
+# Each engine takes the workbench, the (x, y) start and the target Item, and returns (cost, path)
+ENGINES = {
+    "bfs": lambda bench, start, target: bench.search(start, target, "bfs"),
+    "dijkstra": lambda bench, start, target: bench.search(start, target, "dijkstra"),
+    "heap_dijkstra": lambda bench, start, target: bench.search(start, target, "heap_dijkstra"),
+    "dial": lambda bench, start, target: bench.search(start, target, "dial"),
+    "dfs": lambda bench, start, target: bench.search(start, target, "dfs"),
+    "a_star": lambda bench, start, target: bench.search(start, target, "a_star"),
+    "a_star_exact": lambda bench, start, target: bench.search(start, target, "a_star", _exact_table(bench)),
+    "a_star_alt": lambda bench, start, target: bench.search(start, target, "a_star", _alt_table(bench)),
+    "nearest_location": Workbench.nearest_location,
+    "wavefront": Workbench.wavefront,
+    "path_tree": Workbench.path_tree,
+    "contraction": Workbench.contraction,
+    "dispatch": Workbench.dispatch,
+    "ida_star": Workbench.ida_star,
+}
+
+
+def check_path(path, start, target, blocked, costs):
+    """
+    The check_path function checks that a path is a valid route of the worker.
+
+    :param path: The list of (x, y) positions of the path
+    :param start: The (x, y) position of the worker
+    :param target: The (x, y) position of the target shelf
+    :param blocked: The occupancy grid, True for the shelves
+    :param costs: The per-cell cost of stepping into a cell, cells not listed cost 1
+    :return: The cost of the path and the reason it is not valid, None if it is valid
+    """
+
+    if tuple(path[0]) != tuple(start):
+        return None, "starts at " + str(path[0])
+    if tuple(path[-1]) != tuple(target):
+        return None, "ends at " + str(path[-1])
+    map_row, map_col = blocked.shape
+    cost = 0
+    for index, (x, y) in enumerate(path[1:], 1):
+        if not (0 <= x < map_row and 0 <= y < map_col):
+            return None, "leaves the map at " + str((x, y))
+        previous = path[index - 1]
+        if abs(x - previous[0]) + abs(y - previous[1]) != 1:
+            return None, "jumps from " + str(tuple(previous)) + " to " + str((x, y))
+        if blocked[x, y] and index != len(path) - 1:
+            return None, "walks through the shelf at " + str((x, y))
+        cost += costs.get((x, y), 1)
+    return cost, None
+
+
+def gen_queries(map_data, blocked, count, seed=0):
+    """
+    Returns random (start, item) queries, the start is a free cell and the item any item of the map.
+
+    :param map_data: The MapData object
+    :param blocked: The occupancy grid of the map
+    :param count: The number of queries
+    :param seed: The seed of the random generator
+    :return: A list of ((x, y), Item)
+    """
+
+    rng = random.Random(seed)
+    free = [(x, y) for x in range(map_data.map_row) for y in range(map_data.map_col) if not blocked[x, y]]
+    return [(rng.choice(free), rng.choice(map_data.items)) for _ in range(count)]
+
+
+def random_costs(blocked, max_cost=9, seed=0):
+    """Returns random costs from 1 to max_cost for every free cell."""
+
+    rng = random.Random(seed)
+    map_row, map_col = blocked.shape
+    return {(x, y): rng.randint(1, max_cost) for x in range(map_row) for y in range(map_col) if not blocked[x, y]}
+
+
+def load_scenarios(data_file, synthetic_size, seed=0):
+    """
+    The load_scenarios function builds the maps of the regression: the QVBox map and a synthetic map,
+    each one without costs and with random per-cell costs.
+
+    :param data_file: The item data file of the QVBox map
+    :param synthetic_size: The (rows, cols) of the synthetic map
+    :param seed: The seed of the synthetic map and the costs
+    :return: A dictionary of the MapData of each scenario, by name
+    """
+
+    from core import gen_item_index, read_map_data
+    from synthetic import synthetic_map_data
+    from wavefront import occupancy_grid
+
+    items, shelves = read_map_data(data_file)
+    qvbox = MapData(Worker(0, 0), shelves, items, items[0], item_index=gen_item_index(items))
+    synthetic = synthetic_map_data(*synthetic_size, seed=seed)
+    synthetic.item_index = gen_item_index(synthetic.items)
+
+    scenarios = {}
+    for name, base in (("qvbox", qvbox), ("synthetic", synthetic)):
+        scenarios[name] = base
+        costs = random_costs(occupancy_grid(base), seed=seed)
+        scenarios[name + "-weighted"] = MapData(Worker(0, 0), base.shelves, base.items, base.target,
+                                                map_row=base.map_row, map_col=base.map_col, costs=costs,
+                                                item_index=base.item_index)
+    return scenarios
+
+
+def run_scenario(map_data, queries, engines=tuple(ENGINES), rounds=3, chunk=50, max_failures=5):
+    """
+    The run_scenario function runs every engine on every query, then checks the paths and compares the costs
+    of the exact engines with the reference (BFS without costs, heap-based Dijkstra with costs).
+    nearest_location() may end on any location of the item, its cost is compared with the nearest one.
+
+    The queries are timed in chunks over several rounds. The machine is calibrated right before each chunk,
+    the speed of the chunk is the number of queries run in the time of one calibration, and the speed of an engine
+    is the median over the chunks and rounds. A machine that is slower as a whole, or slower for a moment,
+    slows down the calibration as much as the chunk, and the median leaves out the chunks where it did not.
+
+    :param map_data: The MapData object of the map
+    :param queries: A list of ((x, y), Item) queries
+    :param engines: The names of the engines to run
+    :param rounds: The number of times each chunk of queries is timed
+    :param chunk: The number of queries timed at once
+    :param max_failures: The number of failures reported per engine, the others are only counted
+    :return: A dictionary with the calibrated speed of each engine, its throughput (queries per second),
+             the build times, the number of failures of each engine and the messages of the first ones
+    """
+
+    from path_tree import ShortestPathTree
+
+    weighted = bool(map_data.costs)
+    reference = "heap_dijkstra" if weighted else "bfs"
+    exact = WEIGHTED_EXACT if weighted else UNIT_EXACT
+    engines = [name for name in engines if not (weighted and name in UNWEIGHTED_ONLY)]
+    if reference not in engines:
+        engines.insert(0, reference)
+
+    bench = Workbench(map_data)
+    results = {name: [] for name in engines}
+    speeds = {name: [] for name in engines}
+    fastest = {name: [float("inf")] * len(range(0, len(queries), chunk)) for name in engines}
+    for round_index in range(rounds):
+        for name in engines:
+            engine = ENGINES[name]
+            for index, first in enumerate(range(0, len(queries), chunk)):
+                part = queries[first:first + chunk]
+                calibration = calibrate()
+                answers = []
+                start = perf_counter()
+                for worker_pos, target in part:
+                    answers.append(engine(bench, worker_pos, target))
+                elapsed = perf_counter() - start
+                speeds[name].append(len(part) * calibration / elapsed)
+                fastest[name][index] = min(fastest[name][index], elapsed)
+                if round_index == 0:
+                    results[name].extend(answers)
+    speed = {name: median(values) for name, values in speeds.items()}
+    throughput = {name: len(queries) / sum(times) for name, times in fastest.items()}
+
+    failures = {name: 0 for name in engines}
+    messages = []
+    for index, (worker_pos, target) in enumerate(queries):
+        expected = results[reference][index][0]
+        locations = map_data.get_locations(target.item_id)
+        for name in engines:
+            cost, path = results[name][index]
+            ends = [target.pos]
+            wanted = expected
+            if name == "nearest_location" and locations != [target.pos]:
+                tree = ShortestPathTree(map_data, worker_pos)
+                reachable = [tree.distance(pos) for pos in locations if tree.distance(pos) is not None]
+                ends = locations
+                wanted = min(reachable) if reachable else None
+            problem = None
+            if not path:
+                if cost is not None or wanted is not None:
+                    problem = "no path, expected cost " + str(wanted)
+            elif tuple(path[-1]) not in ends:
+                problem = "ends at " + str(path[-1])
+            else:
+                actual, problem = check_path(path, worker_pos, path[-1], bench.blocked, bench.costs)
+                if problem is None and actual != cost:
+                    problem = "reports cost " + str(cost) + " for a path of cost " + str(actual)
+                elif problem is None and name in exact and cost != wanted:
+                    problem = "cost " + str(cost) + ", expected " + str(wanted)
+            if problem is not None:
+                failures[name] += 1
+                if failures[name] <= max_failures:
+                    messages.append("{} from {} to item {} at {}: {}".format(name, worker_pos, target.item_id,
+                                                                             target.pos, problem))
+
+    return {"speed": speed, "throughput": throughput, "build": bench.build_times, "failures": failures,
+            "messages": messages}
+
+
+def median(values):
+    """Returns the median of the values."""
+
+    return sorted(values)[len(values) // 2]
+
+
+def calibrate(size=60):
+    """
+    The calibrate function times a fixed workload, a BFS over an empty size x size grid in pure Python,
+    the speed of the engines is measured in queries per run of this workload.
+
+    :param size: The number of rows and columns of the grid
+    :return: The time of the run in seconds
+    """
+
+    start = perf_counter()
+    dist = [-1] * (size * size)
+    dist[0] = 0
+    frontier = deque([0])
+    while frontier:
+        cell = frontier.popleft()
+        x, y = divmod(cell, size)
+        for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+            if 0 <= nx < size and 0 <= ny < size and dist[nx * size + ny] < 0:
+                dist[nx * size + ny] = dist[cell] + 1
+                frontier.append(nx * size + ny)
+    return perf_counter() - start
+
+
+def load_baseline(filename):
+    """Returns the stored baseline, {scenario: {engine: calibrated speed}}, empty if there is none."""
+
+    if not os.path.exists(filename):
+        return {}
+    with open(filename, 'r') as file:
+        return json.load(file)
+
+
+def save_baseline(filename, baseline):
+    """Writes the calibrated speed of every scenario and engine as the new baseline."""
+
+    baseline = {scenario: {name: round(value, 4) for name, value in speed.items()}
+                for scenario, speed in baseline.items()}
+    with open(filename, 'w') as file:
+        json.dump(baseline, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def regressions(measured, baseline, threshold):
+    """
+    The regressions function compares the calibrated speed of the engines with the baseline.
+
+    :param measured: The measured {scenario: {engine: calibrated speed}}
+    :param baseline: The stored baseline, in the same layout
+    :param threshold: The largest allowed drop, as a fraction of the baseline (0.3 for 30%)
+    :return: A list of (scenario, engine, baseline, measured) for the engines slower than allowed
+    """
+
+    slower = []
+    for scenario, speed in measured.items():
+        for name, value in speed.items():
+            stored = baseline.get(scenario, {}).get(name)
+            if stored and value < stored * (1 - threshold):
+                slower.append((scenario, name, stored, value))
+    return slower
+
+
+def main():
+    """
+    Command line entry point, run the regression on every scenario and gate the throughput on the baseline.
+    """
+
+    parser = argparse.ArgumentParser(description="Check that the search engines agree and have not slowed down.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, default=(60, 40), metavar=("ROWS", "COLS"),
+                        help="the size of the synthetic warehouse")
+    parser.add_argument("--queries", type=int, default=1000, help="the number of random queries per scenario")
+    parser.add_argument("--scenarios", nargs="*", help="the scenarios to run, default to all")
+    parser.add_argument("--engines", nargs="*", default=list(ENGINES), help="the engines to run, default to all")
+    parser.add_argument("--rounds", type=int, default=3, help="the number of timed rounds of every chunk of queries")
+    parser.add_argument("--seed", type=int, default=0, help="the seed of the queries, the synthetic map and costs")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="the baseline file")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store the measured throughput as the new baseline instead of comparing with it")
+    parser.add_argument("--threshold", type=float, default=0.3,
+                        help="the largest allowed throughput drop, as a fraction of the baseline")
+    args = parser.parse_args()
+    for name in args.engines:
+        if name not in ENGINES:
+            parser.error("unknown engine " + name)
+
+    from wavefront import occupancy_grid
+
+    scenarios = load_scenarios(args.data, args.synthetic, args.seed)
+    for name in args.scenarios or []:
+        if name not in scenarios:
+            parser.error("unknown scenario " + name)
+
+    failed = False
+    measured = {}
+    for name in args.scenarios or scenarios:
+        map_data = scenarios[name]
+        queries = gen_queries(map_data, occupancy_grid(map_data), args.queries, args.seed)
+        result = run_scenario(map_data, queries, args.engines, args.rounds)
+        measured[name] = result["speed"]
+
+        print("Scenario {} ({}x{}, {} queries), built in {}".format(
+            name, map_data.map_row, map_data.map_col, len(queries),
+            ", ".join("{} {:.2f} s".format(part, seconds) for part, seconds in result["build"].items())))
+        print("{:<18} {:>12} {:>12} {:>10}".format("Engine", "Queries/s", "Calibrated", "Failures"))
+        for engine, rate in result["throughput"].items():
+            print("{:<18} {:>12.1f} {:>12.3f} {:>10}".format(engine, rate, result["speed"][engine],
+                                                             result["failures"][engine]))
+        for message in result["messages"]:
+            print("  FAIL " + message)
+        failed = failed or any(result["failures"].values())
+        print()
+
+    if args.update_baseline:
+        baseline = load_baseline(args.baseline)
+        baseline.update(measured)
+        save_baseline(args.baseline, baseline)
+        print("Baseline written to", args.baseline)
+    else:
+        baseline = load_baseline(args.baseline)
+        if not baseline:
+            print("No baseline in", args.baseline + ", run with --update-baseline to store one")
+        for scenario, engine, expected, rate in regressions(measured, baseline, args.threshold):
+            print("  SLOWER {} on {}: calibrated speed {:.3f}, baseline {:.3f}".format(engine, scenario,
+                                                                                       rate, expected))
+            failed = True
+
+    print("FAILED" if failed else "PASSED")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+"""--------------------------------------------------------
+    Offline raster (PNG) and SVG rendering of routes, in batch.
+    The occupancy grid is drawn once into a base layer, each route is painted over it, encoded,
+    and its cells are restored from the base layer, so the per-image work follows the path, not the map.
+    The PNG encoder only needs the standard library (zlib): the canvas is kept as 8-bit palette scanlines,
+    with the filter byte of each scanline in its first column, so it is written as it is.
+    The base layer is compressed once, one band of scanlines per row of cells, each band ending with a full flush
+    so the compressed bands can be joined; an image only compresses again the bands its route paints.
+    --------------------------------------------------------"""
+
+import argparse
+import os
+import random
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+import numpy as np
+
+from data import MapData
+from wavefront import occupancy_grid
+
+# Palette indices and their colours
+FREE = 0
+SHELF = 1
+PATH = 2
+START = 3
+GOAL = 4
+PALETTE = ((255, 255, 255), (128, 128, 128), (46, 160, 67), (31, 111, 235), (218, 54, 51))
+COLOURS = tuple("#{:02x}{:02x}{:02x}".format(*colour) for colour in PALETTE)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# The renderer of a pool process, set once by _init_process()
+_renderer = None
+
+
+def _chunk(tag, data):
+    """Returns a PNG chunk: length, tag, data and CRC."""
+
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
+
+def _png(width, height, data, palette):
+    """Returns the PNG file of an 8-bit palette image from its zlib stream."""
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)
+    return (PNG_SIGNATURE + _chunk(b"IHDR", header)
+            + _chunk(b"PLTE", bytes(value for colour in palette for value in colour))
+            + _chunk(b"IDAT", data) + _chunk(b"IEND", b""))
+
+
+def encode_png(scanlines, palette=PALETTE, level=6):
+    """
+    The encode_png function encodes an 8-bit palette image as PNG with the standard library only.
+
+    :param scanlines: A (height, width + 1) uint8 array, column 0 holds the filter byte (0) of each scanline
+    :param palette: The (r, g, b) colour of each palette index
+    :param level: The zlib compression level
+    :return: The PNG file as bytes
+    """
+
+    return _png(scanlines.shape[1] - 1, scanlines.shape[0], zlib.compress(scanlines.tobytes(), level), palette)
+
+
+def compress_band(data, level=6):
+    """
+    The compress_band function compresses a band of scanlines as a raw deflate segment ending with a full flush,
+    the segments of consecutive bands can be joined into one deflate stream.
+
+    :param data: The bytes of the band
+    :param level: The zlib compression level
+    :return: A tuple of the compressed segment, the Adler-32 checksum of the band and its length
+    """
+
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH), zlib.adler32(data), len(data)
+
+
+def adler32_combine(adler1, adler2, length2):
+    """Returns the Adler-32 checksum of two joined byte strings from their checksums, like zlib's adler32_combine."""
+
+    base = 65521
+    remainder = length2 % base
+    sum1 = ((adler1 & 0xffff) + (adler2 & 0xffff) + base - 1) % base
+    sum2 = (remainder * (adler1 & 0xffff) + (adler1 >> 16) + (adler2 >> 16) + base - remainder) % base
+    return sum1 | (sum2 << 16)
+
+
+def join_bands(bands):
+    """
+    The join_bands function joins the compressed bands into a zlib stream: the zlib header, the segments,
+    an empty final block and the Adler-32 checksum of the whole data.
+
+    :param bands: A list of the tuples returned by compress_band()
+    :return: The zlib stream as bytes
+    """
+
+    checksum = 1
+    for _, adler, length in bands:
+        checksum = adler32_combine(checksum, adler, length)
+    return b"\x78\x9c" + b"".join(segment for segment, _, _ in bands) + b"\x03\x00" + struct.pack(">I", checksum)
+
+
+class RouteRenderer:
+    """
+    A class to render routes over the map, the x-axis goes right and the y-axis goes up like Map.visualize().
+    """
+
+    def __init__(self, map_data, cell=12, level=6):
+        """
+        :param map_data: The MapData object holding the shelves of the map
+        :param cell: The size of a cell in pixels
+        :param level: The zlib compression level of the PNG images
+        """
+
+        blocked = occupancy_grid(map_data)
+        self.map_row, self.map_col = blocked.shape
+        self.cell = cell
+        self.level = level
+
+        # A shelf is drawn one pixel inside its cell, so neighbouring shelves stay apart
+        pattern = np.zeros((cell, cell), dtype=np.uint8)
+        pattern[1:-1, 1:-1] = SHELF
+        image = np.kron(blocked.T[::-1].astype(np.uint8), pattern)
+        self.base = np.zeros((image.shape[0], image.shape[1] + 1), dtype=np.uint8)
+        self.base[:, 1:] = image
+        self.canvas = self.base.copy()
+        # One band of scanlines per row of cells, compressed once from the base layer
+        self.bands = [compress_band(self.base[row:row + cell].tobytes(), level)
+                      for row in range(0, self.base.shape[0], cell)]
+
+        shelves = ['<rect x="{}" y="{}" width="0.84" height="0.84" fill="{}"/>'.format(
+            x + 0.08, self.map_col - 1 - y + 0.08, COLOURS[SHELF]) for x, y in np.argwhere(blocked)]
+        self.svg_base = ('<svg xmlns="http://www.w3.org/2000/svg" width="{}" height="{}" viewBox="0 0 {} {}">'
+                         '<rect width="100%" height="100%" fill="{}"/>{}').format(
+            self.map_row * cell, self.map_col * cell, self.map_row, self.map_col, COLOURS[FREE], "".join(shelves))
+
+    def _cell(self, pos):
+        """Returns the canvas slices of a cell, after the filter byte column."""
+
+        row = (self.map_col - 1 - pos[1]) * self.cell
+        col = pos[0] * self.cell + 1
+        return slice(row, row + self.cell), slice(col, col + self.cell)
+
+    def png(self, route):
+        """
+        The png function renders a route as a PNG image.
+
+        :param route: A list of (x, y) positions from the start to the target
+        :return: The PNG file as bytes
+        """
+
+        cells = [self._cell(pos) for pos in route]
+        for index, (rows, cols) in enumerate(cells):
+            self.canvas[rows, cols] = START if index == 0 else GOAL if index == len(cells) - 1 else PATH
+        try:
+            bands = list(self.bands)
+            for row in {rows.start for rows, _ in cells}:
+                bands[row // self.cell] = compress_band(self.canvas[row:row + self.cell].tobytes(), self.level)
+            return _png(self.base.shape[1] - 1, self.base.shape[0], join_bands(bands), PALETTE)
+        finally:
+            for rows, cols in cells:
+                self.canvas[rows, cols] = self.base[rows, cols]
+
+    def svg(self, route):
+        """
+        The svg function renders a route as an SVG image.
+
+        :param route: A list of (x, y) positions from the start to the target
+        :return: The SVG file as a string
+        """
+
+        if not route:
+            return self.svg_base + "</svg>"
+        points = " ".join("{},{}".format(x + 0.5, self.map_col - 0.5 - y) for x, y in route)
+        (start_x, start_y), (goal_x, goal_y) = route[0], route[-1]
+        return (self.svg_base
+                + '<polyline points="{}" fill="none" stroke="{}" stroke-width="0.4" stroke-linejoin="round"/>'.format(
+                    points, COLOURS[PATH])
+                + '<circle cx="{}" cy="{}" r="0.4" fill="{}"/>'.format(
+                    start_x + 0.5, self.map_col - 0.5 - start_y, COLOURS[START])
+                + '<rect x="{}" y="{}" width="1" height="1" fill="{}"/>'.format(
+                    goal_x, self.map_col - 1 - goal_y, COLOURS[GOAL])
+                + "</svg>")
+
+    def save(self, route, filename):
+        """
+        The save function renders a route to a file, the format is chosen by the extension (.png or .svg).
+
+        :param route: A list of (x, y) positions from the start to the target
+        :param filename: The name of the image file
+        """
+
+        if filename.endswith(".svg"):
+            with open(filename, "w") as file:
+                file.write(self.svg(route))
+        else:
+            with open(filename, "wb") as file:
+                file.write(self.png(route))
+
+
+def _init_process(map_data, cell, level):
+    """Builds the renderer (and its base layer) once per pool process."""
+
+    global _renderer
+    _renderer = RouteRenderer(map_data, cell, level)
+
+
+def _render(task):
+    """Renders one (route, filename) task in a pool process."""
+
+    route, filename = task
+    _renderer.save(route, filename)
+    return filename
+
+
+def render_batch(map_data, routes, directory, image_format="png", cell=12, level=6, processes=1):
+    """
+    The render_batch function renders many routes to image files.
+
+    :param map_data: The MapData object holding the shelves of the map
+    :param routes: A list of (name, route) tuples, a route is a list of (x, y) positions
+    :param directory: The directory of the image files, created if needed
+    :param image_format: "png" or "svg"
+    :param cell: The size of a cell in pixels
+    :param level: The zlib compression level of the PNG images
+    :param processes: The number of processes, 1 renders in this process
+    :return: The list of the image file names
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    tasks = [(route, os.path.join(directory, str(name) + "." + image_format)) for name, route in routes]
+    if processes == 1:
+        renderer = RouteRenderer(map_data, cell, level)
+        for route, filename in tasks:
+            renderer.save(route, filename)
+        return [filename for _, filename in tasks]
+
+    # The pool processes only need the shelves
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_process,
+                             initargs=(map_data.without_items(), cell, level)) as pool:
+        return list(pool.map(_render, tasks, chunksize=max(1, len(tasks) // (4 * (processes or os.cpu_count())))))
+
+
+def main():
+    """
+    Command line entry point, render the routes of random pick tickets on the QVBox map.
+    """
+
+    from core import read_map_data
+    from entities import Worker
+    from path_tree import TreeCache
+
+    parser = argparse.ArgumentParser(description="Render route images of pick tickets in batch.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--output", default="routes", help="the directory of the images")
+    parser.add_argument("--format", default="png", choices=("png", "svg"), help="the image format")
+    parser.add_argument("--tickets", type=int, default=1000, help="the number of random pick tickets")
+    parser.add_argument("--cell", type=int, default=12, help="the size of a cell in pixels")
+    parser.add_argument("--level", type=int, default=6, help="the zlib compression level of the PNG images")
+    parser.add_argument("--processes", type=int, default=1, help="the number of processes, 0 for every CPU")
+    args = parser.parse_args()
+
+    items, shelves = read_map_data(args.data)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0])
+    blocked = occupancy_grid(map_data)
+    free = [tuple(int(value) for value in pos) for pos in np.argwhere(~blocked)]
+    rng = random.Random(0)
+    cache = TreeCache(map_data, capacity=len(free))
+    routes = []
+    for ticket in range(args.tickets):
+        start, item = rng.choice(free), rng.choice(items)
+        routes.append((ticket, cache.get(start).route(item.pos)))
+
+    start = perf_counter()
+    files = render_batch(map_data, routes, args.output, args.format, args.cell, args.level, args.processes or None)
+    elapsed = perf_counter() - start
+    print("Rendered {} images to {} in {:.2f} s ({:.2f} ms per image)".format(
+        len(files), args.output, elapsed, 1000 * elapsed / max(1, len(files))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+"""--------------------------------------------------------
+    Off-route path repair.
+    When the worker steps off the planned route, the route is repaired instead of searched again:
+    - reconnect: a small search from the new position, bounded by a detour budget, stops at the cells of the
+      planned route and splices the detour onto the rest of it, the cost to go of every route cell is known;
+    - field: the shortest-path tree rooted at the target (built once per target) gives the route to the target
+      from any cell, by following the predecessors, the route is the shortest one.
+    --------------------------------------------------------"""
+
+import argparse
+import heapq
+import random
+from time import perf_counter
+
+from path_tree import ShortestPathTree
+from wavefront import DIRECTIONS, occupancy_grid
+
+# Repair strategies
+RECONNECT = "reconnect"
+FIELD = "field"
+AUTO = "auto"
+
+
+class RouteRepair:
+    """
+    A class to keep the planned route of a worker and repair it when the worker is off the route.
+    """
+
+    def __init__(self, map_data, route, max_detour=8):
+        """
+        :param map_data: The MapData object (shelves and costs)
+        :param route: The planned route, a list of (x, y) positions from the worker to the target
+        :param max_detour: The largest cost of a detour back to the route, a farther position uses the field
+        """
+
+        self.map_data = map_data
+        self.map_row = map_data.map_row
+        self.map_col = map_data.map_col
+        self.blocked = occupancy_grid(map_data)
+        self.costs = map_data.costs or {}
+        self.max_detour = max_detour
+        self.field = None
+        self.set_route(route)
+
+    @staticmethod
+    def from_map(grid_map, max_detour=8):
+        """
+        Returns the repairer of the route found by the last search of a Map.
+
+        :param grid_map: The Map, after a search that found a path
+        :param max_detour: The largest cost of a detour back to the route
+        :return: The RouteRepair
+        """
+
+        return RouteRepair(grid_map.map_data, [block.pos for block in grid_map.path], max_detour)
+
+    def set_route(self, route):
+        """Replaces the planned route, the cost to go of each of its cells is computed once."""
+
+        self.route = list(route)
+        self.index = {pos: i for i, pos in enumerate(self.route)}
+        # to_go[i] is the cost from route[i] to the target along the route
+        self.to_go = [0] * len(self.route)
+        for i in range(len(self.route) - 2, -1, -1):
+            self.to_go[i] = self.to_go[i + 1] + self.costs.get(self.route[i + 1], 1)
+
+    def target_field(self):
+        """Returns the shortest-path tree rooted at the target, it is built on the first request."""
+
+        if self.field is None:
+            self.field = ShortestPathTree(self.map_data, self.route[-1])
+        return self.field
+
+    def reconnect(self, pos):
+        """
+        The reconnect function searches from the position back to the planned route, within the detour budget.
+        Every cell of the route reached is a candidate, the one with the cheapest detour plus cost to go wins,
+        the search stops as soon as no cheaper candidate can be found.
+
+        :param pos: The (x, y) position of the worker
+        :return: The repaired route from the position to the target, or None if the route is out of reach
+        """
+
+        if pos in self.index:
+            return self.route[self.index[pos]:]
+
+        target = self.route[-1]
+        best_cost, best_cell = None, None
+        dist = {pos: 0}
+        parent = {pos: None}
+        heap = [(0, pos)]
+        while heap:
+            cost, cell = heapq.heappop(heap)
+            if cost != dist[cell]:
+                continue  # Skip the stale heap entries
+            if best_cost is not None and cost >= best_cost:
+                break
+            index = self.index.get(cell)
+            if index is not None:
+                if best_cost is None or cost + self.to_go[index] < best_cost:
+                    best_cost, best_cell = cost + self.to_go[index], cell
+                continue
+            x, y = cell
+            for dx, dy in DIRECTIONS:
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < self.map_row and 0 <= ny < self.map_col):
+                    continue
+                # Shelves are never walked through, only the target is entered
+                if self.blocked[nx, ny] and (nx, ny) != target:
+                    continue
+                new_cost = cost + self.costs.get((nx, ny), 1)
+                if new_cost <= self.max_detour and ((nx, ny) not in dist or new_cost < dist[(nx, ny)]):
+                    dist[(nx, ny)] = new_cost
+                    parent[(nx, ny)] = cell
+                    heapq.heappush(heap, (new_cost, (nx, ny)))
+
+        if best_cell is None:
+            return None
+        detour = []
+        cell = best_cell
+        while cell is not None:
+            detour.append(cell)
+            cell = parent[cell]
+        detour.reverse()
+        return detour[:-1] + self.route[self.index[best_cell]:]
+
+    def follow_field(self, pos):
+        """
+        The follow_field function follows the target-rooted tree from the position to the target.
+
+        :param pos: The (x, y) position of the worker
+        :return: The shortest route from the position to the target, or None if the target can not be reached
+        """
+
+        route = self.target_field().route(pos)
+        if not route:
+            return None
+        route.reverse()
+        return route
+
+    def repair(self, pos, strategy=AUTO):
+        """
+        The repair function repairs the planned route from the new position of the worker,
+        the repaired route becomes the planned route.
+
+        :param pos: The (x, y) position of the worker
+        :param strategy: RECONNECT, FIELD, or AUTO to reconnect and fall back to the field when out of reach
+        :return: The repaired route from the position to the target, or None if the target can not be reached
+        """
+
+        if strategy == FIELD:
+            route = self.follow_field(pos)
+        elif strategy == RECONNECT:
+            route = self.reconnect(pos)
+        elif strategy == AUTO:
+            route = self.reconnect(pos)
+            if route is None:
+                route = self.follow_field(pos)
+        else:
+            raise ValueError("Unknown repair strategy: " + str(strategy))
+
+        if route is not None:
+            self.set_route(route)
+        return route
+
+    def cost(self, route=None):
+        """Returns the cost of a route (the planned one by default), the start cell is free."""
+
+        route = self.route if route is None else route
+        return sum(self.costs.get(pos, 1) for pos in route[1:])
+
+
+def benchmark(map_data, queries=200, steps=3, seed=0):
+    """
+    The benchmark function moves the worker a few random steps off a planned route and compares the repair
+    strategies with a new A* search, timed with and without building a new Map.
+
+    :param map_data: The MapData object
+    :param queries: The number of (route, off-route position) queries
+    :param steps: The number of random steps off the route
+    :param seed: The seed of the random generator
+    :return: A dictionary per method of the total time and the mean extra cost over the shortest route
+    """
+
+    from entities import Worker
+    from service import Map
+
+    rng = random.Random(seed)
+    blocked = occupancy_grid(map_data)
+    grid = Map(map_data, render=False)
+    methods = ("new Map + a_star", "reset + a_star", RECONNECT, FIELD, AUTO)
+    results = {method: {"time": 0.0, "extra": 0, "failed": 0} for method in methods}
+    done = 0
+    while done < queries:
+        target = rng.choice(map_data.items)
+        map_data.update("worker", Worker(0, 0))
+        map_data.update("target", target)
+        grid.reset()
+        if not grid.dial():
+            continue
+        planned = [block.pos for block in grid.path]
+
+        # Walk off the route from one of its cells
+        x, y = planned[rng.randrange(len(planned) - 1)]
+        for _ in range(steps):
+            moves = [(x + dx, y + dy) for dx, dy in DIRECTIONS if 0 <= x + dx < map_data.map_row
+                     and 0 <= y + dy < map_data.map_col and not blocked[x + dx, y + dy]]
+            x, y = rng.choice(moves)
+
+        exact = ShortestPathTree(map_data, (x, y)).distance(target.pos)
+        if exact is None:
+            continue
+        done += 1
+
+        map_data.update("worker", Worker(x, y))
+        start = perf_counter()
+        fresh = Map(map_data, render=False)
+        fresh.a_star()
+        results["new Map + a_star"]["time"] += perf_counter() - start
+        results["new Map + a_star"]["extra"] += fresh.path_cost() - exact
+
+        start = perf_counter()
+        grid.reset()
+        grid.a_star()
+        results["reset + a_star"]["time"] += perf_counter() - start
+        results["reset + a_star"]["extra"] += grid.path_cost() - exact
+
+        for strategy in (RECONNECT, FIELD, AUTO):
+            repairer = RouteRepair(map_data, planned)
+            # The first repair of a target builds the field, a later repair of the same route reuses it
+            repairer.target_field()
+            start = perf_counter()
+            route = repairer.repair((x, y), strategy)
+            results[strategy]["time"] += perf_counter() - start
+            if route is None:
+                results[strategy]["failed"] += 1
+            else:
+                results[strategy]["extra"] += repairer.cost(route) - exact
+
+    for result in results.values():
+        result["extra"] /= queries
+    return results
+
+
+def main():
+    """
+    Command line entry point, compare the repair strategies with a new search on the QVBox map or a synthetic map.
+    """
+
+    from core import read_map_data
+    from data import MapData
+    from entities import Worker
+    from synthetic import synthetic_map_data
+
+    parser = argparse.ArgumentParser(description="Repair a route when the worker steps off it.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--synthetic", nargs=2, type=int, metavar=("ROWS", "COLS"),
+                        help="use a synthetic warehouse of the given size instead of the data file")
+    parser.add_argument("--queries", type=int, default=200, help="the number of off-route queries")
+    parser.add_argument("--steps", type=int, default=3, help="the number of random steps off the route")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        map_data = synthetic_map_data(*args.synthetic)
+    else:
+        items, shelves = read_map_data(args.data)
+        map_data = MapData(Worker(0, 0), shelves, items, items[0])
+
+    results = benchmark(map_data, args.queries, args.steps)
+    print("{:<18} {:>14} {:>12} {:>8}".format("Method", "Mean time (ms)", "Mean extra", "Failed"))
+    for method, result in results.items():
+        print("{:<18} {:>14.3f} {:>12.2f} {:>8}".format(method, 1000 * result["time"] / args.queries,
+                                                         result["extra"], result["failed"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""--------------------------------------------------------
+    Compact search traces.
+    TraceRecorder packs every expansion and every NodeState change of a search into one 32-bit integer,
+    (cell id << 3) | code, where cell id = x * map_col + y and the code is the new NodeState value,
+    or EXPAND for an expansion. TraceReplayer rebuilds the frames offline,
+    so a search can run with render=False and still be looked at afterwards.
+    --------------------------------------------------------"""
+
+import json
+import struct
+from array import array
+from time import sleep
+
+from display import draw_map, refresh
+from service import NodeState
+
+MAGIC = b"LPTRC"
+VERSION = 1
+# magic, version, map_row, map_col, number of events
+HEADER = struct.Struct("<5sHIIQ")
+
+# The NodeState values use the codes 0 to 6
+EXPAND = 7
+CODE_BITS = 3
+CODE_MASK = (1 << CODE_BITS) - 1
+
+
+class TraceRecorder:
+    """
+    A class to record the trace of a search on a Map.
+    The recorder is attached to the map on creation, Map.reset() starts a new trace.
+    The initial state of every node is kept as one byte per node, the events as an array of 32-bit integers.
+    """
+
+    def __init__(self, grid_map=None):
+        self.map_row = 0
+        self.map_col = 0
+        self.initial = bytearray()
+        self.events = array("I")
+        if grid_map is not None:
+            grid_map.recorder = self
+            self.start(grid_map)
+
+    def start(self, grid_map):
+        """
+        The start function takes a snapshot of the map and clears the recorded events.
+
+        :param grid_map: The Map to record
+        """
+
+        self.map_row = grid_map.map_row
+        self.map_col = grid_map.map_col
+        self.initial = bytearray(block.state.value for row in grid_map.grid for block in row)
+        self.events = array("I")
+
+    def transition(self, block, state):
+        """Records that the node changed to the given state."""
+
+        self.events.append((block.x * self.map_col + block.y) << CODE_BITS | state.value)
+
+    def expand(self, block):
+        """Records that the node is expanded."""
+
+        self.events.append((block.x * self.map_col + block.y) << CODE_BITS | EXPAND)
+
+    def __len__(self):
+        return len(self.events)
+
+    def save(self, filename):
+        """
+        The save function writes the trace to a binary file:
+        the header, the initial states (one byte per node) and the events (4 bytes per event).
+
+        :param filename: A string representing the name of the file to write
+        """
+
+        with open(filename, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, VERSION, self.map_row, self.map_col, len(self.events)))
+            file.write(self.initial)
+            self.events.tofile(file)
+
+    @staticmethod
+    def load(filename):
+        """
+        The load function reads a trace written by save().
+
+        :param filename: A string representing the name of the file to read
+        :return: A TraceRecorder holding the trace
+        """
+
+        trace = TraceRecorder()
+        with open(filename, 'rb') as file:
+            magic, version, trace.map_row, trace.map_col, count = HEADER.unpack(file.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("Not a lazy picker search trace (version " + str(VERSION) + "): " + filename)
+            trace.initial = bytearray(file.read(trace.map_row * trace.map_col))
+            trace.events.fromfile(file, count)
+        return trace
+
+
+class TraceReplayer:
+    """
+    A class to rebuild the frames of a recorded search.
+    A frame is the state of every node right before an expansion, like the frames Map.visualize() prints,
+    the last frame is the state at the end of the search.
+    """
+
+    def __init__(self, trace):
+        self.trace = trace
+
+    def frames(self):
+        """
+        The frames function yields the frames of the search one by one.
+        The same bytearray is updated in place between two frames, copy it to keep a frame.
+
+        :return: A generator of (expanded position or None for the last frame, states), where states[x * map_col + y]
+                 is the NodeState value of the node at (x, y)
+        """
+
+        map_col = self.trace.map_col
+        states = bytearray(self.trace.initial)
+        for event in self.trace.events:
+            cell = event >> CODE_BITS
+            code = event & CODE_MASK
+            if code == EXPAND:
+                yield divmod(cell, map_col), states
+            else:
+                states[cell] = code
+        yield None, states
+
+    def expansions(self):
+        """Returns the positions of the expanded nodes, in order."""
+
+        return [divmod(event >> CODE_BITS, self.trace.map_col)
+                for event in self.trace.events if event & CODE_MASK == EXPAND]
+
+    def play(self, refresh_rate=0.2):
+        """
+        The play function prints the frames in the terminal, like a live search does.
+
+        :param refresh_rate: The refresh rate of the map
+        """
+
+        map_row, map_col = self.trace.map_row, self.trace.map_col
+        for expanded, states in self.frames():
+            draw_map(lambda x, y: NodeState(states[x * map_col + y]), map_row, map_col)
+            if expanded is not None:
+                sleep(refresh_rate)
+                refresh()
+
+    def export(self, filename):
+        """
+        The export function writes the frames to a JSON lines file, one frame per line.
+        Each frame has its number, the expanded position and one string of NodeState values per row of the map.
+
+        :param filename: A string representing the name of the file to write
+        """
+
+        map_col = self.trace.map_col
+        with open(filename, 'w') as file:
+            for number, (expanded, states) in enumerate(self.frames()):
+                rows = ["".join(str(value) for value in states[x * map_col:(x + 1) * map_col])
+                        for x in range(self.trace.map_row)]
+                file.write(json.dumps({"frame": number, "expanded": expanded, "states": rows}) + "\n")
@@ -1,5 +1,6 @@
+import heapq
+import itertools
 import math
-import os
 
 from enum import Enum
 from time import sleep
@@ -29,6 +30,10 @@ class NodeState(Enum):
 
 
 class Block:
+    # A Map holds one Block per cell, the slots keep them small and quick to build on a fine grid
+    __slots__ = ("x", "y", "pos", "state", "parent", "given_cost", "heuristic", "total_cost", "final_cost",
+                 "neighbours")
+
     def __init__(self, x, y):
         self.x = x
         self.y = y
@@ -113,8 +118,12 @@ class Block:
 class Map:
     """A class to represent the map of the warehouse."""
 
-    def __init__(self, map_data):
+    def __init__(self, map_data, render=True):
         self.map_data = map_data
+        # Set render to False to run the searches without printing the map
+        self.render = render
+        # Optional search trace recorder, see search_trace.TraceRecorder
+        self.recorder = None
         # All the map data (Not for display) are down here, don't touch this
         self.worker = map_data.worker
         self.org_pos = map_data.worker_org
@@ -126,28 +135,68 @@ class Map:
 
         # All the map component are down here, use this to implement the algorithm
         self.grid = [[Block(i, j) for j in range(self.map_col)] for i in range(self.map_row)]
+        # The nodes whose state a search changed, reset() only puts those back while the layout is the same
+        self.dirty = []
+        self.layout = None
+        self.shelf_pos = set()
+        # The largest given cost of the grid, the number of buckets of Dial's algorithm
+        self.max_cost = 1
+        self.start_block = None
+        self.target_block = None
 
         # Initialize the map component, don't touch this
-        for i in range(self.map_row):
-            for j in range(self.map_col):
-                if self.grid[i][j].pos == self.worker.pos:
-                    self.grid[i][j].state = NodeState.START
-                    self.start_block = self.grid[i][j]  # ! start_block
-
-                elif self.grid[i][j].pos == self.target.pos:
-                    self.grid[i][j].state = NodeState.GOAL
-                    self.target_block = self.grid[i][j]  # ! target_block
-
-                elif self.grid[i][j].pos in list(map(lambda x: x.pos, self.shelves)):
-                    self.grid[i][j].state = NodeState.BLOCK
-                else:
-                    self.grid[i][j].state = NodeState.NEW
+        self.reset()
+
+    def reset(self):
+        """
+        The reset function puts the map back to its initial state, so that the same Map can run another search.
+        It reads the current worker and target from the map data, so a new start point or target item
+        set on the MapData object is picked up without building a new grid.
+        """
+
+        self.worker = self.map_data.worker
+        self.target = self.map_data.target
+        costs = self.map_data.costs or {}
+
+        # The whole grid is swept when the shelves or costs changed, otherwise only the nodes of the last search,
+        # which keeps reset() in proportion to the search on a fine grid
+        layout = (self.map_data.version, id(self.map_data.costs), id(self.map_data.shelves), len(self.map_data.shelves))
+        if layout != self.layout:
+            self.layout = layout
+            self.shelves = self.map_data.shelves
+            self.shelf_pos = {shelf.pos for shelf in self.shelves}
+            self.max_cost = max(1, max(costs.values(), default=1))
+            blocks = (block for row in self.grid for block in row)
+        else:
+            blocks = self.dirty + [block for block in (self.start_block, self.target_block) if block is not None]
+        self.dirty = []
+
+        for block in blocks:
+            block.parent = None
+            block.heuristic = 0
+            block.total_cost = 0
+            block.final_cost = 0
+            block.given_cost = costs.get(block.pos, 1)
+            block.state = NodeState.BLOCK if block.pos in self.shelf_pos else NodeState.NEW
+
+        for name, (x, y) in (("worker", self.worker.pos), ("target", self.target.pos)):
+            if not (0 <= x < self.map_row and 0 <= y < self.map_col):
+                raise ValueError("The " + name + " at " + str((x, y)) + " is out of the map")
+        self.start_block = self.grid[self.worker.pos[0]][self.worker.pos[1]]  # ! start_block
+        self.start_block.state = NodeState.START
+        self.target_block = self.grid[self.target.pos[0]][self.target.pos[1]]  # ! target_block
+        if self.target_block is not self.start_block:
+            self.target_block.state = NodeState.GOAL
 
         self.open_list = [self.start_block]
         self.closed_list = []
         self.path = []
         self.iteration = 0
         self.has_path = False
+        # Optional exact heuristic for A*, see use_heuristic_table()
+        self.heuristic_table = None
+        if self.recorder is not None:
+            self.recorder.start(self)
 
     def iterate(self, algorithm, curr):
         """
@@ -170,6 +219,29 @@ class Map:
             self.bfs_iterate(curr)
         elif algorithm == Algorithm.DFS:
             self.dfs_iterate(curr)
+        elif algorithm == Algorithm.DIAL:
+            self.dial_iterate(curr)
+
+    def search(self, algorithm):
+        """
+        Run a whole search with any algorithm.
+        This function will call the corresponding search function to the algorithm.
+
+        :param algorithm: The algorithm to be used
+        :return: A list of nodes representing the path from the worker to the target, empty if there is no path.
+        """
+
+        if algorithm == Algorithm.A_STAR:
+            self.a_star()
+        elif algorithm == Algorithm.DIJKSTRA:
+            self.dijkstra()
+        elif algorithm == Algorithm.BFS:
+            self.bfs()
+        elif algorithm == Algorithm.DFS:
+            self.dfs()
+        elif algorithm == Algorithm.DIAL:
+            self.dial()
+        return self.path
 
     def a_star(self):
         """
@@ -186,7 +258,7 @@ class Map:
         self.open_list = [curr]
         self.closed_list = []
 
-        while not self.has_path:  # Keep iterating until a path is found
+        while not self.has_path and self.open_list:  # Keep iterating until a path is found
             self.visualize()
             self.iteration += 1  # Record the number of iterations
             curr = self.open_list.pop(0)  # Pick the first node from the open list
@@ -208,10 +280,12 @@ class Map:
         :param curr: The current node
         """
 
+        self.record_expand(curr)
+
         for neighbour in self.get_neighbours(curr):
             state = neighbour.state
             new_cost = curr.total_cost + neighbour.given_cost
-            new_final_cost = new_cost + FACTOR * neighbour.cal_heuristic(self.target_block)
+            new_final_cost = new_cost + self.estimate(neighbour)
 
             if state == NodeState.GOAL:
                 # If the neighbour is next to the target node, then the path is found
@@ -221,7 +295,7 @@ class Map:
 
             elif state == NodeState.NEW:
                 # If the neighbour is a new node, then add it to the open list
-                neighbour.state = NodeState.OPEN
+                self.set_state(neighbour, NodeState.OPEN)
                 neighbour.parent = curr
                 neighbour.total_cost = new_cost
                 neighbour.final_cost = new_final_cost
@@ -246,16 +320,42 @@ class Map:
                     neighbour.parent = curr
 
                     # Also update the neighbour's state
-                    neighbour.state = NodeState.OPEN
+                    self.set_state(neighbour, NodeState.OPEN)
                     # Also update the neighbour's cost and parent
                     self.closed_list.remove(neighbour)
                     self.open_list.append(neighbour)
                     continue
         # Add the current node to the closed list and set its state to closed
         self.closed_list.append(curr)
-        curr.state = NodeState.CLOSE
-        # Sort the open list by the final cost
-        self.open_list.sort(key=lambda x: x.final_cost)
+        self.set_state(curr, NodeState.CLOSE)
+        # Sort the open list by the final cost, on a tie the node further from the start goes first
+        self.open_list.sort(key=lambda x: (x.final_cost, -x.total_cost))
+
+    def use_heuristic_table(self, table):
+        """
+        Let A* use a precomputed heuristic table instead of the Euclidean distance.
+        The table is indexed by [x, y], e.g. the distance field rooted at the target from wavefront.heuristic_table().
+        A negative value means the target can not be reached from that cell.
+
+        :param table: The heuristic table, or None to go back to the Euclidean heuristic
+        """
+
+        self.heuristic_table = table
+
+    def estimate(self, block):
+        """ The estimate function returns the heuristic cost A* uses for the given node.
+
+        :param block: The node to estimate
+        :return: The heuristic cost from the node to the target
+        """
+
+        if self.heuristic_table is None:
+            return FACTOR * block.cal_heuristic(self.target_block)
+
+        block.heuristic = int(self.heuristic_table[block.x][block.y])
+        if block.heuristic < 0:
+            block.heuristic = math.inf
+        return block.heuristic
 
     def bfs(self):
         """A function to find the shortest path from the worker to the target using the BFS algorithm.
@@ -271,12 +371,14 @@ class Map:
         self.open_list = [curr]
         self.closed_list = []
 
-        while not self.has_path:  # Keep iterating until a path is found
+        while not self.has_path and self.open_list:  # Keep iterating until a path is found
             self.visualize()
             self.iteration += 1  # Record the number of iterations
             curr = self.open_list.pop(0)  # Pick the first node from the open list
             self.bfs_iterate(curr)
 
+        return self.path
+
     def bfs_iterate(self, curr):
         """ A function to represent an iteration of BFS algorithm.
         The function will check all the neighbours of the current node and do the following:
@@ -287,6 +389,8 @@ class Map:
         :param curr: The current node
         """
 
+        self.record_expand(curr)
+
         for neighbour in self.get_neighbours(curr):
             state = neighbour.state
             if state == NodeState.GOAL:
@@ -295,7 +399,7 @@ class Map:
                 return self.path
 
             elif state == NodeState.NEW:
-                neighbour.state = NodeState.OPEN
+                self.set_state(neighbour, NodeState.OPEN)
                 neighbour.parent = curr
                 self.open_list.append(neighbour)
                 continue
@@ -307,7 +411,7 @@ class Map:
                 continue
 
         self.closed_list.append(curr)
-        curr.state = NodeState.CLOSE
+        self.set_state(curr, NodeState.CLOSE)
 
     def dfs(self):
         """
@@ -324,7 +428,7 @@ class Map:
         self.open_list = [curr]
         self.closed_list = []
 
-        while not self.has_path:  # Keep iterating until a path is found
+        while not self.has_path and self.open_list:  # Keep iterating until a path is found
             self.visualize()
             self.iteration += 1  # Record the number of iterations
             curr = self.open_list.pop()  # Pick the last node from the open list
@@ -341,6 +445,9 @@ class Map:
 
         :param curr: The current node
         """
+
+        self.record_expand(curr)
+
         for neighbour in self.get_neighbours(curr):
             state = neighbour.state
             if state == NodeState.GOAL:
@@ -349,7 +456,7 @@ class Map:
                 return self.path
 
             elif state == NodeState.NEW:
-                neighbour.state = NodeState.OPEN
+                self.set_state(neighbour, NodeState.OPEN)
                 neighbour.parent = curr
                 self.open_list.append(neighbour)
                 continue
@@ -361,7 +468,7 @@ class Map:
                 continue
 
         self.closed_list.append(curr)
-        curr.state = NodeState.CLOSE
+        self.set_state(curr, NodeState.CLOSE)
 
     def dijkstra(self):
         """
@@ -379,7 +486,7 @@ class Map:
         self.open_list = [curr]
         self.closed_list = []
 
-        while not self.has_path:  # Keep iterating until a path is found
+        while not self.has_path and self.open_list:  # Keep iterating until a path is found
             self.visualize()
             curr = self.open_list.pop(0)  # Pick the first node from the open list
             self.iteration += 1  # Record the number of iterations
@@ -399,6 +506,8 @@ class Map:
         :param curr: The current node
         """
 
+        self.record_expand(curr)
+
         for neighbour in self.get_neighbours(curr):
             # Calculate the new total cost
             new_total_cost = curr.total_cost + neighbour.given_cost
@@ -421,7 +530,7 @@ class Map:
 
             elif neighbour.state == NodeState.NEW:
                 # If the neighbour is a new node, then add it to the open list
-                neighbour.state = NodeState.OPEN
+                self.set_state(neighbour, NodeState.OPEN)
                 neighbour.parent = curr
                 neighbour.total_cost = new_total_cost
                 self.open_list.append(neighbour)
@@ -429,10 +538,204 @@ class Map:
 
         # When all the neighbours are checked, add the current node to the closed list
         self.closed_list.append(curr)
-        curr.state = NodeState.CLOSE
+        self.set_state(curr, NodeState.CLOSE)
         # Sort the open list by the total cost of the nodes
         self.open_list.sort(key=lambda x: x.total_cost)
 
+    def dial(self):
+        """
+        A function to find the cheapest path from the worker to the target using Dial's algorithm,
+        a Dijkstra whose open list is a circular array of buckets, one bucket per total cost.
+        Because the given costs are small integers, the buckets only need to cover (max given cost + 1) totals,
+        so picking the next node is a scan over a few buckets instead of a sort of the whole open list.
+        Unlike dijkstra(), the path is only accepted when the target itself is picked,
+        so it is the cheapest one when the blocks have different given costs.
+
+        :return: A list of nodes representing the cheapest path from the worker to the target.
+        """
+
+        self.buckets = [[] for _ in range(self.max_cost + 1)]
+        self.bucket_cost = 0
+        self.buckets[0].append(self.start_block)
+        self.closed_list = []
+
+        while not self.has_path:  # Keep iterating until a path is found
+            curr = self.pop_bucket()
+            if curr is None:  # The target can not be reached
+                break
+            self.visualize()
+            self.iteration += 1  # Record the number of iterations
+            self.dial_iterate(curr)
+
+        return self.path
+
+    def pop_bucket(self):
+        """
+        A function to pick the next node of Dial's algorithm, the one with the lowest total cost.
+        The buckets are scanned from the current cost, a node whose total cost was lowered after it was
+        put in a bucket is left behind in its old bucket and skipped here.
+
+        :return: The next node, or None if all the buckets are empty
+        """
+
+        size = len(self.buckets)
+        for _ in range(size):
+            bucket = self.buckets[self.bucket_cost % size]
+            while bucket:
+                block = bucket.pop()
+                if block.state != NodeState.CLOSE and block.total_cost == self.bucket_cost:
+                    return block
+            self.bucket_cost += 1
+        return None
+
+    def dial_iterate(self, curr):
+        """ A function to represent an iteration of Dial's algorithm.
+        1. If the current node is the target node, then the path is found.
+        2. Otherwise, relax all the neighbours of the current node and put them in the bucket of their total cost.
+        3. When all the neighbours are checked, add the current node to the closed list.
+
+        :param curr: The current node
+        """
+
+        self.record_expand(curr)
+
+        if curr.state == NodeState.GOAL:
+            self.get_path(curr)
+            return self.path
+
+        size = len(self.buckets)
+        for neighbour in self.relax_neighbours(curr):
+            self.buckets[neighbour.total_cost % size].append(neighbour)
+
+        self.closed_list.append(curr)
+        self.set_state(curr, NodeState.CLOSE)
+
+    def heap_dijkstra(self):
+        """
+        A function to find the cheapest path from the worker to the target using a binary-heap Dijkstra's algorithm.
+        It is the reference implementation dial() is checked against.
+
+        :return: A list of nodes representing the cheapest path from the worker to the target.
+        """
+
+        self.counter = itertools.count()  # Break ties in the heap without comparing the nodes
+        self.heap = [(0, next(self.counter), self.start_block)]
+        self.closed_list = []
+
+        while not self.has_path and self.heap:
+            total_cost, _, curr = heapq.heappop(self.heap)
+            if curr.state == NodeState.CLOSE or total_cost != curr.total_cost:
+                continue  # Skip the stale heap entries
+            self.visualize()
+            self.iteration += 1  # Record the number of iterations
+            self.heap_dijkstra_iterate(curr)
+
+        return self.path
+
+    def heap_dijkstra_iterate(self, curr):
+        """ A function to represent an iteration of the heap-based Dijkstra algorithm.
+
+        :param curr: The current node
+        """
+
+        self.record_expand(curr)
+
+        if curr.state == NodeState.GOAL:
+            self.get_path(curr)
+            return self.path
+
+        for neighbour in self.relax_neighbours(curr):
+            heapq.heappush(self.heap, (neighbour.total_cost, next(self.counter), neighbour))
+
+        self.closed_list.append(curr)
+        self.set_state(curr, NodeState.CLOSE)
+
+    def relax_neighbours(self, curr):
+        """
+        A function to relax the neighbours of the current node for the weighted searches.
+        A neighbour is updated if it has not been reached yet or if the new total cost is lower.
+        The target node keeps its GOAL state, so the search knows when it is picked.
+
+        :param curr: The current node
+        :return: The list of neighbours whose total cost was updated
+        """
+
+        updated = []
+        for neighbour in self.get_neighbours(curr):
+            state = neighbour.state
+            if state == NodeState.CLOSE or state == NodeState.START:
+                continue
+
+            new_total_cost = curr.total_cost + neighbour.given_cost
+            if neighbour.parent is None or new_total_cost < neighbour.total_cost:
+                neighbour.total_cost = new_total_cost
+                neighbour.parent = curr
+                if state == NodeState.NEW:
+                    self.set_state(neighbour, NodeState.OPEN)
+                updated.append(neighbour)
+        return updated
+
+    def nearest_location(self, positions):
+        """
+        A function to find the path from the worker to the nearest of several locations of the same item.
+        All the locations are marked as GOAL and one search is expanded from the worker,
+        it stops at the first location it reaches, so the cost is one search whatever the number of locations.
+        BFS is used on a unit-cost map and Dial's algorithm on a weighted map.
+
+        :param positions: The (x, y) positions where the item is stocked
+        :return: A list of nodes representing the path from the worker to the nearest location,
+                 the location it ends on becomes the target_block.
+        """
+
+        self.reset()
+        # The target of the map data is not one of the locations, unless it is listed
+        if self.target_block.state == NodeState.GOAL and self.target_block.pos not in positions:
+            state = NodeState.BLOCK if self.target_block.pos in self.shelf_pos else NodeState.NEW
+            self.set_state(self.target_block, state)
+        for x, y in positions:
+            if 0 <= x < self.map_row and 0 <= y < self.map_col and self.grid[x][y].state != NodeState.START:
+                self.set_state(self.grid[x][y], NodeState.GOAL)
+
+        if self.map_data.costs:
+            self.dial()
+        else:
+            self.bfs()
+
+        if self.has_path:
+            self.target_block = self.path[-1]
+        return self.path
+
+    def path_cost(self):
+        """ The path_cost function returns the total given cost of the path, the start node is free.
+
+        :return: The cost of the path, or None if no path has been found
+        """
+
+        if not self.has_path:
+            return None
+        return sum(block.given_cost for block in self.path[1:])
+
+    def set_state(self, block, state):
+        """ The set_state function changes the state of a node during a search, and records it if a trace is recorded.
+
+        :param block: The node
+        :param state: The new state of the node
+        """
+
+        block.state = state
+        self.dirty.append(block)
+        if self.recorder is not None:
+            self.recorder.transition(block, state)
+
+    def record_expand(self, curr):
+        """ The record_expand function records that the current node is expanded, if a trace is recorded.
+
+        :param curr: The current node
+        """
+
+        if self.recorder is not None:
+            self.recorder.expand(curr)
+
     def get_path(self, curr):
         """
         A function to get the path from the worker to the target.
@@ -443,20 +746,21 @@ class Map:
         """
 
         self.has_path = True
-        curr.state = NodeState.GOAL
+        self.set_state(curr, NodeState.GOAL)
         self.path.append(curr)
         # Start from the target and reach the start node recursively
         while curr.parent is not None:
             curr = curr.parent
-            curr.state = NodeState.PATH
+            self.set_state(curr, NodeState.PATH)
             self.path.append(curr)
 
-        curr.state = NodeState.START
+        self.set_state(curr, NodeState.START)
 
         # Reverse the path to get the correct order
         self.path.reverse()
-        self.visualize(False)
-        self.print_path_description()
+        if self.render:
+            self.visualize(False)
+            self.print_path_description()
 
     def get_neighbours(self, curr):
         """
@@ -497,51 +801,13 @@ class Map:
         :param refresh_rate: The refresh rate of the map.
         """
 
-        print_banner()
-        # Print the map
-        for y in range(self.map_col - 1, -1, -1):
-            # Print the y-axis index
-            # if the y-axis index is less than 10, then print the index with 2 spaces
-            if 0 <= y < 10:
-                print(y, end="  ")
-            # if the y-axis index is more than 10, then print the index with 1 space
-            elif y >= 10:
-                print(y, end=" ")
-            # Print the map content
-            for x in range(self.map_row):
-                if self.grid[x][y].state == NodeState.GOAL:
-                    print("\U0001F3AF", end=" ")
-                elif self.grid[x][y].state == NodeState.START:
-                    print("\U0001F680", end=" ")
-                elif self.grid[x][y].state == NodeState.BLOCK:
-                    print("\U0001F6AA", end=" ")
-                elif self.grid[x][y].state == NodeState.PATH:
-                    print("\U0001F7E9", end=" ")
-                elif self.grid[x][y].state == NodeState.CLOSE:
-                    print("\U0001F534", end=" ")
-                elif self.grid[x][y].state == NodeState.OPEN:
-                    print("\U0001F50E", end=" ")
-                    # print("\U0001F7E9", end=" ")
-                else:
-                    print("\U0001F518", end=" ")
-                    # print("\U0001F535", end=" ")
-            print()
-        # Print the x-axis index
-        for i in range(self.map_row + 1):
-            # Empty space for the left bottom corner
-            if i == 0:
-                print(" ", end="  ")
-            # Print the x-axis index
-            elif 0 < i < 10:
-                print(i - 1, end="  ")
-            elif i >= 10:
-                print(i - 1, end=" ")
-        print()
-        print()
-        print("'\U0001F680': is the start point, '\U0001F3AF': is where your target item located, "
-              "'\U0001F6AA' is the block")
-        print("'\U0001F7E9' is the path, '\U0001F50E': is in the node will be searched. "
-              "'\U0001F534' is the node has been searched")
+        if not self.render:
+            return
+
+        # Imported here, a headless Map never loads the terminal rendering
+        from display import draw_map, refresh
+
+        draw_map(lambda x, y: self.grid[x][y].state, self.map_row, self.map_col)
 
         if is_refresh:
             sleep(refresh_rate)
@@ -617,27 +883,3 @@ class Map:
 
             for sentence in path_description:
                 print(sentence)
-
-
-def refresh():
-    """A function to clear the screen by using the os.system() function.
-    :return: None
-    """
-
-    os.system('cls' if os.name == 'nt' else 'clear')
-
-
-def print_banner():
-    """ Used to print the banner."""
-
-    print()
-    print("--------------------------------------------------------------------------------------------------------")
-    print("▄▀▀▀▀▄      ▄▀▀█▄   ▄▀▀▀▀▄   ▄▀▀▄ ▀▀▄      ▄▀▀▄▀▀▀▄  ▄▀▀█▀▄    ▄▀▄▄▄▄   ▄▀▀▄ █  ▄▀▀█▄▄▄▄  ▄▀▀▄▀▀▀▄")
-    print("█    █      ▐ ▄▀ ▀▄ █     ▄▀ █   ▀▄ ▄▀     █   █   █ █   █  █  █ █    ▌ █  █ ▄▀ ▐  ▄▀   ▐ █   █   █")
-    print("▐    █        █▄▄▄█ ▐ ▄▄▀▀   ▐     █       ▐  █▀▀▀▀  ▐   █  ▐  ▐ █      ▐  █▀▄    █▄▄▄▄▄  ▐  █▀▀█▀ ")
-    print("    █        ▄▀   █   █            █          █          █       █        █   █   █    ▌   ▄▀    █ ")
-    print("  ▄▀▄▄▄▄▄▄▀ █   ▄▀     ▀▄▄▄▄▀    ▄▀         ▄▀        ▄▀▀▀▀▀▄   ▄▀▄▄▄▄▀ ▄▀   █   ▄▀▄▄▄▄   █     █ ")
-    print("  █         ▐   ▐          ▐     █         █         █       █ █     ▐  █    ▐   █    ▐   ▐     ▐ ")
-    print("  ▐                              ▐         ▐         ▐       ▐ ▐        ▐        ▐            ")
-    print("--------------------------------------------------------------------------------------------------------")
-    print()
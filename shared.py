@@ -0,0 +1,363 @@
+"""--------------------------------------------------------
+    Shared-memory map and distance tables for worker processes.
+    The parent process publishes the occupancy grid, the costs, the item index and the precomputed tables
+    (shortest-path trees, landmark fields) into multiprocessing.shared_memory blocks once,
+    the worker processes attach to them as read-only NumPy views, without copying or rebuilding anything.
+    Only the small handle (block names, shapes and dtypes) is sent to the workers.
+    --------------------------------------------------------"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from time import perf_counter
+
+import numpy as np
+
+from core import gen_item_index
+from data import MapData
+from entities import Item, Shelf, Worker
+from landmarks import Landmarks
+from path_tree import ShortestPathTree
+from wavefront import occupancy_grid
+
+# The attached map of a pool process, set once by _init_process()
+_shared = None
+_startup = 0.0
+
+
+class SharedTables:
+    """
+    A class to own the shared-memory blocks published by the parent process.
+    The blocks are unlinked by close(), or at the end of a with block.
+    """
+
+    def __init__(self, map_row, map_col):
+        self.map_row = map_row
+        self.map_col = map_col
+        self.blocks = {}
+        self.arrays = {}
+
+    def publish(self, name, array):
+        """
+        The publish function copies an array into a new shared-memory block.
+
+        :param name: The name of the table
+        :param array: The NumPy array
+        :return: The view of the array in shared memory
+        """
+
+        array = np.ascontiguousarray(array)
+        block = SharedMemory(create=True, size=max(1, array.nbytes))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        self.blocks[name] = block
+        self.arrays[name] = view
+        return view
+
+    def handle(self):
+        """Returns the picklable handle the workers attach with: the map size and the name, shape and dtype of
+        every block."""
+
+        return {
+            "map_row": self.map_row,
+            "map_col": self.map_col,
+            "arrays": {name: (self.blocks[name].name, view.shape, view.dtype.str)
+                       for name, view in self.arrays.items()},
+        }
+
+    def nbytes(self):
+        """Returns the size of the published tables in bytes."""
+
+        return sum(view.nbytes for view in self.arrays.values())
+
+    def close(self):
+        """Releases and unlinks every block, the workers must be done with them."""
+
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SharedItemIndex:
+    """
+    A class to look up the item index in flat arrays, it can replace the {item_id: [(x, y), ...]} dictionary
+    of MapData.item_index: the sorted item ids, the offset of each id's locations and the locations.
+    """
+
+    def __init__(self, ids, offsets, locations):
+        self.ids = ids
+        self.offsets = offsets
+        self.locations = locations
+
+    def get(self, item_id, default=None):
+        index = int(np.searchsorted(self.ids, item_id))
+        if index == len(self.ids) or self.ids[index] != item_id:
+            return default
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return [(int(x), int(y)) for x, y in self.locations[start:end]]
+
+    def __contains__(self, item_id):
+        return self.get(item_id) is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def index_arrays(item_index):
+    """
+    The index_arrays function flattens an item index into the arrays of SharedItemIndex.
+
+    :param item_index: The dictionary {item_id: [(x, y), ...]}
+    :return: The (ids int64, offsets int64, locations int32) arrays
+    """
+
+    ids = np.array(sorted(item_index), dtype=np.int64)
+    counts = [len(item_index[item_id]) for item_id in ids.tolist()]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+    locations = np.array([pos for item_id in ids.tolist() for pos in item_index[item_id]],
+                         dtype=np.int32).reshape(-1, 2)
+    return ids, offsets, locations
+
+
+def publish_map(map_data, starts=(), landmarks=None):
+    """
+    The publish_map function publishes the tables of a map into shared memory.
+
+    :param map_data: The MapData object, its item index is built if needed
+    :param starts: The (x, y) start cells whose shortest-path trees are published
+    :param landmarks: Optional Landmarks whose distance fields are published
+    :return: The SharedTables, pass its handle() to the workers
+    """
+
+    if map_data.item_index is None:
+        map_data.update("item_index", gen_item_index(map_data.items))
+
+    tables = SharedTables(map_data.map_row, map_data.map_col)
+    tables.publish("blocked", occupancy_grid(map_data))
+    if map_data.costs:
+        costs = np.ones((map_data.map_row, map_data.map_col), dtype=np.int32)
+        for (x, y), value in map_data.costs.items():
+            costs[x, y] = value
+        tables.publish("costs", costs)
+
+    ids, offsets, locations = index_arrays(map_data.item_index)
+    tables.publish("item_ids", ids)
+    tables.publish("item_offsets", offsets)
+    tables.publish("item_locations", locations)
+
+    if starts:
+        size = map_data.map_row * map_data.map_col
+        dist = np.empty((len(starts), size), dtype=np.int32)
+        parent = np.empty((len(starts), size), dtype=np.int32)
+        for index, start in enumerate(starts):
+            tree = ShortestPathTree(map_data, start)
+            dist[index], parent[index] = tree.dist, tree.parent
+        tables.publish("tree_starts", np.array(starts, dtype=np.int32))
+        tables.publish("tree_dist", dist)
+        tables.publish("tree_parent", parent)
+
+    if landmarks is not None:
+        tables.publish("landmark_positions", np.array(landmarks.positions, dtype=np.int32))
+        tables.publish("landmark_dist", landmarks.dist)
+    return tables
+
+
+class SharedMap:
+    """
+    A class to attach a worker process to the published tables, every table is a read-only view.
+    """
+
+    def __init__(self, handle):
+        self.map_row = handle["map_row"]
+        self.map_col = handle["map_col"]
+        self.blocks = []
+        self.arrays = {}
+        for name, (block_name, shape, dtype) in handle["arrays"].items():
+            block = SharedMemory(name=block_name)
+            view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+            view.flags.writeable = False
+            self.blocks.append(block)
+            self.arrays[name] = view
+
+        self.item_index = SharedItemIndex(self.arrays["item_ids"], self.arrays["item_offsets"],
+                                          self.arrays["item_locations"])
+        starts = self.arrays.get("tree_starts")
+        self.tree_rows = {} if starts is None else {(int(x), int(y)): index for index, (x, y) in enumerate(starts)}
+
+    def map_data(self, worker_pos=(0, 0)):
+        """
+        The map_data function builds a MapData object over the shared tables, for the Map searches.
+        The shelves are rebuilt from the occupancy grid without their items, the item index is shared.
+
+        :param worker_pos: The (x, y) position of the worker
+        :return: A MapData object
+        """
+
+        blocked = self.arrays["blocked"]
+        shelves = [Shelf(index, int(x), int(y)) for index, (x, y) in enumerate(np.argwhere(blocked))]
+        costs = None
+        if "costs" in self.arrays:
+            grid = self.arrays["costs"]
+            costs = {(int(x), int(y)): int(grid[x, y]) for x, y in np.argwhere(grid != 1)}
+
+        item_id = int(self.item_index.ids[0])
+        x, y = self.item_index.get(item_id)[0]
+        return MapData(Worker(*worker_pos), shelves, [], Item(item_id, x, y), map_row=self.map_row,
+                       map_col=self.map_col, costs=costs, item_index=self.item_index)
+
+    def tree(self, start):
+        """Returns the published shortest-path tree rooted at the start cell, or None."""
+
+        row = self.tree_rows.get(start)
+        if row is None:
+            return None
+        return ShortestPathTree.from_arrays(start, self.map_row, self.map_col, self.arrays["tree_dist"][row],
+                                            self.arrays["tree_parent"][row])
+
+    def landmarks(self):
+        """Returns the published landmarks, or None."""
+
+        if "landmark_dist" not in self.arrays:
+            return None
+        return Landmarks.from_arrays(self.arrays["blocked"], self.arrays["landmark_positions"],
+                                     self.arrays["landmark_dist"])
+
+    def close(self):
+        """Detaches from the blocks, the owner unlinks them."""
+
+        self.arrays.clear()
+        self.item_index = None
+        for block in self.blocks:
+            block.close()
+        self.blocks.clear()
+
+
+def private_memory():
+    """Returns the memory private to this process in KB (Linux), or its peak RSS elsewhere."""
+
+    try:
+        with open("/proc/self/smaps_rollup") as file:
+            return sum(int(line.split()[1]) for line in file if line.startswith(("Private_Clean", "Private_Dirty")))
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _init_process(handle):
+    """Attaches the pool process to the shared tables."""
+
+    global _shared, _startup
+    start = perf_counter()
+    _shared = SharedMap(handle)
+    _startup = perf_counter() - start
+
+
+def _init_reload(filename, starts, landmark_count):
+    """Loads the data file and rebuilds every table in the pool process, the mode without shared memory."""
+
+    global _shared, _startup
+    from core import read_map_data
+
+    start = perf_counter()
+    items, shelves = read_map_data(filename)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0], item_index=gen_item_index(items))
+    trees = {start_pos: ShortestPathTree(map_data, start_pos) for start_pos in starts}
+    _shared = (map_data.item_index, trees, Landmarks(map_data, landmark_count) if landmark_count else None)
+    _startup = perf_counter() - start
+
+
+def _route(task):
+    """Answers one (start, item id) query from the trees, returns the distance and the process measures."""
+
+    start, item_id = task
+    if isinstance(_shared, SharedMap):
+        tree, locations = _shared.tree(start), _shared.item_index.get(item_id, [])
+    else:
+        item_index, trees, _ = _shared
+        tree, locations = trees[start], item_index.get(item_id, [])
+    ranked = tree.rank(locations)
+    return ranked[0][0] if ranked else None, os.getpid(), _startup, private_memory()
+
+
+def benchmark(filename, processes, queries=2000, landmark_count=8, seed=0):
+    """
+    The benchmark function answers the same route queries in a process pool with and without shared memory,
+    the trees of every free cell are precomputed.
+
+    :param filename: The item data file
+    :param processes: The number of processes
+    :param queries: The number of random (start, item) queries
+    :param landmark_count: The number of landmarks published as well, 0 for none
+    :param seed: The seed of the random generator
+    :return: A dictionary per mode of the mean startup time and private memory of a process and the total time
+    """
+
+    import random
+    from core import read_map_data
+
+    items, shelves = read_map_data(filename)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0])
+    starts = [tuple(int(value) for value in pos) for pos in np.argwhere(~occupancy_grid(map_data))]
+    rng = random.Random(seed)
+    tasks = [(rng.choice(starts), rng.choice(items).item_id) for _ in range(queries)]
+    chunksize = max(1, queries // (4 * processes))
+
+    results = {}
+    landmarks = Landmarks(map_data, landmark_count) if landmark_count else None
+    with publish_map(map_data, starts, landmarks) as tables:
+        modes = {
+            "shared": (_init_process, (tables.handle(),)),
+            "reload": (_init_reload, (filename, starts, landmark_count)),
+        }
+        answers = {}
+        for mode, (initializer, initargs) in modes.items():
+            start = perf_counter()
+            with ProcessPoolExecutor(max_workers=processes, initializer=initializer, initargs=initargs) as pool:
+                rows = list(pool.map(_route, tasks, chunksize=chunksize))
+            elapsed = perf_counter() - start
+            answers[mode] = [row[0] for row in rows]
+            per_process = {pid: (startup, memory) for _, pid, startup, memory in rows}
+            results[mode] = {
+                "processes": len(per_process),
+                "startup": sum(startup for startup, _ in per_process.values()) / len(per_process),
+                "memory": sum(memory for _, memory in per_process.values()) / len(per_process),
+                "time": elapsed,
+            }
+        results["tables"] = tables.nbytes()
+    assert answers["shared"] == answers["reload"], "The shared tables give different answers"
+    return results
+
+
+def main():
+    """
+    Command line entry point, compare the process startup and memory with and without shared memory.
+    """
+
+    parser = argparse.ArgumentParser(description="Share the map and distance tables between worker processes.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="the number of processes")
+    parser.add_argument("--queries", type=int, default=2000, help="the number of random queries")
+    parser.add_argument("--landmarks", type=int, default=8, help="the number of landmarks published, 0 for none")
+    args = parser.parse_args()
+
+    results = benchmark(args.data, args.processes, args.queries, args.landmarks)
+    print("Shared tables: {:.1f} KB".format(results.pop("tables") / 1024))
+    print("{:<8} {:>10} {:>14} {:>20} {:>10}".format("Mode", "Processes", "Startup (ms)", "Private memory (KB)",
+                                                      "Time (s)"))
+    for mode, result in results.items():
+        print("{:<8} {:>10} {:>14.1f} {:>20.0f} {:>10.2f}".format(mode, result["processes"], result["startup"] * 1000,
+                                                                  result["memory"], result["time"]))
+
+
+if __name__ == '__main__':
+    main()
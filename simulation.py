@@ -0,0 +1,302 @@
+"""--------------------------------------------------------
+    Discrete-event shift simulator for throughput planning.
+    An order stream (arrival time, item id) is replayed against a pool of Workers:
+    each order waits in a FIFO queue until a worker is idle, the nearest idle worker walks to the nearest location
+    of the item, picks it, and (by default) walks back to the depot to drop it off.
+    Walking distances come from the cached shortest-path trees, so a whole shift runs in seconds.
+    --------------------------------------------------------"""
+
+import argparse
+import heapq
+import random
+from collections import deque
+from time import perf_counter
+
+from core import gen_item_index
+from data import Algorithm, MapData
+from entities import Item, Worker
+from path_tree import NO_PARENT, TreeCache
+from service import Map
+
+# Event kinds, an order arrives or a worker finishes its task
+ORDER = 0
+DONE = 1
+
+SHIFT = 8 * 3600
+
+
+def generate_orders(items, rate, duration=SHIFT, seed=0):
+    """
+    The generate_orders function generates a Poisson order stream.
+
+    :param items: The list of all items, the ordered items are drawn from it
+    :param rate: The mean number of orders per hour
+    :param duration: The length of the stream in seconds
+    :param seed: The seed of the random generator
+    :return: A list of (arrival time in seconds, item id), in arrival order
+    """
+
+    rng = random.Random(seed)
+    orders = []
+    now = rng.expovariate(rate / 3600)
+    while now < duration:
+        orders.append((now, rng.choice(items).item_id))
+        now += rng.expovariate(rate / 3600)
+    return orders
+
+
+def read_orders(filename):
+    """
+    The read_orders function reads an order file: a header line, then the arrival time in seconds
+    and the item id of one order per line.
+
+    :param filename: A string representing the name of the order file
+    :return: A list of (arrival time in seconds, item id), in arrival order
+    """
+
+    orders = []
+    with open(filename, 'r') as file:
+        # Skip the first line of the file
+        next(file)
+        for line in file:
+            data = line.strip().split()
+            if data:
+                orders.append((float(data[0]), int(data[1])))
+    orders.sort()
+    return orders
+
+
+class ShiftSimulator:
+    """
+    A class to simulate a shift of a pool of workers picking single-item orders.
+    Times are in seconds, the walking speed is in cells (or cost units on a weighted map) per second.
+    """
+
+    def __init__(self, map_data, workers=50, depot=(0, 0), speed=1.0, pick_time=10.0, drop_time=5.0,
+                 return_to_depot=True, algorithm=None):
+        """
+        :param map_data: The MapData object (shelves, costs and item index)
+        :param workers: The number of workers, they all start at the depot
+        :param depot: The (x, y) cell where the orders are dropped off
+        :param speed: The walking speed
+        :param pick_time: The time to pick an item from its shelf
+        :param drop_time: The time to drop an item off at the depot
+        :param return_to_depot: Whether a worker walks back to the depot after each pick
+        :param algorithm: An Algorithm to route each task with Map.search(), default to the shortest-path trees
+        """
+
+        if map_data.item_index is None:
+            map_data.update("item_index", gen_item_index(map_data.items))
+
+        self.map_data = MapData(Worker(*depot), map_data.shelves, map_data.items, map_data.target,
+                                map_row=map_data.map_row, map_col=map_data.map_col, costs=map_data.costs,
+                                item_index=map_data.item_index)
+        self.workers = [Worker(*depot) for _ in range(workers)]
+        self.depot = depot
+        self.speed = speed
+        self.pick_time = pick_time
+        self.drop_time = drop_time
+        self.return_to_depot = return_to_depot
+        self.algorithm = algorithm
+        self.trees = TreeCache(self.map_data, capacity=map_data.map_row * map_data.map_col)
+        self.grid = Map(self.map_data, render=False) if algorithm is not None else None
+
+    def nearest(self, worker, locations):
+        """Returns the distance and position of the nearest location from the worker, or (None, None)."""
+
+        ranked = self.trees.get(worker.pos).rank(locations)
+        return ranked[0] if ranked else (None, None)
+
+    def route_length(self, worker, item_id, location):
+        """Returns the length (or cost) of the route from the worker to the item with the chosen algorithm."""
+
+        self.map_data.update("worker", worker)
+        self.map_data.update("target", Item(item_id, location[0], location[1]))
+        self.grid.reset()
+        self.grid.search(self.algorithm)
+        return self.grid.path_cost()
+
+    def assign(self, now, worker, item_id, location, distance):
+        """
+        The assign function sends a worker to pick an item and returns the time its task is done.
+        The worker ends at the depot, or on the cell it picked from if it does not return.
+        The worker is not sent if the algorithm finds no route to the item, or the depot can not be reached
+        from the cell it picks from.
+
+        :return: The time the task is done, or None if the worker is not sent
+        """
+
+        tree = self.trees.get(worker.pos)
+        if self.algorithm is not None:
+            distance = self.route_length(worker, item_id, location)
+            if distance is None:
+                return None
+        # The shelf is entered from its predecessor in the tree, the cell the worker picks from
+        parent = int(tree.parent[location[0] * tree.map_col + location[1]])
+        access = divmod(parent, tree.map_col) if parent != NO_PARENT else location
+        duration = distance / self.speed + self.pick_time
+
+        if self.return_to_depot:
+            back = self.trees.get(access).distance(self.depot)
+            if back is None:
+                return None
+            duration += back / self.speed + self.drop_time
+            end = self.depot
+        else:
+            end = access
+        worker.x, worker.y = end
+        worker.pos = end
+        return now + duration
+
+    def run(self, orders, duration=SHIFT):
+        """
+        The run function replays the order stream until the end of the shift.
+
+        :param orders: A list of (arrival time in seconds, item id), in arrival order
+        :param duration: The length of the shift in seconds
+        :return: A dictionary of the throughput, utilization and queueing measures
+        """
+
+        events = []
+        sequence = 0
+        for arrival, item_id in orders:
+            if arrival < duration:
+                events.append((arrival, sequence, ORDER, item_id))
+                sequence += 1
+        heapq.heapify(events)
+
+        idle = list(range(len(self.workers)))
+        busy = [0.0] * len(self.workers)
+        queue = deque()
+        waits = []
+        completed = 0
+        # The items of the orders dropped because no worker can route to them (and back to the depot)
+        unroutable = []
+        queue_area = 0.0
+        max_queue = 0
+        last = 0.0
+
+        while events and events[0][0] <= duration:
+            now, _, kind, payload = heapq.heappop(events)
+            queue_area += len(queue) * (now - last)
+            last = now
+            if kind == ORDER:
+                queue.append((now, payload))
+                max_queue = max(max_queue, len(queue))
+            else:
+                completed += 1
+                idle.append(payload)
+
+            # Give the oldest orders to the nearest idle workers
+            while queue and idle:
+                arrival, item_id = queue.popleft()
+                locations = self.map_data.get_locations(item_id)
+                best = None
+                for index in idle:
+                    distance, location = self.nearest(self.workers[index], locations)
+                    if distance is not None and (best is None or distance < best[0]):
+                        best = (distance, location, index)
+                if best is None:
+                    unroutable.append(item_id)
+                    continue
+
+                distance, location, index = best
+                end = self.assign(now, self.workers[index], item_id, location, distance)
+                if end is None:
+                    unroutable.append(item_id)
+                    continue
+                idle.remove(index)
+                waits.append(now - arrival)
+                busy[index] += min(end, duration) - now
+                heapq.heappush(events, (end, sequence, DONE, index))
+                sequence += 1
+
+        queue_area += len(queue) * (duration - last)
+        waits.sort()
+        hours = duration / 3600
+        return {
+            "orders": sum(1 for arrival, _ in orders if arrival < duration),
+            "completed": completed,
+            "unroutable": len(unroutable),
+            "unroutable_items": sorted(set(unroutable)),
+            "throughput": completed / hours,
+            "utilization": sum(busy) / (len(self.workers) * duration),
+            "min_utilization": min(busy) / duration,
+            "max_utilization": max(busy) / duration,
+            "mean_wait": sum(waits) / len(waits) if waits else 0.0,
+            "p95_wait": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            "max_wait": waits[-1] if waits else 0.0,
+            "mean_queue": queue_area / duration,
+            "max_queue": max_queue,
+            "left_in_queue": len(queue),
+        }
+
+
+def _items_note(item_ids, shown=5):
+    """Returns the note listing the first item ids of the unroutable orders."""
+
+    if not item_ids:
+        return ""
+    more = ", ..." if len(item_ids) > shown else ""
+    return " (items " + ", ".join(str(item_id) for item_id in item_ids[:shown]) + more + ")"
+
+
+def format_report(result):
+    """
+    The format_report function lays out the measures of a simulated shift.
+
+    :param result: The dictionary returned by ShiftSimulator.run()
+    :return: The report as a string
+    """
+
+    return "\n".join([
+        "Orders received:        {}".format(result["orders"]),
+        "Picks completed:        {}".format(result["completed"]),
+        "Unroutable orders:      {}{}".format(result["unroutable"], _items_note(result["unroutable_items"])),
+        "Throughput (picks/h):   {:.1f}".format(result["throughput"]),
+        "Utilization:            {:.1%} (min {:.1%}, max {:.1%})".format(
+            result["utilization"], result["min_utilization"], result["max_utilization"]),
+        "Wait (s):               mean {:.1f}, p95 {:.1f}, max {:.1f}".format(
+            result["mean_wait"], result["p95_wait"], result["max_wait"]),
+        "Queue length:           mean {:.1f}, max {}".format(result["mean_queue"], result["max_queue"]),
+        "Left in queue:          {}".format(result["left_in_queue"]),
+    ])
+
+
+def main():
+    """
+    Command line entry point, simulate a shift on the QVBox map.
+    """
+
+    from core import read_map_data
+
+    parser = argparse.ArgumentParser(description="Simulate a picking shift with a pool of workers.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--orders", help="an order file (arrival time in seconds, item id per line)")
+    parser.add_argument("--rate", type=float, default=3000, help="orders per hour of the generated stream")
+    parser.add_argument("--workers", type=int, default=50, help="the number of workers")
+    parser.add_argument("--hours", type=float, default=8, help="the length of the shift")
+    parser.add_argument("--speed", type=float, default=1.0, help="the walking speed, cells per second")
+    parser.add_argument("--pick-time", type=float, default=10.0, help="the time to pick an item, in seconds")
+    parser.add_argument("--drop-time", type=float, default=5.0, help="the time to drop an item off, in seconds")
+    parser.add_argument("--stay", action="store_true", help="workers stay at the shelf instead of returning")
+    parser.add_argument("--algorithm", choices=[algorithm.name for algorithm in Algorithm],
+                        help="route each task with this algorithm instead of the shortest-path trees")
+    args = parser.parse_args()
+
+    items, shelves = read_map_data(args.data)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0], item_index=gen_item_index(items))
+    duration = args.hours * 3600
+    orders = read_orders(args.orders) if args.orders else generate_orders(items, args.rate, duration)
+
+    algorithm = Algorithm[args.algorithm] if args.algorithm else None
+    simulator = ShiftSimulator(map_data, args.workers, speed=args.speed, pick_time=args.pick_time,
+                               drop_time=args.drop_time, return_to_depot=not args.stay, algorithm=algorithm)
+    start = perf_counter()
+    result = simulator.run(orders, duration)
+    print(format_report(result))
+    print("Simulated in {:.2f} s".format(perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
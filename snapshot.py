@@ -0,0 +1,317 @@
+"""--------------------------------------------------------
+    Preprocessed-map snapshots for fast startup.
+    A snapshot stores everything a process needs before its first route: the item catalogue (records sorted by
+    item id and the shelf table), the occupancy grid, the costs and the optional acceleration structures
+    (shortest-path trees, landmark fields). It is loaded through mmap: the arrays are read-only NumPy views of
+    the file and the items are read from the catalogue section, so nothing is parsed or sorted at startup.
+
+    Layout: the header (magic, version, map size, number of sections, payload size, CRC-32 of the payload),
+    then the section directory, then the sections, each aligned to 64 bytes.
+    --------------------------------------------------------"""
+
+import argparse
+import io
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from time import perf_counter
+
+import numpy as np
+
+from catalogue import ItemCatalogue, write_catalogue
+from data import MapData
+from entities import Shelf, Worker
+from landmarks import Landmarks
+from path_tree import ShortestPathTree
+from wavefront import occupancy_grid
+
+MAGIC = b"LPSNAP"
+VERSION = 1
+# magic, version, map_row, map_col, number of sections, payload size, CRC-32 of the payload
+HEADER = struct.Struct("<6sHIIIQI")
+# name, dtype, number of dimensions, shape (up to 3 dimensions), offset in the file, size in bytes
+SECTION = struct.Struct("<16s4sB3QQQ")
+ALIGN = 64
+
+
+def snapshot_path(filename):
+    """Returns the name of the snapshot file built from the given item data file.
+
+    :param filename: A string representing the name of the item data file.
+    :return: A string representing the name of the snapshot file.
+    """
+
+    root, _ = os.path.splitext(filename)
+    return root + ".snapshot"
+
+
+def _catalogue_section(items):
+    """Returns the catalogue of the items as a uint8 array, in the format of catalogue.build_catalogue()."""
+
+    ids = array("q")
+    xs = array("d")
+    ys = array("d")
+    positions = set()
+    for item in items:
+        ids.append(item.item_id)
+        xs.append(float(item.x))
+        ys.append(float(item.y))
+        positions.add(item.pos)
+
+    buffer = io.BytesIO()
+    write_catalogue(buffer, ids, xs, ys, positions)
+    return np.frombuffer(buffer.getvalue(), dtype=np.uint8)
+
+
+def write_snapshot(map_data, filename, starts=(), landmarks=None):
+    """
+    The write_snapshot function writes the preprocessed map to a snapshot file.
+
+    :param map_data: The MapData object, its items (a list or an ItemCatalogue) are stored in the catalogue section
+    :param filename: A string representing the name of the snapshot file
+    :param starts: The (x, y) start cells whose shortest-path trees are stored
+    :param landmarks: Optional Landmarks whose distance fields are stored
+    :return: The name of the snapshot file
+    """
+
+    sections = [("catalogue", _catalogue_section(map_data.items)), ("blocked", occupancy_grid(map_data))]
+    if map_data.costs:
+        costs = np.ones((map_data.map_row, map_data.map_col), dtype=np.int32)
+        for (x, y), value in map_data.costs.items():
+            costs[x, y] = value
+        sections.append(("costs", costs))
+    if starts:
+        trees = [ShortestPathTree(map_data, start) for start in starts]
+        sections.append(("tree_starts", np.array(starts, dtype=np.int32)))
+        sections.append(("tree_dist", np.stack([tree.dist for tree in trees])))
+        sections.append(("tree_parent", np.stack([tree.parent for tree in trees])))
+    if landmarks is not None:
+        sections.append(("landmark_positions", np.array(landmarks.positions, dtype=np.int32)))
+        sections.append(("landmark_dist", landmarks.dist))
+    if map_data.resolution != 1:
+        # The cells of the catalogue records depend on it, a snapshot without it has 1 cell per unit
+        sections.append(("resolution", np.array([map_data.resolution], dtype=np.int32)))
+
+    # Place the sections after the directory, each one aligned
+    directory = []
+    offset = HEADER.size + len(sections) * SECTION.size
+    for name, values in sections:
+        values = np.ascontiguousarray(values)
+        offset += -offset % ALIGN
+        shape = tuple(values.shape) + (0,) * (3 - values.ndim)
+        directory.append(SECTION.pack(name.encode(), values.dtype.str.encode(), values.ndim, *shape, offset,
+                                      values.nbytes))
+        offset += values.nbytes
+
+    payload = bytearray(offset - HEADER.size)
+    payload[:len(directory) * SECTION.size] = b"".join(directory)
+    for entry, (_, values) in zip(directory, sections):
+        start, size = SECTION.unpack(entry)[-2:]
+        payload[start - HEADER.size:start - HEADER.size + size] = np.ascontiguousarray(values).tobytes()
+
+    with open(filename, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, VERSION, map_data.map_row, map_data.map_col, len(sections), len(payload),
+                               zlib.crc32(payload)))
+        file.write(payload)
+    return filename
+
+
+class Snapshot:
+    """
+    A class to represent a memory-mapped snapshot, every section is a read-only view of the file.
+    """
+
+    def __init__(self, filename, verify=True):
+        """
+        :param filename: A string representing the name of the snapshot file
+        :param verify: Whether to check the CRC-32 of the payload, it reads the whole file once
+        """
+
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.map_row, self.map_col, count, size, checksum = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("Not a lazy picker snapshot (version " + str(VERSION) + "): " + filename)
+        if HEADER.size + size != len(self.buffer):
+            self.close()
+            raise ValueError("Truncated snapshot: " + filename)
+        if verify:
+            with memoryview(self.buffer) as view:
+                valid = zlib.crc32(view[HEADER.size:]) == checksum
+            if not valid:
+                self.close()
+                raise ValueError("Corrupted snapshot, the checksum does not match: " + filename)
+
+        self.arrays = {}
+        offsets = {}
+        for index in range(count):
+            name, dtype, ndim, rows, cols, depth, offset, nbytes = SECTION.unpack_from(
+                self.buffer, HEADER.size + index * SECTION.size)
+            name = name.rstrip(b"\0").decode()
+            dtype = np.dtype(dtype.rstrip(b"\0").decode())
+            offsets[name] = offset
+            self.arrays[name] = np.frombuffer(self.buffer, dtype=dtype, count=nbytes // dtype.itemsize,
+                                              offset=offset).reshape((rows, cols, depth)[:ndim])
+
+        self.resolution = int(self.arrays["resolution"][0]) if "resolution" in self.arrays else 1
+        self.catalogue = ItemCatalogue(filename, offsets["catalogue"], self.resolution)
+        starts = self.arrays.get("tree_starts")
+        self.tree_rows = {} if starts is None else {(int(x), int(y)): index for index, (x, y) in enumerate(starts)}
+
+    def map_data(self, worker=None, target=None):
+        """
+        The map_data function builds the MapData object of the snapshot.
+        The items and the item index are the catalogue, the shelves are the blocked cells of the stored occupancy
+        grid, so a shelf without items is kept and the stored trees and landmarks match the map. Like the shelves of
+        the catalogue's shelf table, they do not hold the Item objects, the items are looked up in the catalogue.
+
+        :param worker: The Worker, default to a worker at (0, 0)
+        :param target: The target Item, default to the first item of the catalogue
+        :return: A MapData object
+        """
+
+        costs = None
+        if "costs" in self.arrays:
+            grid = self.arrays["costs"]
+            costs = {(int(x), int(y)): int(grid[x, y]) for x, y in np.argwhere(grid != 1)}
+        shelves = [Shelf(index, int(x), int(y)) for index, (x, y) in enumerate(np.argwhere(self.arrays["blocked"]))]
+        return MapData(worker if worker is not None else Worker(0, 0), shelves, self.catalogue,
+                       target if target is not None else self.catalogue[0], map_row=self.map_row,
+                       map_col=self.map_col, costs=costs, item_index=self.catalogue, resolution=self.resolution)
+
+    def tree(self, start):
+        """Returns the stored shortest-path tree rooted at the start cell, or None."""
+
+        row = self.tree_rows.get(start)
+        if row is None:
+            return None
+        return ShortestPathTree.from_arrays(start, self.map_row, self.map_col, self.arrays["tree_dist"][row],
+                                            self.arrays["tree_parent"][row])
+
+    def landmarks(self):
+        """Returns the stored landmarks, or None."""
+
+        if "landmark_dist" not in self.arrays:
+            return None
+        return Landmarks.from_arrays(self.arrays["blocked"], self.arrays["landmark_positions"],
+                                     self.arrays["landmark_dist"])
+
+    def close(self):
+        """Releases the memory map and the file, the arrays and the trees of the snapshot must not be used anymore."""
+
+        self.arrays = {}
+        if getattr(self, "catalogue", None) is not None:
+            self.catalogue.close()
+        self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_snapshot(filename, verify=True):
+    """
+    The load_snapshot function opens a snapshot and builds its MapData object.
+
+    :param filename: A string representing the name of the snapshot file
+    :param verify: Whether to check the CRC-32 of the payload
+    :return: The Snapshot and its MapData object
+    """
+
+    snapshot = Snapshot(filename, verify)
+    return snapshot, snapshot.map_data()
+
+
+def cold_start(data_file, snapshot_file, item_id, map_row=40, map_col=21, resolution=1):
+    """
+    The cold_start function measures the time to the first route, from the data file and from the snapshot.
+
+    :param data_file: A string representing the name of the item data file
+    :param snapshot_file: A string representing the name of the snapshot file of the same data
+    :param item_id: The id of the item of the first route, from the worker at (0, 0)
+    :param map_row: The number of rows of the map
+    :param map_col: The number of columns of the map
+    :param resolution: The number of grid cells per unit of the coordinates
+    :return: A dictionary of the times in seconds and the route lengths
+    """
+
+    from core import find_item, gen_item_index, read_map_data
+    from service import Map
+
+    results = {}
+    start = perf_counter()
+    items, shelves = read_map_data(data_file, resolution)
+    target = find_item(items, item_id)
+    map_data = MapData(Worker(0, 0), shelves, items, target, map_row=map_row, map_col=map_col,
+                       item_index=gen_item_index(items), resolution=resolution)
+    grid = Map(map_data, render=False)
+    path = grid.a_star()
+    results["data file + Map.a_star"] = (perf_counter() - start, len(path) - 1)
+
+    start = perf_counter()
+    map_data = MapData.from_snapshot(snapshot_file)
+    map_data.update("target", find_item(map_data.items, item_id))
+    grid = Map(map_data, render=False)
+    path = grid.a_star()
+    results["snapshot + Map.a_star"] = (perf_counter() - start, len(path) - 1)
+
+    start = perf_counter()
+    with Snapshot(snapshot_file) as snapshot:
+        tree = snapshot.tree((0, 0))
+        if tree is not None:
+            ranked = tree.rank(snapshot.catalogue.get(item_id, []))
+            route = tree.route(ranked[0][1])
+            results["snapshot + stored tree"] = (perf_counter() - start, len(route) - 1)
+            # The tree is a view of the memory map, it must go before the snapshot is closed
+            del tree
+    return results
+
+
+def main():
+    """
+    Command line entry point, build the snapshot of an item data file and measure the cold start.
+    """
+
+    from core import cost_map_path, read_cost_map, read_map_data
+
+    parser = argparse.ArgumentParser(description="Build a preprocessed-map snapshot for fast startup.")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--output", help="the snapshot file, default to the data file with a .snapshot extension")
+    parser.add_argument("--map-size", nargs=2, type=int, default=(40, 21), metavar=("ROWS", "COLS"),
+                        help="the size of the map, in units")
+    parser.add_argument("--resolution", type=int, default=1, help="the number of grid cells per unit")
+    parser.add_argument("--tree", action="store_true", help="store the shortest-path tree of the worker at (0, 0)")
+    parser.add_argument("--landmarks", type=int, default=0, help="store the fields of this many landmarks")
+    parser.add_argument("--bench", type=int, metavar="ITEM_ID",
+                        help="measure the time to the first route to this item, from the data file and the snapshot")
+    args = parser.parse_args()
+    output = args.output or snapshot_path(args.data)
+
+    start = perf_counter()
+    map_row, map_col = args.map_size[0] * args.resolution, args.map_size[1] * args.resolution
+    items, shelves = read_map_data(args.data, args.resolution)
+    costs = None
+    if os.path.exists(cost_map_path(args.data)):
+        costs = read_cost_map(cost_map_path(args.data), args.resolution)
+    map_data = MapData(Worker(0, 0), shelves, items, items[0], map_row=map_row, map_col=map_col, costs=costs,
+                       resolution=args.resolution)
+    landmarks = Landmarks(map_data, args.landmarks) if args.landmarks else None
+    write_snapshot(map_data, output, [(0, 0)] if args.tree else (), landmarks)
+    print("Wrote {} ({:.1f} KB) in {:.2f} s".format(output, os.path.getsize(output) / 1024, perf_counter() - start))
+
+    if args.bench is not None:
+        for name, (elapsed, length) in cold_start(args.data, output, args.bench, map_row, map_col,
+                                                       args.resolution).items():
+            print("{:<26} {:>10.2f} ms   route length {}".format(name, elapsed * 1000, length))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""--------------------------------------------------------
+    Startup benchmark.
+    A short-lived process pays for its imports and its first query on every run.
+    Each entry point is run in fresh interpreters: one run with `python -X importtime` reports the import time
+    of every module on stderr, one plain run times the first query (loading the map and routing to an item)
+    from inside the process and the whole process from outside.
+    The modules are compiled first, without the .pyc files every process would compile them again
+    (e.g. with PYTHONDONTWRITEBYTECODE set).
+    --------------------------------------------------------"""
+
+import argparse
+import compileall
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+# The code of each entry point: the imports, then a first query timed by the process itself
+ENTRY_POINTS = {
+    "core": """
+import core
+start = perf_counter()
+grid = core.Map(core.load_map_data(), render=False)
+core.route(grid, {item})
+""",
+    "core-catalogue": """
+import core
+start = perf_counter()
+grid = core.Map(core.load_map_data(use_catalogue=True), render=False)
+core.route(grid, {item})
+""",
+    "lazy_picker": """
+import lazy_picker
+start = perf_counter()
+items, shelves = lazy_picker.read_map_data('qvBox-warehouse-data-s23-v01.txt')
+map_data = lazy_picker.MapData(lazy_picker.Worker(0, 0), shelves, items, items[0],
+                               item_index=lazy_picker.gen_item_index(items))
+grid = lazy_picker.Map(map_data, render=False)
+grid.nearest_location(map_data.get_locations({item}))
+""",
+    "stream": """
+import core
+import stream
+start = perf_counter()
+router = stream.OrderRouter(core.load_map_data())
+router.route(router.map_data.get_locations({item}))
+"""
+}
+
+
+def parse_importtime(report):
+    """
+    The parse_importtime function reads the report of `python -X importtime`.
+
+    :param report: The stderr of the process
+    :return: A list of (module, self time, cumulative time, depth), times in seconds, in the order of the report
+    """
+
+    modules = []
+    for line in report.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        if not self_time.strip().isdigit():
+            continue  # The header line
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_time) / 1e6, int(cumulative) / 1e6, depth))
+    return modules
+
+
+def _run(code, importtime=False):
+    """Runs the code in a fresh interpreter, returns its stdout, stderr and the wall time in seconds."""
+
+    command = [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code]
+    start = perf_counter()
+    folder = os.path.dirname(os.path.abspath(__file__))
+    process = subprocess.run(command, capture_output=True, text=True, cwd=folder)
+    elapsed = perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError("The entry point failed:\n" + process.stderr)
+    return process.stdout, process.stderr, elapsed
+
+
+def measure(name, item=1, runs=5):
+    """
+    The measure function measures the startup of an entry point, the median of several runs.
+
+    :param name: The name of the entry point, see ENTRY_POINTS
+    :param item: The id of the item of the first query
+    :param runs: The number of runs
+    :return: A dictionary of the import time, the first query time and the process time in seconds,
+             the number of modules imported and the modules of the last run sorted by self time
+    """
+
+    code = "from time import perf_counter\n" + ENTRY_POINTS[name].format(item=item) + \
+           "print(perf_counter() - start)\n"
+    baseline = {module for module, _, _, _ in parse_importtime(_run("pass", importtime=True)[1])}
+    imports, queries, processes = [], [], []
+    modules = []
+    for _ in range(runs):
+        modules = parse_importtime(_run(code, importtime=True)[1])
+        imports.append(sum(cumulative for module, _, cumulative, depth in modules
+                           if depth == 0 and module not in baseline))
+        stdout, _, elapsed = _run(code)
+        queries.append(float(stdout.split()[-1]))
+        processes.append(elapsed)
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    loaded = [entry for entry in modules if entry[0] not in baseline]
+    return {
+        "import": median(imports),
+        "first query": median(queries),
+        "process": median(processes),
+        "modules": len(loaded),
+        "heaviest": sorted(loaded, key=lambda entry: -entry[1])
+    }
+
+
+def main():
+    """
+    Command line entry point, compare the startup of the entry points.
+    """
+
+    parser = argparse.ArgumentParser(description="Measure the import and first-query time of the entry points.")
+    parser.add_argument("entry_points", nargs="*", default=list(ENTRY_POINTS),
+                        help="the entry points to measure among " + ", ".join(ENTRY_POINTS) + ", default to all")
+    parser.add_argument("--runs", type=int, default=5, help="the number of runs of each entry point")
+    parser.add_argument("--item", type=int, default=1, help="the id of the item of the first query")
+    parser.add_argument("--top", type=int, default=0, help="list the modules with the largest import times")
+    args = parser.parse_args()
+    for name in args.entry_points:
+        if name not in ENTRY_POINTS:
+            parser.error("unknown entry point " + name)
+
+    folder = os.path.dirname(os.path.abspath(__file__))
+    compileall.compile_dir(folder, maxlevels=0, quiet=1)
+    if "core-catalogue" in args.entry_points:
+        # The catalogue is built once, by the first process that needs it
+        _run("import core; core.load_map_data(use_catalogue=True)")
+    _, _, interpreter = _run("pass")
+    print("Interpreter alone: {:.1f} ms".format(1000 * interpreter))
+    print("{:<15} {:>12} {:>17} {:>13} {:>8}".format("Entry point", "Import (ms)", "First query (ms)",
+                                                     "Process (ms)", "Modules"))
+    results = {name: measure(name, args.item, args.runs) for name in args.entry_points}
+    for name, result in results.items():
+        print("{:<15} {:>12.1f} {:>17.1f} {:>13.1f} {:>8}".format(
+            name, 1000 * result["import"], 1000 * result["first query"], 1000 * result["process"],
+            result["modules"]))
+    for name, result in results.items():
+        if args.top:
+            print()
+            print("Largest imports of " + name + " (self time):")
+            for module, self_time, _, _ in result["heaviest"][:args.top]:
+                print("  {:<40} {:>8.2f} ms".format(module, 1000 * self_time))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+"""--------------------------------------------------------
+    Streaming order pipeline.
+    Orders are read lazily from a file or stdin, one order per line: the order id, then the ids of its items,
+    separated by spaces or commas. Each order goes through a pipeline of generators:
+    parse -> resolve the items through the item index -> route -> encode as one JSON line,
+    and the results are written as soon as they are ready, in the order of the input.
+    Routing runs in a process pool, the orders are sent in chunks and only a bounded number of chunks is in
+    flight: reading the input waits for the oldest chunk, so the memory does not grow with the input.
+    --------------------------------------------------------"""
+
+import argparse
+import itertools
+import json
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+
+from core import load_map_data
+from data import MapData
+from entities import Worker
+from order_routing import POLICIES, AisleLayout, connect
+from service import Map
+
+# The router of a pool process, set once by _init_process()
+_router = None
+
+
+def read_lines(source):
+    """
+    The read_lines function yields the lines of the input one at a time.
+
+    :param source: A file name, or '-' for stdin
+    :return: A generator of lines
+    """
+
+    if source == "-":
+        yield from sys.stdin
+        return
+    with open(source, 'r') as file:
+        yield from file
+
+
+def _is_header(data):
+    """Returns whether the fields of a line are column names: none of them is a number."""
+
+    return not any(value.lstrip("+-").isdigit() for value in data)
+
+
+def parse_orders(lines):
+    """
+    The parse_orders function parses the order lines.
+    Blank lines and lines starting with '#' are skipped, so is a header line (column names, no number)
+    at the top of the file. A line that can not be parsed gives an order with an error, the stream goes on.
+
+    :param lines: An iterable of lines
+    :return: A generator of (order id, list of item ids, error message or None)
+    """
+
+    first = True
+    for number, line in enumerate(lines, 1):
+        data = line.replace(",", " ").split()
+        if not data or data[0].startswith("#"):
+            continue
+        if first:
+            first = False
+            if _is_header(data):
+                continue
+        try:
+            item_ids = [int(value) for value in data[1:]]
+        except ValueError:
+            yield data[0], [], "line " + str(number) + ": the item ids must be integers"
+            continue
+        if not item_ids:
+            yield data[0], [], "line " + str(number) + ": the order has no item"
+            continue
+        yield data[0], item_ids, None
+
+
+def resolve_orders(orders, map_data):
+    """
+    The resolve_orders function replaces the item ids of each order by the positions of their shelves,
+    from the item index of the map data. Each item is picked from its first location.
+
+    :param orders: An iterable of (order id, list of item ids, error message or None)
+    :param map_data: The MapData object, with an item index
+    :return: A generator of (order id, list of (x, y) shelf positions, list of missing item ids, error or None)
+    """
+
+    for order_id, item_ids, error in orders:
+        positions = []
+        missing = []
+        for item_id in item_ids:
+            locations = map_data.get_locations(item_id)
+            if locations:
+                positions.append(tuple(locations[0]))
+            else:
+                missing.append(item_id)
+        if error is None and not positions:
+            error = "no item of the order is stocked"
+        yield order_id, positions, missing, error
+
+
+class OrderRouter:
+    """
+    A class to route resolved orders with a routing policy, the aisle layout and the Map are built once.
+    """
+
+    def __init__(self, map_data, policy="s-shape"):
+        """
+        :param map_data: The MapData object, the tours start and end at the worker's position
+        :param policy: The name of the routing policy, see order_routing.POLICIES
+        """
+
+        self.map_data = map_data
+        self.policy = POLICIES[policy]
+        self.layout = AisleLayout(map_data)
+        self.grid_map = Map(map_data, render=False)
+        self.depot = map_data.worker.pos
+
+    def route(self, positions):
+        """
+        The route function routes the tour of an order.
+
+        :param positions: The (x, y) positions of the shelves to pick from
+        :return: The list of (x, y) cells of the tour, or None if a shelf can not be reached
+        """
+
+        picks = {}
+        for pos in positions:
+            if pos not in picks:
+                picks[pos] = self.layout.locate(pos)
+        waypoints = self.policy(self.layout, list(picks.values()), self.depot)
+        return connect(self.grid_map, waypoints, self.layout.blocked)
+
+    def route_chunk(self, chunk, with_path=True):
+        """
+        The route_chunk function routes a chunk of resolved orders.
+
+        :param chunk: A list of (order id, positions, missing item ids, error or None)
+        :param with_path: Whether the records keep the cells of the tours
+        :return: A list of result records (dictionaries), one per order
+        """
+
+        records = []
+        for order_id, positions, missing, error in chunk:
+            record = {"order": order_id}
+            if error is None:
+                path = self.route(positions)
+                if path is None:
+                    error = "a shelf of the order can not be reached"
+                else:
+                    record["picks"] = len(positions)
+                    record["length"] = len(path) - 1
+                    if with_path:
+                        record["path"] = path
+            if missing:
+                record["missing"] = missing
+            if error is not None:
+                record["error"] = error
+            records.append(record)
+        return records
+
+
+def _init_process(map_data, policy):
+    """Builds the router of the pool process, so the map is sent and prepared once per process."""
+
+    global _router
+    _router = OrderRouter(map_data, policy)
+
+
+def _route_chunk(task):
+    """Routes one chunk of orders in a pool process."""
+
+    chunk, with_path = task
+    return _router.route_chunk(chunk, with_path)
+
+
+def route_orders(orders, map_data, policy="s-shape", workers=1, chunk_size=64, in_flight=None, with_path=True):
+    """
+    The route_orders function routes a stream of resolved orders, in the order of the input.
+    With one worker the orders are routed in this process, otherwise in a pool of processes with at most
+    in_flight chunks submitted and not yet written: the next chunk is only read once the oldest one is done.
+
+    :param orders: An iterable of resolved orders, see resolve_orders()
+    :param map_data: The MapData object
+    :param policy: The name of the routing policy
+    :param workers: The number of processes
+    :param chunk_size: The number of orders sent to a process at once
+    :param in_flight: The largest number of chunks in flight, default to twice the number of workers
+    :param with_path: Whether the records keep the cells of the tours
+    :return: A generator of result records
+    """
+
+    orders = iter(orders)
+    chunks = iter(lambda: list(itertools.islice(orders, chunk_size)), [])
+    if workers <= 1:
+        router = OrderRouter(map_data, policy)
+        for chunk in chunks:
+            yield from router.route_chunk(chunk, with_path)
+        return
+
+    in_flight = in_flight or 2 * workers
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_process,
+                             initargs=(map_data.without_items(), policy)) as pool:
+        for chunk in chunks:
+            if len(pending) >= in_flight:
+                yield from pending.popleft().result()
+            pending.append(pool.submit(_route_chunk, (chunk, with_path)))
+            # The chunks already done at the head are written now, without waiting for the window to fill
+            while pending and pending[0].done():
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def encode_records(records):
+    """Encodes the result records as JSON lines."""
+
+    for record in records:
+        yield json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def stream_orders(lines, output, map_data, policy="s-shape", workers=1, chunk_size=64, in_flight=None,
+                  with_path=True):
+    """
+    API entry point, route a stream of order lines and write one JSON line per order as soon as it is routed.
+
+    :param lines: An iterable of order lines, see parse_orders()
+    :param output: The text file the results are written to
+    :param map_data: The MapData object, with an item index, the tours start and end at the worker's position
+    :param policy: The name of the routing policy
+    :param workers: The number of processes
+    :param chunk_size: The number of orders sent to a process at once
+    :param in_flight: The largest number of chunks in flight
+    :param with_path: Whether the results keep the cells of the tours
+    :return: A dictionary of the number of orders, of failed orders and the total tour length
+    """
+
+    summary = {"orders": 0, "failed": 0, "length": 0}
+    resolved = resolve_orders(parse_orders(lines), map_data)
+    records = route_orders(resolved, map_data, policy, workers, chunk_size, in_flight, with_path)
+    for count, line in enumerate(encode_records(_summarize(records, summary)), 1):
+        output.write(line)
+        # Flush once per chunk, the results are seen downstream without a write per order
+        if count % chunk_size == 0:
+            output.flush()
+    output.flush()
+    return summary
+
+
+def _summarize(records, summary):
+    """Passes the records through, counting them in the summary."""
+
+    for record in records:
+        summary["orders"] += 1
+        if "error" in record:
+            summary["failed"] += 1
+        else:
+            summary["length"] += record["length"]
+        yield record
+
+
+def main():
+    """
+    Command line entry point, route the orders of a file or of stdin without any prompt.
+    """
+
+    parser = argparse.ArgumentParser(description="Route a stream of orders, one JSON line per order.")
+    parser.add_argument("orders", nargs="?", default="-",
+                        help="the order file (order id then item ids on each line), '-' for stdin")
+    parser.add_argument("--output", help="the result file, default to stdout")
+    parser.add_argument("--data", default="qvBox-warehouse-data-s23-v01.txt", help="the item data file")
+    parser.add_argument("--snapshot", help="load the preprocessed map from a snapshot file built by snapshot.py")
+    parser.add_argument("--depot", nargs=2, type=int, default=(0, 0), metavar=("X", "Y"),
+                        help="the position the tours start and end at")
+    parser.add_argument("--policy", default="s-shape", choices=sorted(POLICIES), help="the routing policy")
+    parser.add_argument("--workers", type=int, default=1, help="the number of routing processes")
+    parser.add_argument("--chunk", type=int, default=64, help="the number of orders sent to a process at once")
+    parser.add_argument("--in-flight", type=int, help="the largest number of chunks in flight")
+    parser.add_argument("--no-path", action="store_true", help="only write the tour lengths, not the cells")
+    args = parser.parse_args()
+
+    if args.snapshot is not None:
+        map_data = MapData.from_snapshot(args.snapshot, worker=Worker(*args.depot))
+    else:
+        map_data = load_map_data(args.data, tuple(args.depot))
+    output = open(args.output, 'w') if args.output else sys.stdout
+    start = perf_counter()
+    try:
+        summary = stream_orders(read_lines(args.orders), output, map_data, args.policy, args.workers, args.chunk,
+                                args.in_flight, not args.no_path)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    elapsed = perf_counter() - start
+    # The summary goes to stderr, stdout only holds the results
+    print("Routed {} orders ({} failed) in {:.2f} s, {:.0f} orders/s".format(
+        summary["orders"], summary["failed"], elapsed, summary["orders"] / elapsed if elapsed else 0),
+        file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
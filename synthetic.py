@@ -0,0 +1,98 @@
+"""--------------------------------------------------------
+    Synthetic warehouse maps for benchmarks.
+    The layout looks like the QVBox warehouse: racks two shelves deep between vertical aisles,
+    cut by a cross aisle every few rows, with a free border around the map.
+    --------------------------------------------------------"""
+
+import random
+
+import numpy as np
+
+from data import MapData
+from entities import Item, Shelf, Worker
+
+
+def synthetic_items(map_row, map_col, cross_aisle=10, items_per_shelf=2, missing=0.05, seed=0):
+    """
+    The synthetic_items function generates the items of a synthetic warehouse.
+    A cell (x, y) inside the border is a shelf if x % 3 != 0 (aisles on x % 3 == 0)
+    and y % (cross_aisle + 1) != 0 (cross aisles), a small fraction of the shelves is left out at random.
+
+    :param map_row: The number of rows of the map (size of the x-axis)
+    :param map_col: The number of columns of the map (size of the y-axis)
+    :param cross_aisle: The number of shelves between two cross aisles
+    :param items_per_shelf: The number of items on each shelf
+    :param missing: The fraction of shelves left out
+    :param seed: The seed of the random generator
+    :return: A list of items
+    """
+
+    rng = random.Random(seed)
+    items = []
+    item_id = 1
+    for x in range(1, map_row - 1):
+        if x % 3 == 0:
+            continue
+        for y in range(1, map_col - 1):
+            if y % (cross_aisle + 1) == 0 or rng.random() < missing:
+                continue
+            for _ in range(items_per_shelf):
+                items.append(Item(item_id, x, y))
+                item_id += 1
+    return items
+
+
+def synthetic_shelves(items):
+    """
+    The synthetic_shelves function groups the items by position, like core.gen_shelves().
+    The items are generated in position order, so no sort is needed.
+
+    :param items: The items of synthetic_items()
+    :return: A list of shelves
+    """
+
+    shelves = []
+    for item in items:
+        if not shelves or shelves[-1].pos != item.pos:
+            shelves.append(Shelf(len(shelves), item.pos[0], item.pos[1]))
+        shelves[-1].add_item(item)
+    return shelves
+
+
+def synthetic_map_data(map_row, map_col, seed=0, **kwargs):
+    """
+    The synthetic_map_data function generates the MapData object of a synthetic warehouse,
+    the worker starts at (0, 0) and the target is the first item.
+
+    :param map_row: The number of rows of the map (size of the x-axis)
+    :param map_col: The number of columns of the map (size of the y-axis)
+    :param seed: The seed of the random generator
+    :param kwargs: The other parameters of synthetic_items()
+    :return: A MapData object
+    """
+
+    items = synthetic_items(map_row, map_col, seed=seed, **kwargs)
+    shelves = synthetic_shelves(items)
+    return MapData(Worker(0, 0), shelves, items, items[0], map_row=map_row, map_col=map_col)
+
+
+def synthetic_occupancy(map_row, map_col, cross_aisle=10, missing=0.05, seed=0):
+    """
+    The synthetic_occupancy function generates the occupancy grid of a synthetic warehouse directly,
+    with the layout of synthetic_items() but without any Item or Shelf object, for floors too large to hold them.
+
+    :param map_row: The number of rows of the map (size of the x-axis)
+    :param map_col: The number of columns of the map (size of the y-axis)
+    :param cross_aisle: The number of shelves between two cross aisles
+    :param missing: The fraction of shelves left out
+    :param seed: The seed of the random generator
+    :return: A (map_row, map_col) boolean numpy array, True for the shelves
+    """
+
+    xs = np.arange(map_row)[:, None]
+    ys = np.arange(map_col)[None, :]
+    blocked = (xs % 3 != 0) & (ys % (cross_aisle + 1) != 0)
+    blocked[[0, -1], :] = False
+    blocked[:, [0, -1]] = False
+    blocked &= np.random.default_rng(seed).random((map_row, map_col)) >= missing
+    return blocked
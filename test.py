@@ -1,6 +1,8 @@
+import random
+
+from core import read_map_data
 from data import MapData
 from entities import Worker
-from lazy_picker import read_map_data
 from service import Map
 """--------------------------------------------------------
     This contains all the scripts for testing
@@ -35,9 +37,169 @@ grid = Map(map_data)
 grid.a_star()
 # grid.bfs()
 
+# grid.dial()
+
 # while True:
 #     print("NEXT ITERATION")
 #     input()
 #     grid.iterate(algorithm='Dijkstra')
 
 # for testing
+
+"""--------------------------------------------------------
+    Cross check of Dial's algorithm against the heap-based Dijkstra
+    --------------------------------------------------------"""
+
+
+def cross_check_dial(rounds=200, max_cost=9, seed=0):
+    """Runs both weighted searches on random cost maps, start points and targets and compares the path costs."""
+
+    rng = random.Random(seed)
+    shelf_pos = {shelf.pos for shelf in shelves}
+    free = [(x, y) for x in range(40) for y in range(21) if (x, y) not in shelf_pos]
+    for _ in range(rounds):
+        costs = {pos: rng.randint(1, max_cost) for pos in free}
+        data = MapData(Worker(*rng.choice(free)), shelves, items, rng.choice(items), costs=costs)
+
+        dial_grid = Map(data, render=False)
+        dial_grid.dial()
+        heap_grid = Map(data, render=False)
+        heap_grid.heap_dijkstra()
+
+        assert dial_grid.path_cost() == heap_grid.path_cost(), (dial_grid.path_cost(), heap_grid.path_cost())
+        assert all(a.is_next_to(b) for a, b in zip(dial_grid.path, dial_grid.path[1:]))
+    print("Dial and heap-based Dijkstra agree on", rounds, "random queries")
+
+
+# cross_check_dial()
+
+"""--------------------------------------------------------
+    Nearest location of an item other than the target of the map data
+    --------------------------------------------------------"""
+
+
+def check_nearest_location(item_ids=(1500, 74, 45351)):
+    """
+    Routes to the items with nearest_location() while the map data keeps another target,
+    with the worker next to that target, and compares the paths with BFS to every location.
+    """
+
+    shelf_pos = {shelf.pos for shelf in shelves}
+    x, y = items[0].pos
+    start = next(pos for pos in ((x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1))
+                 if 0 <= pos[0] < 40 and 0 <= pos[1] < 21 and pos not in shelf_pos)
+    data = MapData(Worker(*start), shelves, items, items[0])
+    nearest_grid = Map(data, render=False)
+    for wanted in item_ids:
+        locations = [item.pos for item in items if item.item_id == wanted]
+        nearest_grid.nearest_location(locations)
+        assert data.target is items[0]
+        assert nearest_grid.has_path and nearest_grid.path[-1].pos in locations, (wanted, nearest_grid.path[-1].pos)
+
+        best = None
+        for pos in locations:
+            location = next(item for item in items if item.pos == pos)
+            bfs_grid = Map(MapData(data.worker, shelves, items, location), render=False)
+            bfs_grid.bfs()
+            if bfs_grid.has_path and (best is None or len(bfs_grid.path) < best):
+                best = len(bfs_grid.path)
+        assert len(nearest_grid.path) == best, (wanted, len(nearest_grid.path), best)
+    print("nearest_location() finds the nearest location of", len(item_ids), "items other than the target")
+
+
+# check_nearest_location()
+
+"""--------------------------------------------------------
+    Routes of the headless core to several items from one Map
+    --------------------------------------------------------"""
+
+
+def check_core_route(item_ids=(74, 1, 1500, 45351, 74)):
+    """Routes to several items in a row with core.route(), in both modes, and compares with a fresh BFS each."""
+
+    import core
+    from data import Algorithm
+
+    data = core.load_map_data()
+    grid_map = Map(data, render=False)
+    for wanted in item_ids:
+        locations = data.get_locations(wanted)
+        for algorithm in (None, Algorithm.BFS):
+            route = core.route(grid_map, wanted, algorithm)
+            assert route is not None and route[0] == (0, 0) and route[-1] in locations, (wanted, algorithm, route)
+            assert all(abs(a[0] - b[0]) + abs(a[1] - b[1]) == 1 for a, b in zip(route, route[1:]))
+
+            ends = locations if algorithm is None else locations[:1]
+            best = None
+            for pos in ends:
+                location = next(item for item in items if item.pos == pos)
+                bfs_grid = Map(MapData(Worker(0, 0), shelves, items, location), render=False)
+                bfs_grid.bfs()
+                if bfs_grid.has_path and (best is None or len(bfs_grid.path) < best):
+                    best = len(bfs_grid.path)
+            assert len(route) == best, (wanted, algorithm, len(route), best)
+    print("core.route() finds the shortest route to", len(item_ids), "items in a row from one Map")
+
+
+# check_core_route()
+
+"""--------------------------------------------------------
+    Memory-bounded searches to a target that can not be reached
+    --------------------------------------------------------"""
+
+
+def check_bounded_unreachable(budgets=(100000, 300, 40)):
+    """Runs IDA* and SMA* to a shelf walled in by other shelves, with large and small budgets, both end with no path."""
+
+    import numpy as np
+
+    from bounded_search import EXPANSIONS_PER_NODE, ImplicitGrid, ida_star, sma_star
+
+    blocked = np.zeros((30, 30), dtype=bool)
+    blocked[3:27:3, 2:28] = True
+    target = (15, 15)
+    for x, y in ((14, 15), (16, 15), (15, 14), (15, 16)):
+        blocked[x, y] = True
+    grid = ImplicitGrid(blocked)
+    for search in (ida_star, sma_star):
+        for max_nodes in budgets:
+            result = search(grid, (0, 0), target, max_nodes)
+            assert result["path"] == [] and result["cost"] is None, (search.__name__, max_nodes, result["path"])
+            assert result["expanded"] <= EXPANSIONS_PER_NODE * max_nodes
+    print("IDA* and SMA* end with no path to a walled-in target with budgets", budgets)
+
+
+# check_bounded_unreachable()
+
+"""--------------------------------------------------------
+    Snapshot round trip of an edited map
+    --------------------------------------------------------"""
+
+
+def check_snapshot_round_trip(shelf_pos=(0, 5), start=(0, 0)):
+    """Adds an empty shelf, writes a snapshot with a tree and compares the restored shelves and tree with the map."""
+
+    import os
+    import tempfile
+
+    import numpy as np
+
+    import core
+    from mutations import MapEditor
+    from path_tree import ShortestPathTree
+    from snapshot import Snapshot, write_snapshot
+
+    data = core.load_map_data()
+    MapEditor(data).add_shelf(*shelf_pos)
+    path = os.path.join(tempfile.mkdtemp(), "edited.snapshot")
+    write_snapshot(data, path, starts=[start])
+    with Snapshot(path) as snapshot:
+        restored = snapshot.map_data()
+        assert {shelf.pos for shelf in restored.shelves} == {shelf.pos for shelf in data.shelves}
+        assert np.array_equal(snapshot.tree(start).dist, ShortestPathTree(restored, start).dist)
+        count = len(restored.shelves)
+    os.remove(path)
+    print("The snapshot keeps the", count, "shelves of the edited map, empty ones included")
+
+
+# check_snapshot_round_trip()
@@ -0,0 +1,212 @@
+"""--------------------------------------------------------
+    Vectorized BFS wavefront (distance transform) over the occupancy grid.
+    Whole frontiers are expanded at once with NumPy array operations,
+    instead of popping one Block at a time like Map.bfs().
+    --------------------------------------------------------"""
+
+from time import perf_counter
+
+import numpy as np
+
+# Same order as Map.get_neighbours(): UP, DOWN, RIGHT, LEFT
+DIRECTIONS = ((0, 1), (0, -1), (1, 0), (-1, 0))
+DIRECTION_NAMES = ("UP", "DOWN", "RIGHT", "LEFT")
+OPPOSITE = (1, 0, 3, 2)
+
+# Marker values of the distance and direction fields
+UNREACHABLE = -1
+NO_DIRECTION = -1
+
+
+def occupancy_grid(map_data):
+    """
+    The occupancy_grid function builds a boolean grid of the warehouse from a MapData object.
+    A cell is True if a shelf stands on it, the worker can not walk through it.
+
+    :param map_data: The MapData object (map size and shelves)
+    :return: A (map_row, map_col) boolean numpy array, True for blocked cells
+    """
+
+    blocked = np.zeros((map_data.map_row, map_data.map_col), dtype=bool)
+    for shelf in map_data.shelves:
+        x, y = shelf.pos
+        if 0 <= x < map_data.map_row and 0 <= y < map_data.map_col:
+            blocked[x, y] = True
+    return blocked
+
+
+def _shift(field, dx, dy, fill):
+    """Returns a copy of the field moved by (dx, dy), the uncovered cells are set to fill."""
+
+    rows, cols = field.shape
+    shifted = np.full_like(field, fill)
+    shifted[max(dx, 0):rows + min(dx, 0), max(dy, 0):cols + min(dy, 0)] = \
+        field[max(-dx, 0):rows + min(-dx, 0), max(-dy, 0):cols + min(-dy, 0)]
+    return shifted
+
+
+def distance_transform(blocked, source):
+    """
+    The distance_transform function runs a BFS wavefront from the source cell to every reachable cell.
+    In each step, the whole frontier is moved in the four directions with array shifts,
+    the free cells it reaches for the first time form the next frontier.
+    The source itself may be a shelf (e.g. the target item), the wave starts from it anyway.
+
+    When the wave stops, every shelf cell gets the distance of its nearest reachable free neighbour plus one,
+    which is the step into the shelf that Map.get_path() also counts for the target.
+
+    :param blocked: A boolean occupancy grid, True for blocked cells (see occupancy_grid)
+    :param source: The (x, y) position the wave starts from
+    :return: The int32 distance field and the int8 direction field;
+             direction[x, y] is the index in DIRECTIONS of the move that goes one step closer to the source.
+    """
+
+    rows, cols = blocked.shape
+    sx, sy = source
+    dist = np.full((rows, cols), UNREACHABLE, dtype=np.int32)
+    direction = np.full((rows, cols), NO_DIRECTION, dtype=np.int8)
+    if not (0 <= sx < rows and 0 <= sy < cols):
+        return dist, direction
+
+    free = ~blocked
+    unvisited = free.copy()
+    frontier = np.zeros((rows, cols), dtype=bool)
+    frontier[sx, sy] = True
+    unvisited[sx, sy] = False
+    dist[sx, sy] = 0
+
+    step = 0
+    while frontier.any():
+        step += 1
+        reached = np.zeros((rows, cols), dtype=bool)
+        for code, (dx, dy) in enumerate(DIRECTIONS):
+            # Cells entered by moving the frontier in this direction, first writer wins
+            new = _shift(frontier, dx, dy, False) & unvisited & ~reached
+            direction[new] = OPPOSITE[code]
+            reached |= new
+        dist[reached] = step
+        unvisited &= ~reached
+        frontier = reached
+
+    # Give every shelf the cost of stepping into it from its nearest free neighbour
+    walk = np.where(free, dist, UNREACHABLE)
+    shelves = blocked.copy()
+    shelves[sx, sy] = False
+    for code, (dx, dy) in enumerate(DIRECTIONS):
+        neighbour = _shift(walk, -dx, -dy, UNREACHABLE)
+        better = shelves & (neighbour >= 0) & ((dist < 0) | (neighbour + 1 < dist))
+        dist[better] = neighbour[better] + 1
+        direction[better] = code
+
+    return dist, direction
+
+
+def pairwise_distances(blocked, cells, cells_at_once=1 << 22, deadline=None):
+    """
+    The pairwise_distances function computes the BFS distances between distinct free cells.
+    The waves of many sources are run at once: each cell of the frontier holds a bit per source
+    (64 sources per uint64 word), so a step of the wave moves the frontiers of all of them
+    with a few array operations, and the steps a cell is first reached at are read from the new bits.
+
+    :param blocked: A boolean occupancy grid, True for blocked cells
+    :param cells: The (x, y) positions of the cells
+    :param cells_at_once: The largest number of grid cells times words of a stack, bounds the memory
+    :param deadline: The perf_counter() time the computation is given up at, checked at each step of the wave
+    :return: A (len(cells), len(cells)) int32 array, UNREACHABLE where a cell can not be reached,
+             or None if the deadline passed
+    """
+
+    rows, cols = blocked.shape
+    xs = np.array([x for x, _ in cells], dtype=np.intp)
+    ys = np.array([y for _, y in cells], dtype=np.intp)
+    count = len(cells)
+    matrix = np.full((count, count), UNREACHABLE, dtype=np.int32)
+    free = np.where(blocked, np.uint64(0), ~np.uint64(0))
+    sources_at_once = 64 * max(1, cells_at_once // blocked.size)
+    for first in range(0, count, sources_at_once):
+        sources = np.arange(first, min(first + sources_at_once, count))
+        layers = sources - first
+        frontier = np.zeros(((len(sources) + 63) // 64, rows, cols), dtype=np.uint64)
+        np.bitwise_or.at(frontier, (layers // 64, xs[sources], ys[sources]),
+                         np.left_shift(np.uint64(1), (layers % 64).astype(np.uint64)))
+        unvisited = free & ~frontier
+        reached = np.empty_like(frontier)
+        matrix[sources, sources] = 0
+
+        step = 0
+        while True:
+            if deadline is not None and perf_counter() > deadline:
+                return None
+            step += 1
+            reached[:] = 0
+            np.bitwise_or(reached[:, 1:, :], frontier[:, :-1, :], out=reached[:, 1:, :])
+            np.bitwise_or(reached[:, :-1, :], frontier[:, 1:, :], out=reached[:, :-1, :])
+            np.bitwise_or(reached[:, :, 1:], frontier[:, :, :-1], out=reached[:, :, 1:])
+            np.bitwise_or(reached[:, :, :-1], frontier[:, :, 1:], out=reached[:, :, :-1])
+            reached &= unvisited
+            if not reached.any():
+                break
+            unvisited ^= reached
+            # The words of the cells reached at this step, unpacked into (word, cell, bit) triples
+            new = reached[:, xs, ys]
+            word, cell = np.nonzero(new)
+            if len(word):
+                # The words are read as little-endian bytes, so bit k of a word is column k on any machine
+                words = new[word, cell].astype("<u8", copy=False)
+                bits = np.unpackbits(words.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+                entry, bit = np.nonzero(bits)
+                matrix[first + word[entry] * 64 + bit, cell[entry]] = step
+            frontier, reached = reached, frontier
+    return matrix
+
+
+def route(dist, direction, start):
+    """
+    The route function follows the direction field from the start to the source of the wave.
+
+    :param dist: The distance field of distance_transform
+    :param direction: The direction field of distance_transform
+    :param start: The (x, y) position to start from
+    :return: A list of (x, y) positions from the start to the source, empty if the source can not be reached
+    """
+
+    x, y = start
+    if dist[x, y] < 0:
+        return []
+
+    path = [(x, y)]
+    code = direction[x, y]
+    while code != NO_DIRECTION:
+        dx, dy = DIRECTIONS[code]
+        x += dx
+        y += dy
+        path.append((x, y))
+        code = direction[x, y]
+    return path
+
+
+def distance_field(map_data, source=None):
+    """
+    Standalone entry point, the distance and direction fields from a position (the worker by default).
+
+    :param map_data: The MapData object
+    :param source: The (x, y) position the wave starts from, default to the worker's start position
+    :return: The int32 distance field and the int8 direction field
+    """
+
+    if source is None:
+        source = map_data.worker.pos
+    return distance_transform(occupancy_grid(map_data), source)
+
+
+def heuristic_table(map_data):
+    """
+    The heuristic_table function builds an exact heuristic table for A*, the wave is rooted at the target item.
+    The value of each cell is the real number of steps from the cell to the target.
+
+    :param map_data: The MapData object
+    :return: The int32 distance field rooted at the target
+    """
+
+    dist, _ = distance_transform(occupancy_grid(map_data), map_data.target.pos)
+    return dist